@@ -0,0 +1 @@
+# このディレクトリを Python パッケージとして扱うためのファイル
@@ -0,0 +1,227 @@
+"""
+実際のエンドポイントに対する負荷試験。指定した並列数でリクエストを送り、
+シナリオごとのレイテンシ (p50/p95/p99) とスループットをJSONで出力します。
+
+手順 (リポジトリのルートで):
+    docker compose -f docker-compose.test.yml --profile bench up -d bench-db
+    (cd backend && python -m benchmarks.bench_endpoints seed --parts 100000)
+    docker compose -f docker-compose.test.yml --profile bench up -d --build bench-backend
+    (cd backend && python -m benchmarks.bench_endpoints run --concurrency 16 --json load.json)
+
+前回の結果と比較し、悪化していれば終了コード1で終了します (デプロイ前のチェック用):
+    python -m benchmarks.bench_endpoints run --baseline load.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import httpx
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks import common  # noqa: E402
+
+DEFAULT_BASE_URL = os.getenv("BENCH_BASE_URL", "http://127.0.0.1:8001")
+
+
+def _parts_page(rng: random.Random, parts: int) -> dict:
+    return {"method": "GET", "url": "/parts", "params": {"limit": 100}}
+
+
+def _parts_by_category(rng: random.Random, parts: int) -> dict:
+    params = {"category_id": rng.randint(1, len(common.CATEGORIES)), "limit": 100}
+    return {"method": "GET", "url": "/parts", "params": params}
+
+
+def _parts_search(rng: random.Random, parts: int) -> dict:
+    name = rng.choice(common.PART_NAMES).split()[0]
+    return {"method": "GET", "url": "/parts", "params": {"name": name, "search": "fulltext", "limit": 100}}
+
+
+def _inventory_batch(rng: random.Random, parts: int) -> dict:
+    ids = rng.sample(range(1, parts + 1), min(100, parts))
+    return {"method": "PUT", "url": "/inventory/batch", "json": [{"id": i, "quantity": rng.randint(0, 500)} for i in ids]}
+
+
+def _create_part(rng: random.Random, parts: int) -> dict:
+    data = {
+        "title": common.synthetic_part_name(rng, rng.randint(parts, parts * 10)),
+        "category_id": rng.randint(1, len(common.CATEGORIES)),
+        "quantity": rng.randint(0, 500),
+    }
+    return {"method": "POST", "url": "/parts", "data": data}
+
+
+def _upload_image(rng: random.Random, parts: int) -> dict:
+    # 毎回異なる内容の画像にして、同一内容の重複排除で書き込みが省略されないようにする
+    color = tuple(rng.randint(0, 255) for _ in range(3))
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), color).save(buffer, format="JPEG")
+    files = {"file": ("bench.jpg", buffer.getvalue(), "image/jpeg")}
+    return {"method": "POST", "url": f"/parts/{rng.randint(1, parts)}/image", "files": files}
+
+
+# シナリオ名と、リクエスト (httpx.AsyncClient.request の引数) を作る関数
+SCENARIOS: Dict[str, Callable[[random.Random, int], dict]] = {
+    "parts_page": _parts_page,
+    "parts_by_category": _parts_by_category,
+    "parts_search": _parts_search,
+    "inventory_batch": _inventory_batch,
+    "create_part": _create_part,
+    "upload_image": _upload_image,
+}
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, requests: int, concurrency: int,
+                       parts: int, warmup: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    build = SCENARIOS[name]
+    for _ in range(warmup):
+        await client.request(**build(rng, parts))
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            request = build(rng, parts)
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "status_counts": dict(statuses),
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_ms": common.percentile(latencies, 50),
+        "p95_ms": common.percentile(latencies, 95),
+        "p99_ms": common.percentile(latencies, 99),
+    }
+
+
+async def run_all(args) -> List[dict]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        results = []
+        for index, name in enumerate(args.scenarios):
+            result = await run_scenario(
+                client, name, args.requests, args.concurrency, args.parts, args.warmup, args.seed + index
+            )
+            results.append(result)
+            print(
+                f"{name:<18} rps={result['throughput_rps']:>8.1f} p50={result['p50_ms']:>7.1f}ms "
+                f"p95={result['p95_ms']:>7.1f}ms p99={result['p99_ms']:>7.1f}ms errors={result['errors']}"
+            )
+        return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=common.REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: List[dict], baseline: dict, max_regression: float) -> List[str]:
+    """基準の結果と比べて、p95の悪化またはスループットの低下がmax_regressionを超えたシナリオを返します。"""
+    previous = {result["scenario"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = previous.get(result["scenario"])
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{result['scenario']}: p95 {base['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - max_regression):
+            regressions.append(
+                f"{result['scenario']}: throughput {base['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} rps"
+            )
+    return regressions
+
+
+def seed(args):
+    common.recreate_database()
+    conn = common.connect()
+    common.seed_parts(conn, args.parts)
+    conn.close()
+    print(f"Seeded {args.parts} parts into {common.BENCH_DB_NAME}.")
+
+
+def run(args):
+    results = asyncio.run(run_all(args))
+    report = {
+        "meta": {
+            "base_url": args.base_url,
+            "parts": args.parts,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+        },
+        "results": results,
+    }
+    if args.json:
+        common.write_results(args.json, report)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="ベンチマーク用データベースを作り直し、合成データを投入する")
+    seed_parser.add_argument("--parts", type=int, default=100000)
+    seed_parser.set_defaults(func=seed)
+
+    run_parser = subparsers.add_parser("run", help="エンドポイントに負荷をかけて計測する")
+    run_parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    run_parser.add_argument("--parts", type=int, default=100000, help="seedで投入した部品数 (IDの範囲)")
+    run_parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    run_parser.add_argument("--requests", type=int, default=1000, help="シナリオごとのリクエスト数")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--warmup", type=int, default=20, help="計測前に送るリクエスト数")
+    run_parser.add_argument("--timeout", type=float, default=30.0)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--json", help="計測結果をJSONで書き出すパス")
+    run_parser.add_argument("--baseline", help="比較する前回の結果 (JSON)")
+    run_parser.add_argument("--max-regression", type=float, default=0.2, help="許容する悪化の割合")
+    run_parser.set_defaults(func=run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+PUT /inventory/batch のベンチマーク: 1件ずつUPDATEする従来の方式と、CASE式による一括更新の比較。
+
+実行例 (backend ディレクトリで):
+    python -m benchmarks.bench_inventory_batch --items 100 1000 10000 --json inventory_batch.json
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import schemas  # noqa: E402
+from benchmarks import common  # noqa: E402
+from crud import inventory as crud_inventory  # noqa: E402
+
+
+def legacy_update_batch_items(db, items):
+    """変更前の実装: 在庫1件ごとにUPDATEを発行する"""
+    query = "UPDATE Inventory SET quantity = %s WHERE id = %s"
+    cursor = db.cursor()
+    try:
+        db.start_transaction()
+        for item in items:
+            if item.quantity < 0:
+                raise ValueError(f"Quantity for item {item.id} cannot be negative")
+            cursor.execute(query, (item.quantity, item.id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def run(item_counts, repeat):
+    common.recreate_database()
+    conn = common.connect()
+    common.seed_parts(conn, max(item_counts))
+    rng = random.Random(0)
+    results = []
+    for count in item_counts:
+        for label, func in (("loop", legacy_update_batch_items), ("bulk", crud_inventory.update_batch_items)):
+            def update():
+                items = [
+                    schemas.BatchInventoryUpdateItem(id=inventory_id, quantity=rng.randint(0, 500))
+                    for inventory_id in rng.sample(range(1, max(item_counts) + 1), count)
+                ]
+                func(conn, items)
+
+            start = time.perf_counter()
+            stats = common.measure(update, repeat)
+            elapsed = time.perf_counter() - start
+            throughput = count * repeat / elapsed
+            results.append({"items": count, "method": label, "items_per_sec": throughput, **stats})
+            print(f"{count:>6} items {label:<5} p50={stats['p50_ms']:.1f}ms {throughput:,.0f} items/s")
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="計測結果をJSONで書き出すパス")
+    args = parser.parse_args()
+
+    results = run(args.items, args.repeat)
+    if args.json:
+        common.write_results(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+部品名検索のベンチマーク: LIKE '%name%' と ngram全文インデックスの比較。
+
+部品数を段階的に増やしながら、crud.parts.get_all を各検索方式で実行してレイテンシを計測します。
+
+実行例 (backend ディレクトリで):
+    python -m benchmarks.bench_name_search --sizes 10000 100000 1000000 --json name_search.json
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks import common  # noqa: E402
+from crud import parts as crud_parts  # noqa: E402
+
+# SearchFormから送られる典型的な検索語 (1文字の入力途中から語全体まで)
+QUERIES = ["L", "LED", "赤", "赤色", "ボルト M6", "マスキングテープ"]
+
+
+def run(sizes, repeat):
+    common.recreate_database()
+    conn = common.connect()
+    results = []
+    for size in sorted(sizes):
+        common.seed_parts(conn, size)
+        for query in QUERIES:
+            for search in (crud_parts.SEARCH_LIKE, crud_parts.SEARCH_FULLTEXT):
+                stats = common.measure(
+                    lambda: crud_parts.get_all(conn, name=query, search=search), repeat
+                )
+                rows = len(crud_parts.get_all(conn, name=query, search=search))
+                results.append({"parts": size, "query": query, "search": search, "rows": rows, **stats})
+                print(
+                    f"{size:>9} {query:<12} {search:<9} rows={rows:<8} "
+                    f"p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms"
+                )
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="計測結果をJSONで書き出すパス")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    if args.json:
+        common.write_results(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
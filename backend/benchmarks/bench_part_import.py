@@ -0,0 +1,72 @@
+"""
+部品の一括登録のベンチマーク: POST /parts と同じ1件ずつの登録 (crud.parts.create) と、
+CSVの一括登録 (part_import.import_parts) のスループットを比較します。
+
+実行例 (backend ディレクトリで):
+    python -m benchmarks.bench_part_import --rows 1000 10000 50000 --json part_import.json
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks import common  # noqa: E402
+import part_import  # noqa: E402
+from crud import parts as crud_parts  # noqa: E402
+
+
+def make_csv(rows: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    lines = ["title,category,quantity"]
+    for n in range(rows):
+        lines.append(f"{common.synthetic_part_name(rng, n)},{rng.choice(common.CATEGORIES)},{rng.randint(0, 500)}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def run(row_counts, repeat_single_max):
+    common.recreate_database()
+    conn = common.connect()
+    results = []
+    for rows in row_counts:
+        rng = random.Random(rows)
+        # 1件ずつの登録は時間がかかるため、件数を抑えて計測しスループットを求める
+        single_rows = min(rows, repeat_single_max)
+        start = time.perf_counter()
+        for n in range(single_rows):
+            crud_parts.create(conn, common.synthetic_part_name(rng, n), rng.randint(1, len(common.CATEGORIES)), 1)
+        single_elapsed = time.perf_counter() - start
+        results.append({"rows": single_rows, "method": "create", "rows_per_sec": single_rows / single_elapsed})
+
+        data = make_csv(rows, rows)
+        start = time.perf_counter()
+        result = part_import.import_parts(conn, io.BytesIO(data), part_import.FORMAT_CSV)
+        bulk_elapsed = time.perf_counter() - start
+        results.append({
+            "rows": rows, "method": "import", "rows_per_sec": result.imported / bulk_elapsed, "failed": result.failed,
+        })
+        print(
+            f"{rows:>7} rows  create={single_rows / single_elapsed:,.0f} rows/s  "
+            f"import={result.imported / bulk_elapsed:,.0f} rows/s"
+        )
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--single-max", type=int, default=2000, help="1件ずつの登録で計測する最大件数")
+    parser.add_argument("--json", help="計測結果をJSONで書き出すパス")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.single_max)
+    if args.json:
+        common.write_results(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+ベンチマーク用の共通処理。
+
+ベンチマークは使い捨てのMySQLデータベースに対して実行します。
+接続先は以下の環境変数で指定し、BENCH_MYSQL_DATABASE のデータベースは毎回作り直されます。
+
+    BENCH_MYSQL_HOST (既定: 127.0.0.1)
+    BENCH_MYSQL_PORT (既定: 3307)
+    BENCH_MYSQL_USER (既定: root)
+    BENCH_MYSQL_PASSWORD (既定: password)
+    BENCH_MYSQL_DATABASE (既定: mast_bench)
+"""
+import json
+import os
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import mysql.connector
+
+# マイクロベンチマークはクエリそのものを計測するため、読み取りキャッシュを無効にする
+# (crud をインポートする前に common をインポートすること)
+os.environ.setdefault("CACHE_BACKEND", "none")
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+INIT_SQL_PATH = os.path.join(REPO_ROOT, "database", "01_initdb.sql")
+
+BENCH_DB_CONFIG = {
+    "host": os.getenv("BENCH_MYSQL_HOST", "127.0.0.1"),
+    "port": int(os.getenv("BENCH_MYSQL_PORT", "3307")),
+    "user": os.getenv("BENCH_MYSQL_USER", "root"),
+    "password": os.getenv("BENCH_MYSQL_PASSWORD", "password"),
+}
+BENCH_DB_NAME = os.getenv("BENCH_MYSQL_DATABASE", "mast_bench")
+
+# 02_ダミーデータ生成.sql のカテゴリーと部品名をもとに合成データを作る
+CATEGORIES = ["電子部品", "機械部品", "工具", "材料", "消耗品", "計測器", "安全用品", "包装材", "化学薬品", "文具"]
+PART_NAMES = [
+    "LED 5mm", "抵抗 1kΩ", "コンデンサ 100μF", "マイクロコントローラー ESP32",
+    "ボルト M6×20", "ナット M6", "ワッシャー M6", "ベアリング 608ZZ", "ギア 20歯",
+    "ドライバー プラス", "スパナ 10mm", "ニッパー", "はんだごて 40W",
+    "アルミ板 1mm", "プラスチック板 2mm", "はんだ線 1.0mm", "銅線 0.5mm", "両面テープ",
+    "コピー用紙 A4", "マーカーペン", "乾電池 AA", "ウエス", "マスキングテープ",
+]
+VARIANTS = ["赤色", "青色", "緑色", "黒", "白", "大", "小", "Type-A", "Type-B", "ロング", "ショート"]
+
+SEED_BATCH_SIZE = 5000
+
+
+def connect(database: str = BENCH_DB_NAME):
+    return mysql.connector.connect(database=database, **BENCH_DB_CONFIG)
+
+
+def _split_sql(sql: str) -> List[str]:
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
+
+def recreate_database():
+    """ベンチマーク用データベースを作り直し、01_initdb.sql のスキーマを適用します。"""
+    conn = mysql.connector.connect(**BENCH_DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{BENCH_DB_NAME}`")
+    cursor.execute(f"CREATE DATABASE `{BENCH_DB_NAME}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
+    cursor.execute(f"USE `{BENCH_DB_NAME}`")
+    with open(INIT_SQL_PATH, encoding="utf-8") as f:
+        for statement in _split_sql(f.read()):
+            cursor.execute(statement)
+    cursor.executemany("INSERT INTO Category (name) VALUES (%s)", [(name,) for name in CATEGORIES])
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def synthetic_part_name(rng: random.Random, n: int) -> str:
+    return f"{rng.choice(PART_NAMES)} {rng.choice(VARIANTS)} {n}"
+
+
+def count_parts(conn) -> int:
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM Parts")
+    (count,) = cursor.fetchone()
+    cursor.close()
+    return count
+
+
+def seed_parts(conn, target: int, seed: int = 0):
+    """Partsが target 件になるまで、合成した部品と在庫をまとめて投入します。"""
+    rng = random.Random(seed + target)
+    current = count_parts(conn)
+    cursor = conn.cursor()
+    seeded = False
+    while current < target:
+        size = min(SEED_BATCH_SIZE, target - current)
+        rows = [
+            (rng.randint(1, len(CATEGORIES)), synthetic_part_name(rng, current + i))
+            for i in range(size)
+        ]
+        cursor.executemany("INSERT INTO Parts (c_id, p_name) VALUES (%s, %s)", rows)
+        # 複数行INSERTでは先頭の採番IDが返るため、それ以降の部品に在庫行を作る
+        cursor.execute(
+            "INSERT INTO Inventory (parts_id, quantity) "
+            "SELECT id, FLOOR(RAND(%s) * 500) FROM Parts WHERE id >= %s",
+            (seed, cursor.lastrowid),
+        )
+        conn.commit()
+        current += size
+        seeded = True
+    cursor.close()
+    if seeded:
+        # 直接投入した行はカテゴリー別の集計に反映されないため、まとめて作り直す
+        from crud import summary
+        summary.rebuild(conn)
+
+
+def measure(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """func を repeat 回実行し、レイテンシ (ミリ秒) の統計を返します。"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+    }
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def write_results(path: str, results):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# キャッシュの設定
+# CACHE_BACKEND: memory (プロセス内, 既定) / redis (複数ワーカーで共有) / none (無効)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+# プロセス内キャッシュが保持する行数の合計の上限 (エントリ数だけでは全件の一覧を多数保持してしまうため)
+CACHE_MAX_ROWS = int(os.getenv("CACHE_MAX_ROWS", "100000"))
+# 1つのエントリに保持する行数の上限。これより多い結果 (ページ指定のない全件の一覧など) はキャッシュしない
+CACHE_MAX_ENTRY_ROWS = int(os.getenv("CACHE_MAX_ENTRY_ROWS", "1000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# 名前空間 (対象テーブル) ごとのキャッシュ
+NAMESPACE_PARTS = "parts"
+NAMESPACE_CATEGORIES = "categories"
+
+
+def _row_count(value: Any) -> int:
+    """キャッシュする値のおおよその大きさ (リストの場合は行数、それ以外は1) を返します。"""
+    return len(value) if isinstance(value, list) else 1
+
+
+class MemoryBackend:
+    """TTLとLRUによる追い出しを行う、プロセス内のキャッシュ (エントリ数と行数の合計で上限を設ける)"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_rows: int = CACHE_MAX_ROWS):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._rows = 0
+
+    def _remove(self, key: str):
+        value, _ = self._entries.pop(key)
+        self._rows -= _row_count(value)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._rows += _row_count(value)
+            while len(self._entries) > self.max_entries or (self._rows > self.max_rows and len(self._entries) > 1):
+                self._remove(next(iter(self._entries)))
+
+    def get_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            # 世代が変わったエントリは参照されなくなるため、ここでまとめて捨てる
+            prefix = key + ":"
+            for stale in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(stale)
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+            self._rows = 0
+
+
+class RedisBackend:
+    """
+    Redis互換のクライアントを使う共有キャッシュ。
+    世代カウンターをRedis上に持つため、どのワーカーで無効化しても全ワーカーに反映されます。
+    """
+
+    def __init__(self, client, prefix: str = "mast:cache"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(f"{self.prefix}:{key}")
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.client.set(f"{self.prefix}:{key}", json.dumps(value, ensure_ascii=False), ex=max(1, int(ttl)))
+
+    def get_counter(self, key: str) -> int:
+        raw = self.client.get(f"{self.prefix}:{key}")
+        return int(raw) if raw is not None else 0
+
+    def incr(self, key: str) -> int:
+        # 古い世代のエントリはTTLで自然に消える
+        return int(self.client.incr(f"{self.prefix}:{key}"))
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}:*"):
+            self.client.delete(key)
+
+
+class Cache:
+    """
+    名前空間ごとに世代番号を持つ読み取りキャッシュ。
+    書き込み処理がinvalidate()で世代を進めると、それ以前に作られたエントリは参照されなくなります。
+    """
+
+    def __init__(self, backend=None, ttl: float = CACHE_TTL_SECONDS, max_entry_rows: int = CACHE_MAX_ENTRY_ROWS):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entry_rows = max_entry_rows
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+
+    def _count(self, counters: Dict[str, int], namespace: str):
+        with self._lock:
+            counters[namespace] = counters.get(namespace, 0) + 1
+
+    def get_or_load(self, namespace: str, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None):
+        if self.backend is None:
+            return loader()
+        # 読み込み前の世代でキーを作るため、読み込み中に無効化された結果は次回以降参照されない
+        generation = self.backend.get_counter(f"gen:{namespace}")
+        cache_key = f"gen:{namespace}:{generation}:{json.dumps(key, ensure_ascii=False, default=str)}"
+        value = self.backend.get(cache_key)
+        if value is not None:
+            self._count(self._hits, namespace)
+            return value
+        self._count(self._misses, namespace)
+        value = loader()
+        if _row_count(value) <= self.max_entry_rows:
+            self.backend.set(cache_key, value, self.ttl if ttl is None else ttl)
+        return value
+
+    def invalidate(self, *namespaces: str):
+        if self.backend is None:
+            return
+        for namespace in namespaces:
+            self.backend.incr(f"gen:{namespace}")
+
+    def clear(self):
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces = sorted(set(self._hits) | set(self._misses))
+            return {
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+                "ttl_seconds": self.ttl,
+                "namespaces": {
+                    namespace: {"hits": self._hits.get(namespace, 0), "misses": self._misses.get(namespace, 0)}
+                    for namespace in namespaces
+                },
+            }
+
+
+def _create_backend():
+    if CACHE_BACKEND == "none":
+        return None
+    if CACHE_BACKEND == "redis":
+        # redisパッケージはCACHE_BACKEND=redisの場合のみ必要
+        import redis
+        return RedisBackend(redis.Redis.from_url(REDIS_URL))
+    return MemoryBackend()
+
+
+cache = Cache(_create_backend())
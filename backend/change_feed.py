@@ -0,0 +1,199 @@
+"""
+在庫の変更をServer-Sent Eventsで配信するための共有フィード。
+
+購読者がいる間だけ1つのタスクがInventory_ChangesをCHANGE_FEED_POLL_SECONDSごとに問い合わせ、
+新しい変更をすべての購読者に配信します。開いているタブの数に関わらず、DBへの問い合わせは一定です。
+直近の変更はCHANGE_FEED_BUFFER_SIZE件まで保持し、Last-Event-IDによる再接続時の再送に使います。
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+from anyio import to_thread
+from crud.changes import CHANGE_PAGE_SIZE
+
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "1"))
+CHANGE_FEED_HEARTBEAT_SECONDS = float(os.getenv("CHANGE_FEED_HEARTBEAT_SECONDS", "15"))
+CHANGE_FEED_BUFFER_SIZE = int(os.getenv("CHANGE_FEED_BUFFER_SIZE", "10000"))
+# 購読者ごとの未送信イベントの上限 (超えた購読者には reset を送る)
+SUBSCRIBER_QUEUE_SIZE = 1000
+# 再接続時にDBから読み直す変更の上限 (超える場合は reset を送る)
+CATCHUP_MAX_EVENTS = 10000
+# コミットが遅れて後から見えるようになるIDを待つ秒数と、待つIDの最大数
+# (AUTO_INCREMENTの値が大きく飛んだ場合に、欠番をすべて問い合わせないようにする)
+GAP_GRACE_SECONDS = 5.0
+MAX_TRACKED_GAPS = 1000
+
+EVENT_READY = "ready"
+EVENT_CHANGE = "inventory"
+EVENT_RESET = "reset"
+EVENT_HEARTBEAT = "heartbeat"
+
+logger = logging.getLogger("mast.change_feed")
+
+# (イベント名, イベントID, 内容)
+FeedEvent = Tuple[str, Optional[int], Optional[dict]]
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+
+class ChangeFeed:
+    """
+    fetch_since(after_id) は after_id より後の変更を古い順に、fetch_ids(ids) は指定したIDの変更を、
+    fetch_bounds() は (最も古い変更のID, 最新の変更のID) を返す同期関数です (スレッドプールで実行します)。
+    """
+
+    def __init__(
+        self,
+        fetch_since: Callable[[int], List[dict]],
+        fetch_ids: Callable[[List[int]], List[dict]],
+        fetch_bounds: Callable[[], Tuple[Optional[int], int]],
+        poll_seconds: float = CHANGE_FEED_POLL_SECONDS,
+        heartbeat_seconds: float = CHANGE_FEED_HEARTBEAT_SECONDS,
+        buffer_size: int = CHANGE_FEED_BUFFER_SIZE,
+        page_size: int = CHANGE_PAGE_SIZE,
+    ):
+        self._fetch_since = fetch_since
+        self._fetch_ids = fetch_ids
+        self._fetch_bounds = fetch_bounds
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.page_size = page_size
+        self._buffer: Deque[dict] = deque(maxlen=buffer_size)
+        # このIDより後の変更はすべてバッファにある
+        self._buffer_floor = 0
+        self._latest_id = 0
+        # 最新のIDより小さいが、まだ見えていないID (未コミットのトランザクションかロールバック) と期限
+        self._gaps: Dict[int, float] = {}
+        self._subscribers: Set[_Subscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Future] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def _start(self):
+        if self._task is None or self._task.done():
+            loop = asyncio.get_running_loop()
+            self._ready = loop.create_future()
+            self._task = loop.create_task(self._run())
+        await asyncio.shield(self._ready)
+
+    async def _run(self):
+        try:
+            _, latest_id = await to_thread.run_sync(self._fetch_bounds)
+        except Exception as e:
+            self._ready.set_exception(e)
+            return
+        # 停止していた間の変更はバッファにないため、再開時の位置から保持し直す
+        self._buffer.clear()
+        self._gaps.clear()
+        self._buffer_floor = self._latest_id = latest_id
+        self._ready.set_result(None)
+
+        while self._subscribers:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self._poll()
+            except Exception as e:
+                logger.warning("Failed to poll inventory changes: %s", e)
+
+    async def _poll(self):
+        while True:
+            rows = await to_thread.run_sync(self._fetch_since, self._latest_id)
+            if self._gaps:
+                now = time.monotonic()
+                self._gaps = {change_id: expires for change_id, expires in self._gaps.items() if expires > now}
+                if self._gaps:
+                    late = await to_thread.run_sync(self._fetch_ids, sorted(self._gaps))
+                    for row in late:
+                        self._gaps.pop(row["id"], None)
+                        self._publish(row)
+            for row in rows:
+                if row["id"] - self._latest_id - 1 <= MAX_TRACKED_GAPS - len(self._gaps):
+                    for change_id in range(self._latest_id + 1, row["id"]):
+                        self._gaps[change_id] = time.monotonic() + GAP_GRACE_SECONDS
+                self._latest_id = row["id"]
+                self._publish(row)
+            # 1ページ分を読み切った場合は、待たずに続きを読む
+            if len(rows) < self.page_size:
+                return
+
+    def _publish(self, row: dict):
+        if len(self._buffer) == self._buffer.maxlen:
+            self._buffer_floor = self._buffer[0]["id"]
+        self._buffer.append(row)
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(row)
+            except asyncio.QueueFull:
+                subscriber.overflowed = True
+
+    async def _backlog(self, last_event_id: int) -> Optional[List[dict]]:
+        """last_event_idより後の変更を返します。保持期間を過ぎて再送できない場合はNoneを返します。"""
+        if last_event_id >= self._latest_id:
+            return []
+        if last_event_id >= self._buffer_floor:
+            return [row for row in self._buffer if row["id"] > last_event_id]
+        oldest_id, _ = await to_thread.run_sync(self._fetch_bounds)
+        if oldest_id is None or last_event_id < oldest_id - 1:
+            return None
+        rows: List[dict] = []
+        after_id = last_event_id
+        while after_id < self._latest_id:
+            page = await to_thread.run_sync(self._fetch_since, after_id)
+            if not page:
+                break
+            rows.extend(page)
+            after_id = page[-1]["id"]
+            if len(rows) > CATCHUP_MAX_EVENTS:
+                return None
+        return rows
+
+    async def subscribe(self, last_event_id: Optional[int] = None) -> AsyncIterator[FeedEvent]:
+        """
+        変更を (イベント名, イベントID, 内容) として返し続けます。
+        last_event_idを指定した場合は、それより後の変更から返します。
+        再送できない場合は reset を返すため、クライアントは一覧を取得し直してください。
+        """
+        subscriber = _Subscriber()
+        self._subscribers.add(subscriber)
+        try:
+            await self._start()
+            # 再送中に配信された変更はキューにも入るため、再送したIDは後で読み飛ばす
+            resent: Set[int] = set()
+            if last_event_id is None:
+                yield EVENT_READY, self._latest_id, None
+            else:
+                backlog = await self._backlog(last_event_id)
+                if backlog is None:
+                    yield EVENT_RESET, self._latest_id, None
+                else:
+                    for row in backlog:
+                        resent.add(row["id"])
+                        yield EVENT_CHANGE, row["id"], row
+
+            while True:
+                if subscriber.overflowed:
+                    # 送信が追いつかない購読者は、未送信分を捨てて一覧の再取得を促す
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.overflowed = False
+                    yield EVENT_RESET, self._latest_id, None
+                try:
+                    row = await asyncio.wait_for(subscriber.queue.get(), timeout=self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield EVENT_HEARTBEAT, None, None
+                    continue
+                if row["id"] in resent:
+                    continue
+                yield EVENT_CHANGE, row["id"], row
+        finally:
+            self._subscribers.discard(subscriber)
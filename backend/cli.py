@@ -0,0 +1,121 @@
+"""
+運用向けのコマンド。backend ディレクトリで実行します。
+
+    python cli.py gc-images [--dry-run]   参照されていない画像とサムネイルを削除する
+    python cli.py backfill-thumbnails     サムネイルの無い画像のサムネイルを作成する
+    python cli.py import-parts FILE       CSV/JSONLファイルから部品を一括登録する
+    python cli.py export-parts            部品と在庫をCSV/NDJSON/Parquetで書き出す
+    python cli.py prune-changes           保持期間を過ぎた在庫の変更履歴を削除する
+    python cli.py rebuild-summary         カテゴリー別の在庫集計を作り直す
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+import mysql.connector
+import export
+import images
+import part_import
+from crud import changes as crud_changes
+from crud import parts as crud_parts
+from crud import summary as crud_summary
+from database import db_config
+
+def gc_images(args):
+    db = mysql.connector.connect(**db_config)
+    try:
+        removed = images.collect_garbage(crud_parts.iter_image_urls(db), dry_run=args.dry_run)
+    finally:
+        db.close()
+    for path in removed:
+        print(path)
+    action = "Would remove" if args.dry_run else "Removed"
+    print(f"{action} {len(removed)} unreferenced file(s).")
+
+def backfill_thumbnails(args):
+    created = images.backfill_thumbnails()
+    for path in created:
+        print(path)
+    print(f"Created {len(created)} thumbnail(s).")
+
+def import_parts(args):
+    fmt = args.format or part_import.detect_format(args.file)
+    db = mysql.connector.connect(**db_config)
+    try:
+        with open(args.file, "rb") as f:
+            result = part_import.import_parts(db, f, fmt, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+    print(json.dumps(result.to_dict(), ensure_ascii=False, indent=2))
+
+def export_parts(args):
+    db = mysql.connector.connect(**db_config)
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        batches = crud_parts.iter_export_batches(
+            db, category_id=args.category_id, modified_since=args.modified_since, chunk_size=args.chunk_size
+        )
+        for data in export.encode(batches, args.format):
+            output.write(data)
+    finally:
+        if args.output:
+            output.close()
+        db.close()
+
+def prune_changes(args):
+    db = mysql.connector.connect(**db_config)
+    try:
+        removed = crud_changes.prune(db, datetime.now() - timedelta(days=args.days))
+    finally:
+        db.close()
+    print(f"Removed {removed} change(s) older than {args.days} day(s).")
+
+def rebuild_summary(args):
+    db = mysql.connector.connect(**db_config)
+    try:
+        count = crud_summary.rebuild(db)
+    finally:
+        db.close()
+    print(f"Rebuilt stock summary for {count} categor{'y' if count == 1 else 'ies'}.")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    gc_parser = subparsers.add_parser("gc-images", help="参照されていない画像とサムネイルを削除する")
+    gc_parser.add_argument("--dry-run", action="store_true", help="削除せずに対象を表示する")
+    gc_parser.set_defaults(func=gc_images)
+
+    backfill_parser = subparsers.add_parser("backfill-thumbnails", help="サムネイルの無い画像のサムネイルを作成する")
+    backfill_parser.set_defaults(func=backfill_thumbnails)
+
+    import_parser = subparsers.add_parser("import-parts", help="CSV/JSONLファイルから部品を一括登録する")
+    import_parser.add_argument("file", help="登録するファイルのパス")
+    import_parser.add_argument("--format", choices=[part_import.FORMAT_CSV, part_import.FORMAT_JSONL],
+                               help="ファイル形式 (省略時は拡張子から判定)")
+    import_parser.add_argument("--chunk-size", type=int, default=part_import.IMPORT_CHUNK_SIZE,
+                               help="1トランザクションで登録する行数")
+    import_parser.set_defaults(func=import_parts)
+
+    export_parser = subparsers.add_parser("export-parts", help="部品と在庫をCSV/NDJSON/Parquetで書き出す")
+    export_parser.add_argument("--format", choices=list(export.ENCODERS), default=export.FORMAT_CSV)
+    export_parser.add_argument("--output", "-o", help="出力先のパス (省略時は標準出力)")
+    export_parser.add_argument("--category-id", type=int, help="対象とするカテゴリーID")
+    export_parser.add_argument("--modified-since", type=datetime.fromisoformat,
+                               help="この日時以降に更新された部品のみを対象にする (例: 2024-01-01T00:00:00)")
+    export_parser.add_argument("--chunk-size", type=int, default=crud_parts.STREAM_CHUNK_SIZE,
+                               help="一度にDBから読み出す行数 (Parquetの行グループの大きさ)")
+    export_parser.set_defaults(func=export_parts)
+
+    prune_parser = subparsers.add_parser("prune-changes", help="保持期間を過ぎた在庫の変更履歴を削除する")
+    prune_parser.add_argument("--days", type=int, default=7, help="変更履歴を保持する日数")
+    prune_parser.set_defaults(func=prune_changes)
+
+    summary_parser = subparsers.add_parser("rebuild-summary", help="カテゴリー別の在庫集計を作り直す")
+    summary_parser.set_defaults(func=rebuild_summary)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+一覧レスポンスの圧縮 (Accept-Encodingに応じてbrotliまたはgzip)。
+
+brotliはbrotliパッケージがインストールされている場合のみ使用します。
+COMPRESSION_MIN_BYTESより小さいレスポンスは、圧縮の効果が小さいためそのまま返します。
+"""
+import gzip
+import os
+from typing import Dict, Optional
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:  # brotliは任意の依存関係
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+# 品質を上げると圧縮率は上がるがCPU時間が大きく増えるため、動的なレスポンス向けの値にする
+BROTLI_QUALITY = 4
+
+ENCODING_BROTLI = "br"
+ENCODING_GZIP = "gzip"
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Accept-Encodingから使用する圧縮方式を選びます。どちらも受け付けない場合はNoneを返します。"""
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        token, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token.strip().lower())
+    if brotli is not None and ENCODING_BROTLI in accepted:
+        return ENCODING_BROTLI
+    if ENCODING_GZIP in accepted:
+        return ENCODING_GZIP
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == ENCODING_BROTLI:
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def encoded_response(body: bytes, encoding: Optional[str], media_type: str, headers: Dict[str, str]) -> Response:
+    headers = dict(headers)
+    headers["Vary"] = "Accept-Encoding"
+    if encoding is not None and len(body) >= COMPRESSION_MIN_BYTES:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
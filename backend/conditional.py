@@ -0,0 +1,23 @@
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+
+def make_etag(resource: str, version, query: str = "") -> str:
+    """テーブルのバージョンとクエリ文字列から強いETagを作ります。"""
+    digest = hashlib.sha1(f"{resource}:{version}:{query}".encode()).hexdigest()[:16]
+    return f'"{resource}-{version}-{digest}"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match: Optional[str] = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    # キャッシュした内容を使う前に、必ずETagで再検証させる
+    response.headers["Cache-Control"] = "no-cache"
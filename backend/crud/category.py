@@ -1,10 +1,38 @@
 import mysql.connector
-from typing import List
+from typing import Dict, List, Optional
+import database
 import schemas
+from cache import cache, NAMESPACE_CATEGORIES
+from crud import versions
 
-def get_all(db: mysql.connector.MySQLConnection) -> List[schemas.Category]:
+# カテゴリーはほとんど変更されないため、部品一覧より長くキャッシュする
+CATEGORY_CACHE_TTL = 300
+
+def _fetch_all(db: mysql.connector.MySQLConnection) -> List[dict]:
     cursor = db.cursor(dictionary=True)
     cursor.execute("SELECT id, name FROM Category")
     categories = cursor.fetchall()
     cursor.close()
+    return categories
+
+def get_all(db: mysql.connector.MySQLConnection, version: Optional[int] = None) -> List[schemas.Category]:
+    """
+    カテゴリーの一覧を返します。versionには、一覧の前に読んだCategoryのバージョン (versions.get) を指定します。
+    バージョンをキャッシュのキーに含めるため、アプリの外で変更された場合も古い一覧は返しません。
+    """
+    if database.is_replica(db):
+        # レプリカの結果は遅れている可能性があるため、主DBの結果とは分けて短い間だけ保持する
+        categories = cache.get_or_load(
+            NAMESPACE_CATEGORIES, ["replica", "get_all", version], lambda: _fetch_all(db),
+            ttl=database.REPLICA_CACHE_TTL,
+        )
+    else:
+        categories = cache.get_or_load(
+            NAMESPACE_CATEGORIES, ["get_all", version], lambda: _fetch_all(db), ttl=CATEGORY_CACHE_TTL
+        )
     return [schemas.Category(**category) for category in categories]
+
+def get_id_map(db: mysql.connector.MySQLConnection) -> Dict[str, int]:
+    """カテゴリー名からIDへの対応表を返します。"""
+    version = versions.get(db, versions.TABLE_CATEGORY)
+    return {category.name: category.id for category in get_all(db, version)}
@@ -0,0 +1,86 @@
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+import mysql.connector
+
+# 変更の種類 (Inventory_Changes.operation)
+OP_CREATE = "create"
+OP_UPDATE = "update"
+OP_DELETE = "delete"
+
+# 1回の問い合わせで読み出す変更の件数
+CHANGE_PAGE_SIZE = 1000
+
+def record_inventory(cursor, inventory_ids: Sequence[int], operation: str = OP_UPDATE):
+    """
+    書き込み処理のトランザクション内で、指定した在庫の現在の数量を変更履歴に追加します。
+    更新後の値をInventoryから読み直すため、UPDATEの後に呼び出してください。
+    """
+    if not inventory_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(inventory_ids))
+    cursor.execute(
+        "INSERT INTO Inventory_Changes (inventory_id, parts_id, quantity, operation) "
+        f"SELECT id, parts_id, quantity, %s FROM Inventory WHERE id IN ({placeholders})",
+        (operation, *inventory_ids),
+    )
+
+def record_parts(cursor, part_ids: Sequence[int], operation: str):
+    """
+    指定した部品の在庫を変更履歴に追加します。削除の場合は数量をNULLとし、DELETEの前に呼び出してください。
+    """
+    if not part_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(part_ids))
+    quantity = "NULL" if operation == OP_DELETE else "quantity"
+    cursor.execute(
+        "INSERT INTO Inventory_Changes (inventory_id, parts_id, quantity, operation) "
+        f"SELECT id, parts_id, {quantity}, %s FROM Inventory WHERE parts_id IN ({placeholders})",
+        (operation, *part_ids),
+    )
+
+def get_since(db: mysql.connector.MySQLConnection, after_id: int, limit: int = CHANGE_PAGE_SIZE) -> List[dict]:
+    """after_idより後の変更を古い順に返します。"""
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(
+        "SELECT id, inventory_id AS inventoryId, parts_id AS partsId, quantity, operation AS op "
+        "FROM Inventory_Changes WHERE id > %s ORDER BY id LIMIT %s",
+        (after_id, limit),
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+    db.commit()
+    return rows
+
+def get_by_ids(db: mysql.connector.MySQLConnection, change_ids: Sequence[int]) -> List[dict]:
+    """指定したIDの変更を返します (後からコミットされた変更の確認に使用)。"""
+    if not change_ids:
+        return []
+    placeholders = ", ".join(["%s"] * len(change_ids))
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(
+        "SELECT id, inventory_id AS inventoryId, parts_id AS partsId, quantity, operation AS op "
+        f"FROM Inventory_Changes WHERE id IN ({placeholders}) ORDER BY id",
+        tuple(change_ids),
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+    db.commit()
+    return rows
+
+def get_bounds(db: mysql.connector.MySQLConnection) -> Tuple[Optional[int], int]:
+    """保持している最も古い変更のIDと、最新の変更のID (変更がなければ0) を返します。"""
+    cursor = db.cursor()
+    cursor.execute("SELECT MIN(id), MAX(id) FROM Inventory_Changes")
+    oldest_id, latest_id = cursor.fetchone()
+    cursor.close()
+    db.commit()
+    return oldest_id, latest_id or 0
+
+def prune(db: mysql.connector.MySQLConnection, before: datetime) -> int:
+    """指定日時より前の変更履歴を削除し、削除した件数を返します。"""
+    cursor = db.cursor()
+    cursor.execute("DELETE FROM Inventory_Changes WHERE changed_at < %s", (before,))
+    rowcount = cursor.rowcount
+    db.commit()
+    cursor.close()
+    return rowcount
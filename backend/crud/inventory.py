@@ -1,28 +1,331 @@
 import mysql.connector
-from typing import List
+from typing import Dict, List, Optional, Sequence, Tuple
 import schemas
+from cache import cache, NAMESPACE_PARTS
+from crud import changes, low_stock, summary, versions
 
-def update_item(db: mysql.connector.MySQLConnection, inventory_id: int, quantity: int):
-    query = "UPDATE Inventory SET quantity = %s WHERE id = %s"
+# 一括更新で1つのSQL文にまとめる件数
+BATCH_CHUNK_SIZE = 1000
+
+# 取り込みログのイベント (apply_adjustment_events) の処理結果
+EVENT_APPLIED = "applied"
+EVENT_NOT_FOUND = "not_found"
+EVENT_INSUFFICIENT = "insufficient"
+# 再起動前に反映済みだったイベント (ログの再生時に読み飛ばしたもの)
+EVENT_ALREADY_APPLIED = "already_applied"
+
+def _chunks(values: list, size: int):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+class VersionConflict(Exception):
+    """指定されたバージョンが在庫の現在のバージョンと異なる場合に送出します。conflictsは現在の値のリストです。"""
+
+    def __init__(self, conflicts: List[dict]):
+        super().__init__(f"Version conflict for items {[conflict['id'] for conflict in conflicts]}")
+        self.conflicts = conflicts
+
+def update_item(
+    db: mysql.connector.MySQLConnection, inventory_id: int, quantity: int, expected_version: Optional[int] = None
+) -> Optional[int]:
+    """
+    在庫数量を更新し、更新後のバージョン (row_version) を返します。在庫が存在しない場合はNoneを返します。
+    expected_versionを指定した場合はバージョンが一致する場合のみ更新し (楽観的排他制御)、
+    一致しない場合は現在の数量とバージョンを持つVersionConflictを送出します。
+    更新前の数量はLAST_INSERT_ID(expr)で受け取るため、事前に行をロックして読む必要はありません。
+    """
+    # 0 * LAST_INSERT_ID(quantity) は値に影響せず、更新前の数量をlastrowidとして返させる
+    query = "UPDATE Inventory SET quantity = %s + 0 * LAST_INSERT_ID(quantity) WHERE id = %s"
     cursor = db.cursor()
-    cursor.execute(query, (quantity, inventory_id))
-    db.commit()
-    rowcount = cursor.rowcount
-    cursor.close()
-    return rowcount
+    try:
+        params = [quantity, inventory_id]
+        if expected_version is not None:
+            query += " AND row_version = %s"
+            params.append(expected_version)
+        cursor.execute(query, tuple(params))
+        if cursor.rowcount == 1:
+            old_quantity = cursor.lastrowid
+        else:
+            # 更新されなかった場合は、在庫が存在しないのか、バージョンが異なるのか、数量が同じなのかを確認する
+            cursor.execute("SELECT quantity, row_version FROM Inventory WHERE id = %s FOR UPDATE", (inventory_id,))
+            current = cursor.fetchone()
+            if current is None or (expected_version is not None and current[1] != expected_version):
+                db.commit()
+                if current is None:
+                    return None
+                raise VersionConflict([{"id": inventory_id, "quantity": current[0], "version": current[1]}])
+            # 同じ数量への更新もバージョンを進める (UPDATEからロックまでの間に変更された場合に備えて書き直す)
+            old_quantity = current[0]
+            cursor.execute("UPDATE Inventory SET quantity = %s WHERE id = %s", (quantity, inventory_id))
+
+        changes.record_inventory(cursor, [inventory_id])
+        summary.apply_to_inventory(cursor, inventory_id, summary.quantity_delta(old_quantity, quantity))
+        low_stock.evaluate(cursor, [inventory_id])
+        row_version = versions.next_row_version(cursor)
+        versions.stamp(cursor, row_version, versions.TABLE_INVENTORY, [inventory_id])
+        versions.bump(cursor, versions.TABLE_INVENTORY)
+        db.commit()
+        cache.invalidate(NAMESPACE_PARTS)
+        return row_version
+    finally:
+        cursor.close()
 
 def update_batch_items(db: mysql.connector.MySQLConnection, items: List[schemas.BatchInventoryUpdateItem]):
-    query = "UPDATE Inventory SET quantity = %s WHERE id = %s"
+    """
+    複数の在庫数量を1つのトランザクションで更新し、
+    (更新後のバージョン, 存在しなかった在庫IDのリスト, バージョンが一致しなかった在庫の現在の値のリスト) を返します。
+    1件も更新しなかった場合、バージョンはNoneです。
+    BATCH_CHUNK_SIZE件ごとに、存在確認のSELECTとCASE式による1回のUPDATEを発行します。
+    versionを指定した項目は、SELECTで読んだ現在のバージョンと一致する場合のみ更新します。
+    """
+    # 数量はDBに触れる前にすべて検証する
+    for item in items:
+        if item.quantity < 0:
+            raise ValueError(f"Quantity for item {item.id} cannot be negative")
+
+    # 同じIDが複数回指定された場合は後の値を採用する
+    quantities = {item.id: item.quantity for item in items}
+    expected_versions = {item.id: item.version for item in items}
+    not_found = []
+    conflicts = []
+    summary_deltas = []
+    updated = []
+    row_version = None
+    cursor = db.cursor()
+    try:
+        db.start_transaction()
+        for chunk in _chunks(list(quantities), BATCH_CHUNK_SIZE):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                "SELECT i.id, i.quantity, p.c_id, i.row_version FROM Inventory i JOIN Parts p ON p.id = i.parts_id "
+                f"WHERE i.id IN ({placeholders}) FOR UPDATE OF i",
+                tuple(chunk),
+            )
+            found = {row[0]: row[1:] for row in cursor.fetchall()}
+            not_found.extend(inventory_id for inventory_id in chunk if inventory_id not in found)
+
+            # 行ロックを取得済みのため、ここで比較したバージョンはUPDATEまで変わらない
+            for inventory_id in chunk:
+                expected = expected_versions[inventory_id]
+                if inventory_id in found and expected is not None and found[inventory_id][2] != expected:
+                    conflicts.append({
+                        "id": inventory_id, "quantity": found[inventory_id][0], "version": found[inventory_id][2],
+                    })
+            conflicting = {conflict["id"] for conflict in conflicts}
+            targets = [
+                inventory_id for inventory_id in chunk if inventory_id in found and inventory_id not in conflicting
+            ]
+            if not targets:
+                continue
+            cases = " ".join(["WHEN %s THEN %s"] * len(targets))
+            placeholders = ", ".join(["%s"] * len(targets))
+            params = [value for inventory_id in targets for value in (inventory_id, quantities[inventory_id])]
+            params.extend(targets)
+            cursor.execute(
+                f"UPDATE Inventory SET quantity = CASE id {cases} END WHERE id IN ({placeholders})", tuple(params)
+            )
+            changes.record_inventory(cursor, targets)
+            low_stock.evaluate(cursor, targets)
+            updated.extend(targets)
+            summary_deltas.extend(
+                (found[inventory_id][1], summary.quantity_delta(found[inventory_id][0], quantities[inventory_id]))
+                for inventory_id in targets
+            )
+        summary.apply(cursor, summary.merge(summary_deltas))
+        if updated:
+            row_version = versions.next_row_version(cursor)
+            versions.stamp(cursor, row_version, versions.TABLE_INVENTORY, updated)
+            versions.bump(cursor, versions.TABLE_INVENTORY)
+        db.commit()
+        cache.invalidate(NAMESPACE_PARTS)
+    except (mysql.connector.Error, ValueError) as e:
+        db.rollback()
+        raise e
+    finally:
+        cursor.close()
+    return row_version, not_found, conflicts
+
+def adjust_item(db: mysql.connector.MySQLConnection, inventory_id: int, delta: int) -> Optional[int]:
+    """
+    在庫数量にdeltaを加算し、更新後の数量を返します。在庫が存在しない場合はNoneを返します。
+    加算と負数チェックを1つのUPDATE文で行うため、同時に更新されても加算が失われません。
+    更新後の数量はLAST_INSERT_ID(expr)を使い、UPDATEの応答から追加の問い合わせなしで受け取ります。
+    """
+    cursor = db.cursor()
+    try:
+        if delta != 0:
+            cursor.execute(
+                "UPDATE Inventory SET quantity = LAST_INSERT_ID(quantity + %s) WHERE id = %s AND quantity + %s >= 0",
+                (delta, inventory_id, delta),
+            )
+            if cursor.rowcount == 1:
+                new_quantity = cursor.lastrowid
+                changes.record_inventory(cursor, [inventory_id])
+                summary.apply_to_inventory(
+                    cursor, inventory_id, summary.quantity_delta(new_quantity - delta, new_quantity)
+                )
+                low_stock.evaluate(cursor, [inventory_id])
+                row_version = versions.next_row_version(cursor)
+                versions.stamp(cursor, row_version, versions.TABLE_INVENTORY, [inventory_id])
+                versions.bump(cursor, versions.TABLE_INVENTORY)
+                db.commit()
+                cache.invalidate(NAMESPACE_PARTS)
+                return new_quantity
+
+        # 更新されなかった場合は、在庫が存在しないのか数量が不足しているのかを確認する
+        cursor.execute("SELECT quantity FROM Inventory WHERE id = %s", (inventory_id,))
+        row = cursor.fetchone()
+        db.commit()
+        if row is None:
+            return None
+        if delta == 0:
+            return row[0]
+        raise ValueError(f"Insufficient quantity for item {inventory_id}")
+    finally:
+        cursor.close()
+
+def adjust_batch_items(db: mysql.connector.MySQLConnection, items: List[schemas.BatchInventoryAdjustItem]):
+    """
+    複数の在庫数量にそれぞれdeltaを加算し、(更新後の数量の辞書, 存在しなかった在庫IDのリスト) を返します。
+    いずれかの数量が負になる場合は、全体をロールバックしてValueErrorを送出します。
+    """
+    # 同じIDへの複数の加算はまとめる
+    deltas: Dict[int, int] = {}
+    for item in items:
+        deltas[item.id] = deltas.get(item.id, 0) + item.delta
+
+    new_quantities: Dict[int, int] = {}
+    not_found = []
+    summary_deltas = []
     cursor = db.cursor()
     try:
         db.start_transaction()
-        for item in items:
-            if item.quantity < 0:
-                raise ValueError(f"Quantity for item {item.id} cannot be negative")
-            cursor.execute(query, (item.quantity, item.id))
+        for chunk in _chunks(list(deltas), BATCH_CHUNK_SIZE):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                "SELECT i.id, i.quantity, p.c_id FROM Inventory i JOIN Parts p ON p.id = i.parts_id "
+                f"WHERE i.id IN ({placeholders}) FOR UPDATE OF i",
+                tuple(chunk),
+            )
+            rows = cursor.fetchall()
+            current = {row[0]: row[1] for row in rows}
+            categories = {row[0]: row[2] for row in rows}
+            not_found.extend(inventory_id for inventory_id in chunk if inventory_id not in current)
+
+            targets = [inventory_id for inventory_id in chunk if inventory_id in current]
+            insufficient = [inventory_id for inventory_id in targets if current[inventory_id] + deltas[inventory_id] < 0]
+            if insufficient:
+                raise ValueError(f"Insufficient quantity for items {insufficient}")
+            if not targets:
+                continue
+
+            # 行ロックを取得済みのため、加算結果はSELECTした値からの計算と一致する
+            cases = " ".join(["WHEN %s THEN %s"] * len(targets))
+            placeholders = ", ".join(["%s"] * len(targets))
+            params = [value for inventory_id in targets for value in (inventory_id, deltas[inventory_id])]
+            params.extend(targets)
+            cursor.execute(
+                f"UPDATE Inventory SET quantity = quantity + CASE id {cases} END WHERE id IN ({placeholders})",
+                tuple(params),
+            )
+            changes.record_inventory(cursor, targets)
+            low_stock.evaluate(cursor, targets)
+            for inventory_id in targets:
+                new_quantities[inventory_id] = current[inventory_id] + deltas[inventory_id]
+                summary_deltas.append((
+                    categories[inventory_id],
+                    summary.quantity_delta(current[inventory_id], new_quantities[inventory_id]),
+                ))
+        summary.apply(cursor, summary.merge(summary_deltas))
+        if new_quantities:
+            row_version = versions.next_row_version(cursor)
+            versions.stamp(cursor, row_version, versions.TABLE_INVENTORY, list(new_quantities))
+            versions.bump(cursor, versions.TABLE_INVENTORY)
         db.commit()
+        cache.invalidate(NAMESPACE_PARTS)
     except (mysql.connector.Error, ValueError) as e:
         db.rollback()
         raise e
     finally:
         cursor.close()
+    return new_quantities, not_found
+
+def apply_adjustment_events(
+    db: mysql.connector.MySQLConnection, log_id: str, events: Sequence[Tuple[int, int, int]]
+) -> Dict[int, str]:
+    """
+    取り込みログの (連番, 在庫ID, 増減) のイベントを連番順に1つのトランザクションで反映し、連番ごとの結果を返します。
+    同じ在庫へのイベントはまとめて1回のUPDATEにし、数量が負になるイベントだけを個別に拒否します。
+    反映済みの連番をIngest_Log_Positionsに同じトランザクションで記録するため、
+    ログを再生して同じイベントを渡しても二重には反映されません。
+    """
+    results: Dict[int, str] = {}
+    cursor = db.cursor()
+    try:
+        db.start_transaction()
+        cursor.execute("SELECT applied_seq FROM Ingest_Log_Positions WHERE log_id = %s FOR UPDATE", (log_id,))
+        row = cursor.fetchone()
+        applied_seq = row[0] if row else 0
+        for seq, _, _ in events:
+            if seq <= applied_seq:
+                results[seq] = EVENT_ALREADY_APPLIED
+        events = [event for event in events if event[0] > applied_seq]
+
+        current: Dict[int, int] = {}
+        categories: Dict[int, int] = {}
+        for chunk in _chunks(sorted({inventory_id for _, inventory_id, _ in events}), BATCH_CHUNK_SIZE):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                "SELECT i.id, i.quantity, p.c_id FROM Inventory i JOIN Parts p ON p.id = i.parts_id "
+                f"WHERE i.id IN ({placeholders}) FOR UPDATE OF i",
+                tuple(chunk),
+            )
+            for inventory_id, quantity, c_id in cursor.fetchall():
+                current[inventory_id] = quantity
+                categories[inventory_id] = c_id
+
+        # 行ロックを取得済みのため、イベントを順に適用した結果をそのまま書き込める
+        quantities = dict(current)
+        for seq, inventory_id, delta in events:
+            if inventory_id not in quantities:
+                results[seq] = EVENT_NOT_FOUND
+            elif quantities[inventory_id] + delta < 0:
+                results[seq] = EVENT_INSUFFICIENT
+            else:
+                quantities[inventory_id] += delta
+                results[seq] = EVENT_APPLIED
+
+        targets = [inventory_id for inventory_id in current if quantities[inventory_id] != current[inventory_id]]
+        for chunk in _chunks(sorted(targets), BATCH_CHUNK_SIZE):
+            cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+            placeholders = ", ".join(["%s"] * len(chunk))
+            params = [value for inventory_id in chunk for value in (inventory_id, quantities[inventory_id])]
+            params.extend(chunk)
+            cursor.execute(
+                f"UPDATE Inventory SET quantity = CASE id {cases} END WHERE id IN ({placeholders})", tuple(params)
+            )
+            changes.record_inventory(cursor, chunk)
+            low_stock.evaluate(cursor, chunk)
+        summary.apply(cursor, summary.merge(
+            (categories[inventory_id], summary.quantity_delta(current[inventory_id], quantities[inventory_id]))
+            for inventory_id in targets
+        ))
+        if events:
+            cursor.execute(
+                "INSERT INTO Ingest_Log_Positions (log_id, applied_seq) VALUES (%s, %s) "
+                "ON DUPLICATE KEY UPDATE applied_seq = VALUES(applied_seq)",
+                (log_id, events[-1][0]),
+            )
+        if targets:
+            row_version = versions.next_row_version(cursor)
+            versions.stamp(cursor, row_version, versions.TABLE_INVENTORY, sorted(targets))
+            versions.bump(cursor, versions.TABLE_INVENTORY)
+        db.commit()
+        if targets:
+            cache.invalidate(NAMESPACE_PARTS)
+    except mysql.connector.Error as e:
+        db.rollback()
+        raise e
+    finally:
+        cursor.close()
+    return results
@@ -0,0 +1,144 @@
+from typing import List, Optional, Sequence
+import mysql.connector
+
+# 一覧で1回に返す件数の既定値と上限
+LOW_STOCK_PAGE_SIZE = 100
+MAX_LOW_STOCK_PAGE_SIZE = 1000
+
+# カテゴリーの既定の発注点を変更した際に、1つのトランザクションで評価し直す在庫の件数
+EVALUATE_CHUNK_SIZE = 1000
+
+# 在庫ごとの発注点 (未設定の場合はカテゴリーの既定値)。どちらもない場合は0とし、警告の対象にしない
+_REORDER_POINT = "COALESCE(i.reorder_point, c.default_reorder_point, 0)"
+
+_FLAG_QUERY = f"""
+    INSERT INTO Low_Stock (inventory_id, parts_id, quantity, reorder_point)
+    SELECT i.id, i.parts_id, i.quantity, {_REORDER_POINT}
+    FROM Inventory i
+    JOIN Parts p ON p.id = i.parts_id
+    JOIN Category c ON c.id = p.c_id
+    WHERE {{target}} AND i.quantity < {_REORDER_POINT}
+    ON DUPLICATE KEY UPDATE quantity = VALUES(quantity), reorder_point = VALUES(reorder_point)
+"""
+
+_CLEAR_QUERY = f"""
+    DELETE l FROM Low_Stock l
+    JOIN Inventory i ON i.id = l.inventory_id
+    JOIN Parts p ON p.id = i.parts_id
+    JOIN Category c ON c.id = p.c_id
+    WHERE {{target}} AND i.quantity >= {_REORDER_POINT}
+"""
+
+def _chunks(values: list, size: int):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _evaluate(cursor, target: str, params: tuple):
+    # 発注点を下回った在庫を追加 (既にあれば数量を更新) し、下回らなくなった在庫を取り除く
+    # 追加された行のflagged_atは最初に下回った日時のまま変わらない
+    cursor.execute(_FLAG_QUERY.format(target=target), params)
+    cursor.execute(_CLEAR_QUERY.format(target=target), params)
+
+def evaluate(cursor, inventory_ids: Sequence[int]):
+    """
+    書き込み処理のトランザクション内で、更新した在庫だけを発注点と比較し、在庫不足の一覧に反映します。
+    数量を更新した後に呼び出してください。
+    """
+    if not inventory_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(inventory_ids))
+    _evaluate(cursor, f"i.id IN ({placeholders})", tuple(inventory_ids))
+
+def evaluate_parts(cursor, part_ids: Sequence[int]):
+    """部品IDを指定して、その在庫を発注点と比較します (部品の登録時用)。"""
+    if not part_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(part_ids))
+    _evaluate(cursor, f"i.parts_id IN ({placeholders})", tuple(part_ids))
+
+def set_reorder_point(db: mysql.connector.MySQLConnection, inventory_id: int, reorder_point: Optional[int]) -> int:
+    """在庫の発注点を設定し (Noneの場合はカテゴリーの既定値に戻す)、在庫が存在しない場合は0を返します。"""
+    cursor = db.cursor()
+    try:
+        # 他の書き込み処理と同じく、在庫の行をロックしてからevaluateでカテゴリーの行を読む
+        cursor.execute("UPDATE Inventory SET reorder_point = %s WHERE id = %s", (reorder_point, inventory_id))
+        # 同じ値を設定した場合はrowcountが0になるため、存在確認は在庫の行で行う
+        cursor.execute("SELECT COUNT(*) FROM Inventory WHERE id = %s", (inventory_id,))
+        (found,) = cursor.fetchone()
+        if found:
+            evaluate(cursor, [inventory_id])
+        db.commit()
+    except mysql.connector.Error as e:
+        db.rollback()
+        raise e
+    finally:
+        cursor.close()
+    return found
+
+def set_category_default(db: mysql.connector.MySQLConnection, category_id: int, reorder_point: Optional[int]) -> int:
+    """
+    カテゴリーの既定の発注点を設定し、カテゴリーが存在しない場合は0を返します。
+    そのカテゴリーの在庫は発注点が変わるため、カテゴリー内の在庫をEVALUATE_CHUNK_SIZE件ずつ評価し直します。
+    他の書き込み処理は在庫の行をロックしてからカテゴリーの行を読むため、カテゴリーの行をロックしたまま在庫を読むと
+    デッドロックします。発注点の更新をコミットしてから、別のトランザクションで評価し直します。
+    """
+    cursor = db.cursor()
+    try:
+        cursor.execute(
+            "UPDATE Category SET default_reorder_point = %s WHERE id = %s", (reorder_point, category_id)
+        )
+        cursor.execute("SELECT COUNT(*) FROM Category WHERE id = %s", (category_id,))
+        (found,) = cursor.fetchone()
+        db.commit()
+        if found:
+            # この後に登録・更新された在庫は、その書き込み処理が新しい発注点で評価する
+            cursor.execute(
+                "SELECT i.id FROM Inventory i JOIN Parts p ON p.id = i.parts_id WHERE p.c_id = %s ORDER BY i.id",
+                (category_id,),
+            )
+            inventory_ids = [row[0] for row in cursor.fetchall()]
+            db.commit()
+            for chunk in _chunks(inventory_ids, EVALUATE_CHUNK_SIZE):
+                evaluate(cursor, chunk)
+                db.commit()
+    except mysql.connector.Error as e:
+        db.rollback()
+        raise e
+    finally:
+        cursor.close()
+    return found
+
+def get_page(
+    db: mysql.connector.MySQLConnection,
+    after_id: int = 0,
+    limit: int = LOW_STOCK_PAGE_SIZE,
+    category_id: Optional[int] = None,
+) -> List[dict]:
+    """在庫不足の在庫を在庫IDの順に返します (主キーによるキーセットページング)。"""
+    query = """
+        SELECT
+            l.inventory_id AS inventoryId,
+            p.id,
+            p.p_name AS title,
+            c.name AS category,
+            l.quantity,
+            l.reorder_point AS reorderPoint,
+            l.flagged_at AS flaggedAt
+        FROM Low_Stock l
+        JOIN Parts p ON p.id = l.parts_id
+        JOIN Category c ON c.id = p.c_id
+    """
+    where_clauses = ["l.inventory_id > %s"]
+    params = [after_id]
+    if category_id is not None:
+        where_clauses.append("p.c_id = %s")
+        params.append(category_id)
+    query += " WHERE " + " AND ".join(where_clauses) + " ORDER BY l.inventory_id LIMIT %s"
+    params.append(limit)
+
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(query, tuple(params))
+    rows = cursor.fetchall()
+    cursor.close()
+    db.commit()
+    return rows
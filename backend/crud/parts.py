@@ -1,8 +1,72 @@
-from typing import Optional
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+import os
+import re
 import mysql.connector
+import database
+from cache import cache, NAMESPACE_PARTS
+from crud import changes, low_stock, summary, versions
 
-def get_all(db: mysql.connector.MySQLConnection, name: Optional[str] = None, category_id: Optional[int] = None):
-    query = """
+# ストリーミング時に一度にサーバーから読み出す行数
+STREAM_CHUNK_SIZE = 1000
+
+# 差分同期 (get_changes_since) で1回に返す変更の最大件数
+SYNC_PAGE_SIZE = 500
+
+# 型番・IDによる一括検索 (lookup) で1回のIN句に指定する件数
+LOOKUP_CHUNK_SIZE = 1000
+
+# 一括削除 (delete_many) で1回のIN句に指定する件数
+DELETE_CHUNK_SIZE = 1000
+
+# 部品名の検索方式
+SEARCH_LIKE = "like"          # 部分一致 (LIKE '%name%')
+SEARCH_FULLTEXT = "fulltext"  # ngram全文インデックス (ft_parts_p_name) による検索
+
+# MySQLのngram_token_size (全文インデックスに登録される語の文字数)。これより短い語は全文検索で一致しない
+NGRAM_TOKEN_SIZE = int(os.getenv("NGRAM_TOKEN_SIZE", "2"))
+
+_FULLTEXT_MATCH = "MATCH(p.p_name) AGAINST (%s IN BOOLEAN MODE)"
+# BOOLEAN MODEで演算子として解釈される文字
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+# fieldsで取得する列を絞り込む場合の、列名とSELECT式
+PART_COLUMNS = {
+    "id": "p.id",
+    "inventoryId": "i.id",
+    "title": "p.p_name",
+    "category": "c.name",
+    "quantity": "i.quantity",
+    "imageUrl": "COALESCE(p.imageUrl, '')",
+    # 在庫のバージョン (PUT /inventory の楽観的排他制御に使う)
+    "version": "i.row_version",
+}
+
+def _chunks(values: list, size: int):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _to_boolean_query(name: str) -> Optional[str]:
+    """
+    検索語をBOOLEAN MODE用のクエリに変換します。
+    空白区切りの各語を必須 (+) かつ前方一致 (*) とし、演算子文字は取り除きます。
+    語が残らない場合や、NGRAM_TOKEN_SIZEより短い語を含む場合は、全文検索では探せないためNoneを返します (LIKE検索になる)。
+    """
+    terms = [_BOOLEAN_OPERATORS.sub(" ", term).strip() for term in name.split()]
+    terms = [t for term in terms for t in term.split()]
+    if not terms or any(len(term) < NGRAM_TOKEN_SIZE for term in terms):
+        return None
+    return " ".join(f"+{term}*" for term in terms)
+
+def _build_query(
+    name: Optional[str] = None,
+    category_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    search: str = SEARCH_LIKE,
+    fields: Optional[Sequence[str]] = None,
+):
+    if fields is None:
+        query = """
         SELECT
             p.id,
             i.id as inventoryId,
@@ -14,19 +78,106 @@ def get_all(db: mysql.connector.MySQLConnection, name: Optional[str] = None, cat
         JOIN Inventory i ON p.id = i.parts_id
         JOIN Category c ON p.c_id = c.id
     """
+    else:
+        # 指定された列のみを取得し、カテゴリー名が不要な場合はCategoryとのJOINを省く
+        select_list = ",\n            ".join(f"{PART_COLUMNS[field]} AS {field}" for field in fields)
+        query = f"""
+        SELECT
+            {select_list}
+        FROM Parts p
+        JOIN Inventory i ON p.id = i.parts_id
+    """
+        if "category" in fields:
+            query += "    JOIN Category c ON p.c_id = c.id\n    "
+    where_clauses, params = _build_where(name, category_id, after_id, search)
+    if where_clauses:
+        query += " WHERE " + " AND ".join(where_clauses)
+
+    return query, params
+
+def _build_where(
+    name: Optional[str] = None,
+    category_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    search: str = SEARCH_LIKE,
+):
+    """一覧と件数の集計 (get_facets) で共通の検索条件を、(WHERE句の条件のリスト, パラメーター) として返します。"""
     params = []
     where_clauses = []
 
     if name:
-        where_clauses.append("p.p_name LIKE %s")
-        params.append(f"%{name}%")
+        boolean_query = _to_boolean_query(name) if search == SEARCH_FULLTEXT else None
+        if boolean_query:
+            where_clauses.append(_FULLTEXT_MATCH)
+            params.append(boolean_query)
+        else:
+            where_clauses.append("p.p_name LIKE %s")
+            params.append(f"%{name}%")
     
     if category_id is not None:
         where_clauses.append("p.c_id = %s")
         params.append(category_id)
 
+    # キーセットページネーション: 主キーより後ろの行のみを対象にする
+    if after_id is not None:
+        where_clauses.append("p.id > %s")
+        params.append(after_id)
+
+    return where_clauses, params
+
+def _cached(db: mysql.connector.MySQLConnection, key: list, loader, version: Optional[int] = None):
+    # ETagに使ったテーブルのバージョンをキーに含めると、他のプロセス (CLIや別のワーカー) による書き込みで
+    # このプロセスの世代が進まなくても、新しいバージョンには古い結果を返さない
+    if version is not None:
+        key = [*key, "version", version]
+    ttl = None
+    if database.is_replica(db):
+        # レプリカの結果は無効化より後の書き込みを含まない場合があるため、主DBの結果とは分けて短い間だけ保持する
+        key = ["replica", *key]
+        ttl = database.REPLICA_CACHE_TTL
+    return cache.get_or_load(NAMESPACE_PARTS, key, loader, ttl=ttl)
+
+def get_all(
+    db: mysql.connector.MySQLConnection,
+    name: Optional[str] = None,
+    category_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    search: str = SEARCH_LIKE,
+    fields: Optional[Sequence[str]] = None,
+    version: Optional[int] = None,
+):
+    """
+    条件に一致する部品の一覧を返します。同じ条件の一覧はキャッシュから返し、書き込み処理で無効化します。
+    versionには、一覧の前に読んだテーブルのバージョン (versions.get) を指定します。
+    """
+    key = ["get_all", name, category_id, after_id, limit, search, fields and list(fields)]
+    return _cached(db, key, lambda: _fetch_all(db, name, category_id, after_id, limit, search, fields), version)
+
+def get_facets(
+    db: mysql.connector.MySQLConnection,
+    name: Optional[str] = None,
+    search: str = SEARCH_LIKE,
+    version: Optional[int] = None,
+) -> List[dict]:
+    """
+    部品名の検索条件に一致する部品の数を、カテゴリーごとに1回のGROUP BYで集計して返します (一致しないカテゴリーは含まない)。
+    カテゴリーの絞り込みとページの位置には関係なく、検索条件全体の件数を返します。
+    """
+    return _cached(db, ["get_facets", name, search], lambda: _fetch_facets(db, name, search), version)
+
+def _fetch_facets(db, name, search):
+    # 一覧と同じJOINと検索条件を使い、在庫のない部品は一覧と同じく数えない
+    where_clauses, params = _build_where(name, search=search)
+    query = """
+        SELECT c.id AS categoryId, c.name AS category, COUNT(*) AS count
+        FROM Parts p
+        JOIN Inventory i ON p.id = i.parts_id
+        JOIN Category c ON p.c_id = c.id
+    """
     if where_clauses:
         query += " WHERE " + " AND ".join(where_clauses)
+    query += " GROUP BY c.id, c.name ORDER BY c.id"
 
     cursor = db.cursor(dictionary=True)
     cursor.execute(query, tuple(params))
@@ -35,27 +186,297 @@ def get_all(db: mysql.connector.MySQLConnection, name: Optional[str] = None, cat
     db.commit()
     return result
 
-def delete_by_id(db: mysql.connector.MySQLConnection, part_id: int):
-    query = "DELETE FROM Parts WHERE id = %s"
+def _fetch_all(db, name, category_id, after_id, limit, search, fields=None):
+    query, params = _build_query(name, category_id, after_id, search, fields)
+
+    # ページ指定がある場合は主キー順に並べ、インデックスを使って先頭から読み出す
+    # 全文検索のみの場合は関連度の高い順に並べる
+    boolean_query = _to_boolean_query(name) if name and search == SEARCH_FULLTEXT else None
+    if after_id is not None or limit is not None:
+        query += " ORDER BY p.id"
+    elif boolean_query:
+        query += f" ORDER BY {_FULLTEXT_MATCH} DESC, p.id"
+        params.append(boolean_query)
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(query, tuple(params))
+    result = cursor.fetchall()
+    cursor.close()
+    db.commit()
+    return result
+
+def iter_all(
+    db: mysql.connector.MySQLConnection,
+    name: Optional[str] = None,
+    category_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    search: str = SEARCH_LIKE,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    fields: Optional[Sequence[str]] = None,
+) -> Iterator[dict]:
+    """
+    get_allと同じ条件の部品を主キー順に1行ずつ返すジェネレーター。
+    バッファなしカーソルからchunk_size行ずつ読み出すため、件数に関わらずメモリ使用量は一定です。
+    """
+    query, params = _build_query(name, category_id, after_id, search, fields)
+    query += " ORDER BY p.id"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+
+    cursor = db.cursor(dictionary=True, buffered=False)
+    exhausted = False
+    try:
+        cursor.execute(query, tuple(params))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                exhausted = True
+                break
+            for row in rows:
+                yield row
+    finally:
+        # クライアントが途中で切断した場合も、未読の結果を読み捨ててから接続を返す
+        if not exhausted:
+            db.consume_results()
+        cursor.close()
+        db.commit()
+
+def iter_export_batches(
+    db: mysql.connector.MySQLConnection,
+    category_id: Optional[int] = None,
+    modified_since: Optional[datetime] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[List[dict]]:
+    """
+    エクスポート用に、部品・在庫・カテゴリーを結合した行を主キー順にchunk_size行ずつのリストで返します。
+    modified_sinceを指定した場合は、部品または在庫がその日時以降に更新された行のみを対象にします。
+    """
+    query = """
+        SELECT
+            p.id,
+            i.id AS inventoryId,
+            p.p_num AS pNum,
+            p.p_name AS title,
+            p.c_id AS categoryId,
+            c.name AS category,
+            i.quantity,
+            COALESCE(p.imageUrl, '') AS imageUrl,
+            GREATEST(p.updated_at, i.updated_at) AS updatedAt
+        FROM Parts p
+        JOIN Inventory i ON p.id = i.parts_id
+        JOIN Category c ON p.c_id = c.id
+    """
+    params = []
+    where_clauses = []
+    if category_id is not None:
+        where_clauses.append("p.c_id = %s")
+        params.append(category_id)
+    if modified_since is not None:
+        where_clauses.append("(p.updated_at >= %s OR i.updated_at >= %s)")
+        params.extend([modified_since, modified_since])
+    if where_clauses:
+        query += " WHERE " + " AND ".join(where_clauses)
+    query += " ORDER BY p.id"
+
+    cursor = db.cursor(dictionary=True, buffered=False)
+    exhausted = False
+    try:
+        cursor.execute(query, tuple(params))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                exhausted = True
+                break
+            yield rows
+    finally:
+        if not exhausted:
+            db.consume_results()
+        cursor.close()
+        db.commit()
+
+def iter_image_urls(db: mysql.connector.MySQLConnection) -> Iterator[str]:
+    """部品から参照されている画像URLを、バッファなしカーソルで1件ずつ返します。"""
+    cursor = db.cursor(buffered=False)
+    try:
+        cursor.execute("SELECT DISTINCT imageUrl FROM Parts WHERE imageUrl IS NOT NULL")
+        while True:
+            rows = cursor.fetchmany(STREAM_CHUNK_SIZE)
+            if not rows:
+                break
+            for (image_url,) in rows:
+                yield image_url
+    finally:
+        cursor.close()
+        db.commit()
+
+# 部品・在庫・削除記録のそれぞれから、位置 (行バージョン, 部品ID) より後の変更をインデックス順に読み出して合わせる
+_CHANGED_PARTS_QUERY = """
+    SELECT row_version, parts_id, deleted FROM (
+        (SELECT row_version, id AS parts_id, 0 AS deleted FROM Parts
+         WHERE row_version > %s OR (row_version = %s AND id > %s)
+         ORDER BY row_version, id LIMIT %s)
+        UNION ALL
+        (SELECT row_version, parts_id, 0 AS deleted FROM Inventory
+         WHERE row_version > %s OR (row_version = %s AND parts_id > %s)
+         ORDER BY row_version, parts_id LIMIT %s)
+        UNION ALL
+        (SELECT row_version, parts_id, 1 AS deleted FROM Parts_Tombstones
+         WHERE row_version > %s OR (row_version = %s AND parts_id > %s)
+         ORDER BY row_version, parts_id LIMIT %s)
+    ) changed
+    ORDER BY row_version, parts_id, deleted
+    LIMIT %s
+"""
+
+def get_changes_since(
+    db: mysql.connector.MySQLConnection,
+    since_version: int,
+    since_id: int = 0,
+    limit: int = SYNC_PAGE_SIZE,
+) -> Tuple[List[dict], List[dict], Tuple[int, int], bool]:
+    """
+    位置 (since_version, since_id) より後に作成・更新・削除された部品を、行バージョン順に最大limit件返します。
+    戻り値は (作成・更新された部品の現在の行, 削除された部品, 読み終えた位置, 続きがあるか) です。
+    同じトランザクション (スナップショット) 内で変更の一覧と現在の行を読むため、両者は矛盾しません。
+    """
     cursor = db.cursor()
-    cursor.execute(query, (part_id,))
+    keyset = (since_version, since_version, since_id, limit + 1)
+    cursor.execute(_CHANGED_PARTS_QUERY, keyset * 3 + (limit + 1,))
+    changed = cursor.fetchall()
+    cursor.close()
+    has_more = len(changed) > limit
+    changed = changed[:limit]
+    position = (changed[-1][0], changed[-1][1]) if changed else (since_version, since_id)
+
+    # 同じ部品の変更は最後のものだけを残す (削除は同じ行バージョンの更新より後に並ぶ)
+    latest = {}
+    for row_version, part_id, deleted in changed:
+        latest[part_id] = (row_version, bool(deleted))
+    deletes = sorted(
+        ({"id": part_id, "version": row_version} for part_id, (row_version, deleted) in latest.items() if deleted),
+        key=lambda row: (row["version"], row["id"]),
+    )
+    upsert_ids = [part_id for part_id, (_, deleted) in latest.items() if not deleted]
+
+    upserts = []
+    if upsert_ids:
+        # このページの後で削除された部品は現在の行がないため返さない (削除は次のページで返される)
+        placeholders = ", ".join(["%s"] * len(upsert_ids))
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(
+            f"""
+            SELECT
+                p.id,
+                i.id AS inventoryId,
+                p.p_name AS title,
+                c.name AS category,
+                i.quantity,
+                COALESCE(p.imageUrl, '') AS imageUrl,
+                GREATEST(p.row_version, i.row_version) AS version,
+                i.row_version AS inventoryVersion
+            FROM Parts p
+            JOIN Inventory i ON p.id = i.parts_id
+            JOIN Category c ON p.c_id = c.id
+            WHERE p.id IN ({placeholders})
+            ORDER BY version, p.id
+            """,
+            tuple(upsert_ids),
+        )
+        upserts = cursor.fetchall()
+        cursor.close()
     db.commit()
-    rowcount = cursor.rowcount
+    return upserts, deletes, position, has_more
+
+def delete_many(db: mysql.connector.MySQLConnection, part_ids: Sequence[int]) -> Tuple[List[int], List[str]]:
+    """
+    部品をまとめて削除し、(削除した部品IDのリスト, 削除した部品の画像URLのリスト) を返します。
+    DELETE_CHUNK_SIZE件ずつのIN句で削除し、在庫はON DELETE CASCADEで同時に削除されます。
+    全体を1つのトランザクションで行うため、途中で失敗した場合は1件も削除されません。
+    画像は他の部品と共有されている場合があるため、ここでは削除しません (images.schedule_removalを参照)。
+    """
+    part_ids = sorted(set(part_ids))
+    deleted: List[int] = []
+    image_urls: List[str] = []
+    removed = []
+    cursor = db.cursor()
+    try:
+        db.start_transaction()
+        for chunk in _chunks(part_ids, DELETE_CHUNK_SIZE):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            # 在庫は部品の削除と同時に削除されるため、先に行をロックして集計から差し引く分を読む
+            # (変更履歴の記録より先にロックする。共有ロックを取ってから排他ロックを待つと、重なる削除同士でデッドロックする)
+            cursor.execute(
+                "SELECT p.id, p.c_id, i.quantity, p.imageUrl FROM Parts p "
+                f"LEFT JOIN Inventory i ON i.parts_id = p.id WHERE p.id IN ({placeholders}) FOR UPDATE",
+                tuple(chunk),
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                continue
+            found = [part_id for part_id, _, _, _ in rows]
+            changes.record_parts(cursor, found, changes.OP_DELETE)
+            deleted.extend(found)
+            image_urls.extend(image_url for _, _, _, image_url in rows if image_url)
+            removed.extend(
+                (c_id, (-1, -quantity, -int(quantity == 0))) for _, c_id, quantity, _ in rows if quantity is not None
+            )
+            placeholders = ", ".join(["%s"] * len(found))
+            cursor.execute(f"DELETE FROM Parts WHERE id IN ({placeholders})", tuple(found))
+        if deleted:
+            summary.apply(cursor, summary.merge(removed))
+            # 差分同期のクライアントに削除を伝えるため、削除した部品を行バージョンとともに残す
+            row_version = versions.next_row_version(cursor)
+            for chunk in _chunks(deleted, DELETE_CHUNK_SIZE):
+                placeholders = ", ".join(["(%s, %s)"] * len(chunk))
+                cursor.execute(
+                    f"INSERT INTO Parts_Tombstones (parts_id, row_version) VALUES {placeholders}",
+                    tuple(value for part_id in chunk for value in (part_id, row_version)),
+                )
+            versions.bump(cursor, versions.TABLE_PARTS, versions.TABLE_INVENTORY)
+        db.commit()
+    except mysql.connector.Error as e:
+        db.rollback()
+        raise e
+    finally:
+        cursor.close()
+    if deleted:
+        cache.invalidate(NAMESPACE_PARTS)
+    return deleted, image_urls
+
+def find_referenced_image_urls(db: mysql.connector.MySQLConnection, image_urls: Sequence[str]) -> Set[str]:
+    """指定した画像URLのうち、いずれかの部品から参照されているものを返します (idx_parts_image_url を使用)。"""
+    referenced: Set[str] = set()
+    cursor = db.cursor()
+    for chunk in _chunks(sorted(set(image_urls)), DELETE_CHUNK_SIZE):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"SELECT DISTINCT imageUrl FROM Parts WHERE imageUrl IN ({placeholders})", tuple(chunk))
+        referenced.update(image_url for (image_url,) in cursor.fetchall())
     cursor.close()
-    return rowcount
+    db.commit()
+    return referenced
 
 def update_image_url(db: mysql.connector.MySQLConnection, part_id: int, image_url: str):
     query = "UPDATE Parts SET imageUrl = %s WHERE id = %s"
     cursor = db.cursor()
     cursor.execute(query, (image_url, part_id))
-    db.commit()
     rowcount = cursor.rowcount
+    if rowcount:
+        row_version = versions.next_row_version(cursor)
+        versions.stamp(cursor, row_version, versions.TABLE_PARTS, [part_id])
+        versions.bump(cursor, versions.TABLE_PARTS)
+    db.commit()
+    cache.invalidate(NAMESPACE_PARTS)
     cursor.close()
     return rowcount
 
 def create(db: mysql.connector.MySQLConnection, title: str, category_id: int, quantity: int):
     cursor = db.cursor(dictionary=True)
-    
+
     # Partsテーブルに挿入
     cursor.execute("INSERT INTO Parts (p_name, c_id) VALUES (%s, %s)", (title, category_id))
     parts_id = cursor.lastrowid
@@ -63,8 +484,17 @@ def create(db: mysql.connector.MySQLConnection, title: str, category_id: int, qu
     # Inventoryテーブルに挿入
     cursor.execute("INSERT INTO Inventory (parts_id, quantity) VALUES (%s, %s)", (parts_id, quantity))
     inventory_id = cursor.lastrowid
-    
+
+    changes.record_inventory(cursor, [inventory_id], changes.OP_CREATE)
+    summary.apply(cursor, {category_id: (1, quantity, int(quantity == 0))})
+    # カテゴリーの既定の発注点を下回る数量で登録された場合に備えて評価する
+    low_stock.evaluate(cursor, [inventory_id])
+    row_version = versions.next_row_version(cursor)
+    versions.stamp(cursor, row_version, versions.TABLE_PARTS, [parts_id])
+    versions.stamp(cursor, row_version, versions.TABLE_INVENTORY, [inventory_id])
+    versions.bump(cursor, versions.TABLE_PARTS, versions.TABLE_INVENTORY)
     db.commit()
+    cache.invalidate(NAMESPACE_PARTS)
 
     # 作成された部品情報を取得して返す
     query = """
@@ -86,3 +516,109 @@ def create(db: mysql.connector.MySQLConnection, title: str, category_id: int, qu
     cursor.close()
     
     return created_part
+
+def find_existing_p_nums(db: mysql.connector.MySQLConnection, p_nums: List[int]) -> Set[int]:
+    """指定した型番のうち、既に登録されているものを返します (idx_parts_p_num を使用)。"""
+    if not p_nums:
+        return set()
+    placeholders = ", ".join(["%s"] * len(p_nums))
+    cursor = db.cursor()
+    cursor.execute(f"SELECT p_num FROM Parts WHERE p_num IN ({placeholders})", tuple(p_nums))
+    existing = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    db.commit()
+    return existing
+
+_LOOKUP_QUERY = """
+    SELECT
+        p.id,
+        p.p_num AS pNum,
+        i.id AS inventoryId,
+        p.p_name AS title,
+        c.name AS category,
+        i.quantity,
+        COALESCE(p.imageUrl, '') AS imageUrl,
+        i.row_version AS version
+    FROM Parts p
+    JOIN Inventory i ON p.id = i.parts_id
+    JOIN Category c ON p.c_id = c.id
+    WHERE {column} IN ({placeholders})
+"""
+
+def _lookup_by(cursor, column: str, keys: Sequence[int], chunk_size: int) -> List[dict]:
+    rows: List[dict] = []
+    for chunk in _chunks(keys, chunk_size):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(_LOOKUP_QUERY.format(column=column, placeholders=placeholders), tuple(chunk))
+        rows.extend(cursor.fetchall())
+    return rows
+
+def lookup(
+    db: mysql.connector.MySQLConnection,
+    p_nums: Sequence[int] = (),
+    part_ids: Sequence[int] = (),
+    chunk_size: int = LOOKUP_CHUNK_SIZE,
+) -> Tuple[Dict[int, dict], Dict[int, dict]]:
+    """
+    型番と部品IDで部品をまとめて検索し、(型番ごとの行, 部品IDごとの行) を返します。見つからないものは含みません。
+    chunk_size件ずつのIN句で、型番はidx_parts_p_num、部品IDは主キーから読み出します。
+    すべてのチャンクを1つのトランザクション (スナップショット) 内で読むため、結果は同じ時点のものになります。
+    """
+    p_nums = sorted(set(p_nums))
+    part_ids = sorted(set(part_ids))
+    cursor = db.cursor(dictionary=True)
+    try:
+        by_p_num = {row["pNum"]: row for row in _lookup_by(cursor, "p.p_num", p_nums, chunk_size)}
+        by_id = {row["id"]: row for row in _lookup_by(cursor, "p.id", part_ids, chunk_size)}
+    finally:
+        cursor.close()
+        db.commit()
+    return by_p_num, by_id
+
+def bulk_create(db: mysql.connector.MySQLConnection, rows: List[Tuple[int, Optional[int], str, int]]) -> List[int]:
+    """
+    (カテゴリーID, 型番, 部品名, 数量) の行をまとめて登録し、作成した部品IDのリストを返します。
+    PartsとInventoryへの挿入はそれぞれ1回の複数行INSERTで行い、1つのトランザクションでコミットします。
+    """
+    if not rows:
+        return []
+    cursor = db.cursor()
+    try:
+        db.start_transaction()
+        placeholders = ", ".join(["(%s, %s, %s)"] * len(rows))
+        params = [value for c_id, p_num, title, quantity in rows for value in (c_id, p_num, title)]
+        cursor.execute(f"INSERT INTO Parts (c_id, p_num, p_name) VALUES {placeholders}", tuple(params))
+        # lastrowidは先頭のIDを返すが、auto_increment_increment > 1 や innodb_autoinc_lock_mode=2 では
+        # 続くIDが連続するとは限らないため、挿入した行をトランザクション内で読み直す。
+        # 他のトランザクションの行はコミット済みなら行バージョンが付いており、未コミットなら見えないため、
+        # 先頭のID以降で row_version = 0 の行は、このトランザクションで挿入した行になる
+        cursor.execute(
+            "SELECT id, c_id, p_num, p_name FROM Parts WHERE id >= %s AND row_version = 0 ORDER BY id LIMIT %s",
+            (cursor.lastrowid, len(rows)),
+        )
+        inserted = cursor.fetchall()
+        if [tuple(row[1:]) for row in inserted] != [(c_id, p_num, title) for c_id, p_num, title, _ in rows]:
+            raise mysql.connector.errors.DatabaseError(msg="Could not identify the inserted parts")
+        part_ids = [row[0] for row in inserted]
+
+        placeholders = ", ".join(["(%s, %s)"] * len(rows))
+        params = [value for part_id, row in zip(part_ids, rows) for value in (part_id, row[3])]
+        cursor.execute(f"INSERT INTO Inventory (parts_id, quantity) VALUES {placeholders}", tuple(params))
+        changes.record_parts(cursor, part_ids, changes.OP_CREATE)
+        summary.apply(
+            cursor, summary.merge((c_id, (1, quantity, int(quantity == 0))) for c_id, _, _, quantity in rows)
+        )
+        low_stock.evaluate_parts(cursor, part_ids)
+
+        row_version = versions.next_row_version(cursor)
+        versions.stamp(cursor, row_version, versions.TABLE_PARTS, part_ids)
+        versions.stamp(cursor, row_version, versions.TABLE_INVENTORY, part_ids, key="parts_id")
+        versions.bump(cursor, versions.TABLE_PARTS, versions.TABLE_INVENTORY)
+        db.commit()
+        cache.invalidate(NAMESPACE_PARTS)
+    except mysql.connector.Error as e:
+        db.rollback()
+        raise e
+    finally:
+        cursor.close()
+    return part_ids
@@ -0,0 +1,101 @@
+from typing import Dict, Iterable, List, Tuple
+import mysql.connector
+from crud import versions
+
+# カテゴリーごとの増減 (部品数, 合計数量, 在庫0の部品数)
+SummaryDelta = Tuple[int, int, int]
+
+def quantity_delta(old_quantity: int, new_quantity: int) -> SummaryDelta:
+    """在庫数量の変更による集計の増減を返します。"""
+    return 0, new_quantity - old_quantity, int(new_quantity == 0) - int(old_quantity == 0)
+
+def merge(deltas: Iterable[Tuple[int, SummaryDelta]]) -> Dict[int, SummaryDelta]:
+    """(カテゴリーID, 増減) の並びを、カテゴリーごとに合計します。"""
+    merged: Dict[int, SummaryDelta] = {}
+    for c_id, delta in deltas:
+        current = merged.get(c_id, (0, 0, 0))
+        merged[c_id] = tuple(a + b for a, b in zip(current, delta))
+    return merged
+
+def apply(cursor, deltas: Dict[int, SummaryDelta]):
+    """
+    書き込み処理のトランザクション内で、カテゴリーごとの集計に増減を加えます。
+    集計行がないカテゴリーは作成します。デッドロックを避けるため、常にカテゴリーIDの順に行を更新します。
+    """
+    rows = [(c_id, *delta) for c_id, delta in sorted(deltas.items()) if any(delta)]
+    if not rows:
+        return
+    placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(rows))
+    cursor.execute(
+        "INSERT INTO Category_Stock_Summary (c_id, part_count, total_quantity, zero_stock_count) "
+        f"VALUES {placeholders} "
+        "ON DUPLICATE KEY UPDATE part_count = part_count + VALUES(part_count), "
+        "total_quantity = total_quantity + VALUES(total_quantity), "
+        "zero_stock_count = zero_stock_count + VALUES(zero_stock_count)",
+        tuple(value for row in rows for value in row),
+    )
+
+def apply_to_inventory(cursor, inventory_id: int, delta: SummaryDelta):
+    """在庫IDからカテゴリーを求めて集計に増減を加えます (カテゴリーIDを取得していない単一行の更新用)。"""
+    if not any(delta):
+        return
+    cursor.execute(
+        "UPDATE Category_Stock_Summary s "
+        "JOIN Parts p ON p.c_id = s.c_id "
+        "JOIN Inventory i ON i.parts_id = p.id "
+        "SET s.part_count = s.part_count + %s, s.total_quantity = s.total_quantity + %s, "
+        "s.zero_stock_count = s.zero_stock_count + %s "
+        "WHERE i.id = %s",
+        (*delta, inventory_id),
+    )
+
+def get_all(db: mysql.connector.MySQLConnection) -> List[dict]:
+    """カテゴリーごとの部品数・合計数量・在庫0の部品数を返します (集計行がないカテゴリーは0件)。"""
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT
+            c.id AS categoryId,
+            c.name AS category,
+            COALESCE(s.part_count, 0) AS partCount,
+            COALESCE(s.total_quantity, 0) AS totalQuantity,
+            COALESCE(s.zero_stock_count, 0) AS zeroStockCount
+        FROM Category c
+        LEFT JOIN Category_Stock_Summary s ON s.c_id = c.id
+        ORDER BY c.id
+    """)
+    rows = cursor.fetchall()
+    cursor.close()
+    db.commit()
+    return rows
+
+def rebuild(db: mysql.connector.MySQLConnection) -> int:
+    """
+    部品と在庫から集計をすべて作り直し、集計したカテゴリーの数を返します。
+    INSERT ... SELECTは読み出した行をロックするため、作り直している間の書き込みは完了まで待たされます。
+    """
+    cursor = db.cursor()
+    try:
+        db.start_transaction()
+        cursor.execute("DELETE FROM Category_Stock_Summary")
+        cursor.execute("""
+            INSERT INTO Category_Stock_Summary (c_id, part_count, total_quantity, zero_stock_count)
+            SELECT
+                c.id,
+                COUNT(i.id),
+                COALESCE(SUM(i.quantity), 0),
+                COALESCE(SUM(i.quantity = 0), 0)
+            FROM Category c
+            LEFT JOIN Parts p ON p.c_id = c.id
+            LEFT JOIN Inventory i ON i.parts_id = p.id
+            GROUP BY c.id
+        """)
+        rowcount = cursor.rowcount
+        # 集計のETagは在庫のバージョンから作るため、作り直した内容を返すよう進める
+        versions.bump(cursor, versions.TABLE_INVENTORY)
+        db.commit()
+    except mysql.connector.Error as e:
+        db.rollback()
+        raise e
+    finally:
+        cursor.close()
+    return rowcount
@@ -0,0 +1,77 @@
+from typing import Optional, Sequence, Tuple
+import mysql.connector
+
+# 変更カウンターを持つテーブル名 (Table_Versions.name)
+TABLE_PARTS = "Parts"
+TABLE_INVENTORY = "Inventory"
+# Categoryのカウンターはトリガー (trg_category_*_version) が進める
+TABLE_CATEGORY = "Category"
+# 行バージョン (Parts/Inventoryのrow_version) の採番に使うカウンター
+ROW_VERSION_SEQUENCE = "RowVersion"
+# stampで1回のIN句に指定する件数
+STAMP_CHUNK_SIZE = 1000
+
+def bump(cursor, *tables: str):
+    """
+    書き込み処理のトランザクション内で、変更したテーブルのカウンターを1つ進めます。
+    コミット直前に呼び出し、カウンター行のロックを保持する時間を短くしてください。
+    """
+    placeholders = ", ".join(["%s"] * len(tables))
+    cursor.execute(f"UPDATE Table_Versions SET version = version + 1 WHERE name IN ({placeholders})", tables)
+
+def next_row_version(cursor) -> int:
+    """
+    書き込み処理のトランザクション内で、変更した行に付けるバージョンを採番します。
+    カウンター行のロックはコミットまで保持されるため、バージョンの大小とコミットの順序は一致し、
+    「バージョンN以降の変更」を問い合わせた際に、後からより小さいバージョンの行が現れることはありません。
+    すべての書き込み処理がこのロックを待つため、行の書き込みを済ませたコミットの直前 (bumpの前) に呼び出し、
+    stampで変更した行に付けてください。
+    """
+    cursor.execute(
+        "UPDATE Table_Versions SET version = LAST_INSERT_ID(version + 1) WHERE name = %s", (ROW_VERSION_SEQUENCE,)
+    )
+    return cursor.lastrowid
+
+def stamp(cursor, row_version: int, table: str, ids: Sequence[int], key: str = "id"):
+    """next_row_versionで採番したバージョンを、tableのkey列がidsの行に付けます。"""
+    ids = list(ids)
+    for start in range(0, len(ids), STAMP_CHUNK_SIZE):
+        chunk = ids[start:start + STAMP_CHUNK_SIZE]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(
+            f"UPDATE {table} SET row_version = %s WHERE {key} IN ({placeholders})", (row_version, *chunk)
+        )
+
+def get(db: mysql.connector.MySQLConnection, *tables: str):
+    """
+    指定したテーブルのカウンターの合計を返します。
+    カウンターは増加しかしないため、いずれかのテーブルが変更されると必ず値が変わります。
+    読み出し後にコミットしてスナップショットを閉じます。続けて一覧をキャッシュに読み込む場合に、
+    このスナップショットのまま読むと、その間にコミットされた書き込みを含まない結果が新しい世代で保持されるためです。
+    """
+    placeholders = ", ".join(["%s"] * len(tables))
+    cursor = db.cursor()
+    cursor.execute(f"SELECT SUM(version) FROM Table_Versions WHERE name IN ({placeholders})", tables)
+    row = cursor.fetchone()
+    cursor.close()
+    db.commit()
+    return row[0] if row else None
+
+def get_with_latest_change(db: mysql.connector.MySQLConnection, *tables: str) -> Tuple[Optional[int], int]:
+    """
+    getと同じカウンターの合計と、在庫の変更履歴 (Inventory_Changes) の最新のID (変更がなければ0) を、
+    1つの文 (同じスナップショット) で読んで返します。
+    変更の記録とカウンターの更新は同じトランザクションで行われるため、このバージョンの一覧にはこのIDまでの変更が含まれ、
+    クライアントはこのIDの後から変更を購読すれば、一覧の取得との間の変更を取りこぼしません。
+    """
+    placeholders = ", ".join(["%s"] * len(tables))
+    cursor = db.cursor()
+    cursor.execute(
+        f"SELECT SUM(version), (SELECT COALESCE(MAX(id), 0) FROM Inventory_Changes) "
+        f"FROM Table_Versions WHERE name IN ({placeholders})",
+        tables,
+    )
+    row = cursor.fetchone()
+    cursor.close()
+    db.commit()
+    return (row[0], row[1]) if row else (None, 0)
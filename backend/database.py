@@ -1,9 +1,14 @@
+import logging
 import os
-import sys
+import queue
+import threading
 import time
+from contextlib import contextmanager
 import mysql.connector
 from mysql.connector import pooling
+from fastapi import Request
 from dotenv import load_dotenv
+import metrics
 
 load_dotenv()
 
@@ -21,45 +26,452 @@ db_config = {
     "database": DB_NAME,
 }
 
-# 接続試行の最大回数と待機時間
-MAX_RETRIES = 10
-RETRY_DELAY = 5
+# 読み取り専用のレプリカ (未設定の場合はすべての処理で主DBを使う)
+DB_REPLICA_HOST = os.getenv("MYSQL_REPLICA_HOST", "")
+DB_REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", os.getenv("DB_POOL_SIZE", "10")))
+# レプリカの遅延 (秒) がこの値を超えている間は、読み取りも主DBに送る
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "2"))
+# レプリカの遅延を確認する間隔
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", "1"))
+# 書き込みを行ったクライアントの読み取りを主DBに送り続ける秒数 (自分の書き込みが読めるようにする)
+# レプリカの遅延の上限より長くしておくと、主DBに戻している間にレプリカが追いつく
+DB_STICKY_PRIMARY_SECONDS = int(os.getenv("DB_STICKY_PRIMARY_SECONDS", "5"))
+# レプリカから読んだ結果をキャッシュする秒数 (遅れている可能性がある結果を長く残さない)
+REPLICA_CACHE_TTL = DB_REPLICA_MAX_LAG_SECONDS
+# 直前に書き込みを行ったことを示すCookie
+STICKY_PRIMARY_COOKIE = "mast_primary"
+
+# 接続プールのサイズ (mysql.connectorの上限は32) と、空きを待つ最大秒数
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+
+# 起動時にバックグラウンドで作っておく接続の数 (残りは必要になった時点で作る)
+DB_POOL_WARM_SIZE = min(int(os.getenv("DB_POOL_WARM_SIZE", "2")), DB_POOL_SIZE)
+# この秒数以上使われていなかった接続のみ、取得時にpingで切断されていないか確認する
+DB_POOL_HEALTHCHECK_IDLE_SECONDS = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE_SECONDS", "30"))
+# 接続に失敗した後、再び接続を試みるまでの待ち時間 (失敗が続くたびに倍にし、上限で止める)
+RETRY_INITIAL_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+# 接続を開く際のタイムアウト秒数 (DBに到達できない場合にリクエストを長く待たせない)
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+logger = logging.getLogger("mast.database")
+
+
+class _PooledConnection(pooling.PooledMySQLConnection):
+    def close(self):
+        """
+        接続をプールに返します。セッションの初期化に失敗した接続は切断されている可能性があるため、
+        次に取得された時にpingで確認させます。
+        """
+        cnx = self._cnx
+        try:
+            if self._cnx_pool.reset_session:
+                cnx.reset_session()
+        except mysql.connector.Error:
+            cnx.mast_needs_check = True
+        finally:
+            self._cnx_pool.add_connection(cnx)
+            self._cnx = None
+
+
+class LazyConnectionPool(pooling.MySQLConnectionPool):
+    """
+    作成時には接続せず、必要になった時点で接続を作る接続プール。
+
+    - 返却された接続は、DB_POOL_HEALTHCHECK_IDLE_SECONDS以上使われていなかった場合のみ取得時にpingする
+      (mysql.connectorのプールは取得のたびにis_connected()でpingする)
+    - 接続に失敗した後は、待ち時間 (指数バックオフ) が過ぎるまで新しい接続を作らずにPoolErrorを送出する
+      (DBが停止している間、リクエストごとに接続のタイムアウトを待たせない)
+    """
+
+    def __init__(self, pool_size: int, pool_name: str, replica: bool = False, **config):
+        super().__init__(pool_size=pool_size, pool_name=pool_name)
+        self.set_config(**config)
+        self.replica = replica
+        self._created = 0
+        self._failures = 0
+        self._retry_at = 0.0
+        self.connected_once = False
+
+    @property
+    def available(self) -> bool:
+        """最後の接続の試行が成功していればTrueを返します。"""
+        return self.connected_once and self._failures == 0
+
+    def _queue_connection(self, cnx):
+        cnx.mast_returned_at = time.monotonic()
+        super()._queue_connection(cnx)
+
+    def _retry_delay(self) -> float:
+        return min(RETRY_INITIAL_DELAY * 2 ** (self._failures - 1), RETRY_MAX_DELAY)
+
+    def _connect(self):
+        with pooling.CONNECTION_POOL_LOCK:
+            wait = self._retry_at - time.monotonic()
+            if wait > 0:
+                raise pooling.PoolError(f"Database unavailable; retrying in {wait:.1f} seconds")
+            if self._created >= self.pool_size:
+                raise pooling.PoolError("Failed getting connection; pool exhausted")
+            self._created += 1
+        try:
+            cnx = mysql.connector.connect(**self._cnx_config)
+        except mysql.connector.Error:
+            with pooling.CONNECTION_POOL_LOCK:
+                self._created -= 1
+                self._failures += 1
+                self._retry_at = time.monotonic() + self._retry_delay()
+            raise
+        with pooling.CONNECTION_POOL_LOCK:
+            self._failures = 0
+            self._retry_at = 0.0
+            self.connected_once = True
+        cnx.pool_config_version = self._config_version
+        cnx.mast_needs_check = False
+        # crudの関数がレプリカから読んだ結果かどうかを判別できるようにする (is_replicaを参照)
+        cnx.mast_replica = self.replica
+        return cnx
+
+    def _discard(self, cnx):
+        with pooling.CONNECTION_POOL_LOCK:
+            self._created -= 1
+        try:
+            cnx.disconnect()
+        except mysql.connector.Error:
+            pass
+
+    def get_connection(self):
+        with pooling.CONNECTION_POOL_LOCK:
+            try:
+                cnx = self._cnx_queue.get(block=False)
+            except queue.Empty:
+                cnx = None
+        if cnx is None:
+            return _PooledConnection(self, self._connect())
+
+        idle = time.monotonic() - cnx.mast_returned_at
+        if cnx.mast_needs_check or idle >= DB_POOL_HEALTHCHECK_IDLE_SECONDS:
+            if not cnx.is_connected():
+                # 切断されていた接続は捨てて作り直す
+                self._discard(cnx)
+                return _PooledConnection(self, self._connect())
+            cnx.mast_needs_check = False
+        return _PooledConnection(self, cnx)
+
+    def warm_up(self, size: int, stop: threading.Event):
+        """接続がsize個になるまで作ってプールに入れます。失敗した場合は待ち時間をおいて再試行します。"""
+        while not stop.is_set():
+            with pooling.CONNECTION_POOL_LOCK:
+                if self._created >= size:
+                    return
+                wait = self._retry_at - time.monotonic()
+            if wait > 0:
+                stop.wait(wait)
+                continue
+            try:
+                self.add_connection(self._connect())
+            except pooling.PoolError:
+                # 他のスレッドの接続失敗による待ち時間中、またはリクエストで上限まで作られた
+                stop.wait(RETRY_INITIAL_DELAY)
+            except mysql.connector.Error as e:
+                logger.warning("Database connection failed (retrying in %.1f seconds): %s", self._retry_delay(), e)
+
 
-retries = 0
 cnx_pool = None
-while retries < MAX_RETRIES:
-    try:
-        # 接続プールを作成
-        cnx_pool = mysql.connector.pooling.MySQLConnectionPool(
-            pool_name="mast_pool",
-            pool_size=5,
-            **db_config
+replica_pool = None
+_pool_init_lock = threading.Lock()
+_background_stop = threading.Event()
+_warm_up_thread = None
+_lag_monitor_thread = None
+# 最後に確認したレプリカの遅延 (秒, レプリケーションが停止している・確認できない場合はNone) と確認した時刻
+_replica_lag = None
+_replica_checked_at = 0.0
+
+def get_pool() -> LazyConnectionPool:
+    """接続プールを返します。まだない場合は作成します (接続は行わないため待たされません)。"""
+    global cnx_pool
+    if cnx_pool is None:
+        with _pool_init_lock:
+            if cnx_pool is None:
+                cnx_pool = LazyConnectionPool(
+                    pool_size=DB_POOL_SIZE, pool_name="mast_pool",
+                    connection_timeout=DB_CONNECT_TIMEOUT, **db_config
+                )
+    return cnx_pool
+
+def replica_enabled() -> bool:
+    return bool(DB_REPLICA_HOST)
+
+def get_replica_pool() -> LazyConnectionPool:
+    """レプリカの接続プールを返します。まだない場合は作成します (replica_enabled()の場合のみ使用)。"""
+    global replica_pool
+    if replica_pool is None:
+        with _pool_init_lock:
+            if replica_pool is None:
+                replica_pool = LazyConnectionPool(
+                    pool_size=DB_REPLICA_POOL_SIZE, pool_name="mast_replica_pool", replica=True,
+                    connection_timeout=DB_CONNECT_TIMEOUT, **{**db_config, "host": DB_REPLICA_HOST}
+                )
+    return replica_pool
+
+def is_replica(db) -> bool:
+    """接続がレプリカのプールから取得したものであればTrueを返します。"""
+    return getattr(db, "mast_replica", False) is True
+
+def start_pool():
+    """
+    接続プールを作成し、DB_POOL_WARM_SIZE個の接続をバックグラウンドで作り始めます。
+    DBに接続できなくても待たずに戻るため、アプリケーションはすぐにリクエストを受け付けられます。
+    """
+    global _warm_up_thread, _lag_monitor_thread
+    pool = get_pool()
+    _background_stop.clear()
+    if DB_POOL_WARM_SIZE > 0 and (_warm_up_thread is None or not _warm_up_thread.is_alive()):
+        _warm_up_thread = threading.Thread(
+            target=pool.warm_up, args=(DB_POOL_WARM_SIZE, _background_stop), name="db-pool-warm-up", daemon=True
         )
-        print("Database connection pool created successfully.")
-        break  # 成功したらループを抜ける
-    except mysql.connector.Error as e:
-        retries += 1
-        print(f"Error creating connection pool: {e}")
-        if retries < MAX_RETRIES:
-            print(f"Retrying in {RETRY_DELAY} seconds... ({retries}/{MAX_RETRIES})")
-            time.sleep(RETRY_DELAY)
-        else:
-            print("Failed to create connection pool after multiple retries.")
-            sys.exit(1) # アプリケーションを終了
+        _warm_up_thread.start()
+    # レプリカを使う場合は、遅延の確認を始める (確認できるまで読み取りは主DBに送る)
+    if replica_enabled() and (_lag_monitor_thread is None or not _lag_monitor_thread.is_alive()):
+        _lag_monitor_thread = threading.Thread(
+            target=_monitor_replica_lag, args=(_background_stop,), name="db-replica-lag-monitor", daemon=True
+        )
+        _lag_monitor_thread.start()
+
+def stop_pool():
+    _background_stop.set()
+
+class PoolTimeoutError(Exception):
+    """接続プールの空きを待つ間にタイムアウトした場合の例外"""
+
+
+class PoolStats:
+    """接続プールの利用状況 (使用中の接続数、待ち時間、タイムアウト回数) を集計します。"""
+
+    def __init__(self, size: int):
+        self._lock = threading.Lock()
+        self.size = size
+        self.in_use = 0
+        self.max_in_use = 0
+        self.acquired_total = 0
+        self.timeouts_total = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def on_acquire(self, wait_seconds: float):
+        with self._lock:
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.acquired_total += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def on_release(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def on_timeout(self, wait_seconds: float):
+        with self._lock:
+            self.timeouts_total += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "utilization": self.in_use / self.size if self.size else 0.0,
+                "acquired_total": self.acquired_total,
+                "timeouts_total": self.timeouts_total,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_avg": self.wait_seconds_total / self.acquired_total if self.acquired_total else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+            }
+
+
+# プールが空の場合にPoolErrorで即座に失敗させず、空きが出るまで待たせるためのセマフォ
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+pool_stats = PoolStats(DB_POOL_SIZE)
+_replica_slots = threading.BoundedSemaphore(DB_REPLICA_POOL_SIZE)
+replica_pool_stats = PoolStats(DB_REPLICA_POOL_SIZE)
+
+metrics.register_gauge("db_pool_size", "Size of the connection pool", lambda: pool_stats.size)
+metrics.register_gauge("db_pool_in_use", "Connections currently checked out", lambda: pool_stats.in_use)
+metrics.register_gauge(
+    "db_pool_timeouts_total", "Acquires that timed out waiting for a connection", lambda: pool_stats.timeouts_total
+)
+
+if replica_enabled():
+    metrics.register_gauge(
+        "db_replica_pool_in_use", "Replica connections currently checked out", lambda: replica_pool_stats.in_use
+    )
+    metrics.register_gauge(
+        "db_replica_lag_seconds", "Last measured replica lag (-1 if unknown)",
+        lambda: -1 if _replica_lag is None else _replica_lag,
+    )
+
+def _pool_resources(replica: bool):
+    if replica:
+        return get_replica_pool(), _replica_slots, replica_pool_stats
+    return get_pool(), _pool_slots, pool_stats
+
+def _acquire_connection(replica: bool = False):
+    pool, slots, stats = _pool_resources(replica)
+    start = time.perf_counter()
+    if not slots.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT):
+        stats.on_timeout(time.perf_counter() - start)
+        raise PoolTimeoutError(f"No connection available within {DB_POOL_ACQUIRE_TIMEOUT} seconds")
+    try:
+        conn = pool.get_connection()
+    except Exception:
+        slots.release()
+        raise
+    wait_seconds = time.perf_counter() - start
+    stats.on_acquire(wait_seconds)
+    metrics.observe_pool_wait(wait_seconds)
+    return conn
+
+def _release_connection(conn, replica: bool = False):
+    _, slots, stats = _pool_resources(replica)
+    try:
+        # 接続をプールに返す (切断の確認は次に取得する際に行う)
+        conn.close()
+    finally:
+        stats.on_release()
+        slots.release()
+
+def get_pool_stats() -> dict:
+    stats = pool_stats.snapshot()
+    if replica_enabled():
+        stats["replica"] = {
+            **replica_pool_stats.snapshot(),
+            "lag_seconds": _replica_lag,
+            "in_use_for_reads": replica_usable(),
+        }
+    return stats
 
 # データベース接続を取得するための依存関係
 def get_db_connection():
-    if cnx_pool is None:
-        raise ConnectionError("Database connection pool is not available.")
     try:
-        # プールから接続を取得
-        conn = cnx_pool.get_connection()
-        yield conn
-    except mysql.connector.Error as e:
+        # プールから接続を取得 (空きがない場合はDB_POOL_ACQUIRE_TIMEOUT秒まで待つ)
+        conn = _acquire_connection()
+    except (mysql.connector.Error, PoolTimeoutError) as e:
         print(f"Error getting connection from pool: {e}")
         yield None
+        return
+    try:
+        # クエリごとの時間と行数を記録するため、計測用のラッパーを通して渡す
+        yield metrics.instrument(conn)
+    finally:
+        _release_connection(conn)
+
+# 読み取り専用の処理 (一覧の取得など) に渡す接続の依存関係
+# レプリカを使えない場合 (未設定・遅延がしきい値を超えている・接続できない) や、
+# 直前に書き込みを行ったクライアントからのリクエストでは、主DBの接続を渡す
+def get_read_db_connection(request: Request):
+    if not replica_enabled() or STICKY_PRIMARY_COOKIE in request.cookies or not replica_usable():
+        yield from get_db_connection()
+        return
+    try:
+        conn = _acquire_connection(replica=True)
+    except (mysql.connector.Error, PoolTimeoutError) as e:
+        logger.warning("Falling back to the primary database: %s", e)
+        yield from get_db_connection()
+        return
+    try:
+        yield metrics.instrument(conn)
     finally:
-        # 接続をプールに返す
-        if 'conn' in locals() and conn.is_connected():
-            conn.close()
-            # print("Connection returned to the pool.")
+        _release_connection(conn, replica=True)
+
+# リクエスト以外 (バックグラウンド処理) でプールの接続を使うためのコンテキストマネージャー
+@contextmanager
+def pooled_connection(replica: bool = False):
+    conn = _acquire_connection(replica)
+    try:
+        yield metrics.instrument(conn)
+    finally:
+        _release_connection(conn, replica)
+
+def replica_usable() -> bool:
+    """
+    レプリカの遅延がDB_REPLICA_MAX_LAG_SECONDS以下であればTrueを返します。
+    まだ確認していない場合や、最後の確認から時間が経っている (確認が止まっている) 場合はFalseを返します。
+    """
+    lag, checked_at = _replica_lag, _replica_checked_at
+    return (
+        lag is not None
+        and lag <= DB_REPLICA_MAX_LAG_SECONDS
+        and time.monotonic() - checked_at <= DB_REPLICA_LAG_CHECK_SECONDS * 3
+    )
+
+def check_replica_lag():
+    """レプリカの遅延 (Seconds_Behind_Source) を確認して記録します。レプリケーションが停止している場合はNoneです。"""
+    global _replica_lag, _replica_checked_at
+    lag = None
+    error = "replication is not running"
+    try:
+        with pooled_connection(replica=True) as db:
+            cursor = db.cursor(dictionary=True)
+            cursor.execute("SHOW REPLICA STATUS")
+            rows = cursor.fetchall()
+            cursor.close()
+        lags = [row["Seconds_Behind_Source"] for row in rows]
+        if lags and None not in lags:
+            lag = max(lags)
+    except (mysql.connector.Error, PoolTimeoutError) as e:
+        error = e
+    if lag is None and _replica_lag is not None:
+        logger.warning("Routing reads to the primary; replica lag is unknown: %s", error)
+    _replica_lag = lag
+    _replica_checked_at = time.monotonic()
+
+def _monitor_replica_lag(stop: threading.Event):
+    while not stop.is_set():
+        check_replica_lag()
+        stop.wait(DB_REPLICA_LAG_CHECK_SECONDS)
+
+
+class StickyPrimaryMiddleware:
+    """
+    書き込みのリクエスト (GET/HEAD/OPTIONS以外) の応答にCookieを付け、そのクライアントからの
+    読み取りをDB_STICKY_PRIMARY_SECONDSの間は主DBに送らせるASGIミドルウェア (レプリカを使う場合のみ)。
+    """
+
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in self.SAFE_METHODS or not replica_enabled():
+            await self.app(scope, receive, send)
+            return
+
+        cookie = (
+            f"{STICKY_PRIMARY_COOKIE}=1; Max-Age={DB_STICKY_PRIMARY_SECONDS}; Path=/; HttpOnly; SameSite=Lax"
+        ).encode()
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie)]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+def is_ready() -> bool:
+    """
+    DBに接続できる状態であればTrueを返します (readinessプローブ用)。
+    最後の接続の試行が成功していれば問い合わせずに返し、まだ接続していない・直前に失敗した場合のみ
+    (再試行の待ち時間が過ぎていれば) 接続を試みます。
+    """
+    pool = get_pool()
+    if pool.available:
+        return True
+    try:
+        with pooled_connection():
+            pass
+    except (mysql.connector.Error, PoolTimeoutError):
+        return False
+    return pool.available
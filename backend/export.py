@@ -0,0 +1,125 @@
+"""
+部品・在庫の一括エクスポート (CSV / NDJSON / Parquet)。
+
+crud.parts.iter_export_batches がバッファなしカーソルから読み出したチャンクを、
+順にエンコードしてバイト列として返します。件数に関わらずメモリ使用量は一定です。
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterable, Iterator, List
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON = "ndjson"
+FORMAT_PARQUET = "parquet"
+
+MEDIA_TYPES = {
+    FORMAT_CSV: "text/csv; charset=utf-8",
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_PARQUET: "application/vnd.apache.parquet",
+}
+
+# 出力する列 (crud.parts.iter_export_batches の列名と同じ順序)
+COLUMNS = ["id", "inventoryId", "pNum", "title", "categoryId", "category", "quantity", "imageUrl", "updatedAt"]
+
+# Parquetの圧縮方式
+PARQUET_COMPRESSION = "zstd"
+
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(batches: Iterable[List[dict]]) -> Iterator[bytes]:
+    """ヘッダー行に続けて、チャンクごとにCSVの行をまとめて返します。"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue().encode("utf-8")
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows([[_format_value(row[column]) for column in COLUMNS] for row in rows])
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_ndjson(batches: Iterable[List[dict]]) -> Iterator[bytes]:
+    for rows in batches:
+        lines = [
+            json.dumps({column: _format_value(row[column]) for column in COLUMNS}, ensure_ascii=False) + "\n"
+            for row in rows
+        ]
+        yield "".join(lines).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """書き込まれたバイト列を溜めておき、drain()で取り出せる出力先。書き込み位置はtell()で返します。"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_schema(pa):
+    return pa.schema([
+        ("id", pa.int64()),
+        ("inventoryId", pa.int64()),
+        ("pNum", pa.int64()),
+        ("title", pa.string()),
+        ("categoryId", pa.int64()),
+        ("category", pa.string()),
+        ("quantity", pa.int64()),
+        ("imageUrl", pa.string()),
+        ("updatedAt", pa.timestamp("s")),
+    ])
+
+
+def iter_parquet(batches: Iterable[List[dict]]) -> Iterator[bytes]:
+    """チャンクごとに1つの行グループとして書き込み、書き込まれた分のバイト列を順に返します。"""
+    # pyarrowはParquet形式で出力する場合のみ必要
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(pa)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression=PARQUET_COMPRESSION)
+    try:
+        for rows in batches:
+            columns = {column: [row[column] for row in rows] for column in COLUMNS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    # フッター (スキーマと行グループの位置情報) はclose時に書き込まれる
+    yield sink.drain()
+
+
+ENCODERS = {
+    FORMAT_CSV: iter_csv,
+    FORMAT_NDJSON: iter_ndjson,
+    FORMAT_PARQUET: iter_parquet,
+}
+
+
+def encode(batches: Iterable[List[dict]], fmt: str) -> Iterator[bytes]:
+    return ENCODERS[fmt](batches)
@@ -0,0 +1,317 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Set, Tuple
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+from PIL import Image, ImageOps
+
+# 画像の保存先と公開URL
+IMAGE_DIR = os.path.join("static", "images")
+THUMBNAIL_DIR = os.path.join(IMAGE_DIR, "thumbs")
+IMAGE_URL_PREFIX = "/static/images/"
+THUMBNAIL_URL_PREFIX = "/static/images/thumbs/"
+
+# アップロードの上限サイズと、ディスクへ書き込む単位
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 画像をアップロードするリクエスト (POST /parts, POST /parts/{id}/image) のパス
+UPLOAD_PATH = re.compile(r"^/parts(/\d+/image)?/?$")
+# マルチパートの境界やフォームの他の項目の分として、画像の上限に加えて受け付けるリクエストのバイト数
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# 一覧表示用サムネイルの最大辺のピクセル数と、生成を行うワーカー数
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+# 画像は内容のSHA-256をファイル名にして保存する (例: 3a7b...e9.jpg)
+CONTENT_ADDRESSED_NAME = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,10})?$")
+SAFE_EXTENSION = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+# 内容が変わらないファイル名のため、ブラウザやCDNに1年間キャッシュさせる
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 保存直後でまだDBに登録されていない画像を消さないよう、これより新しいファイルはGCの対象外とする
+GC_GRACE_SECONDS = 3600
+
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+# 削除した部品の画像を消すワーカー (1つのスレッドで順に処理する)
+_cleanup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-cleanup")
+
+logger = logging.getLogger("mast.images")
+
+# サムネイルが存在することを確認済みの画像のファイル名の拡張子を除いた部分 (一覧の表示ごとにファイルを確認しないため)
+_existing_thumbnails: Set[str] = set()
+
+
+class ImageTooLargeError(Exception):
+    """アップロードされた画像がMAX_UPLOAD_BYTESを超えた場合の例外"""
+
+
+def thumbnail_url(image_url: str) -> str:
+    """
+    画像URLに対応するサムネイル(WebP)のURLを返します。
+    このアプリで保存した画像以外や、サムネイルがまだ無い (生成中・生成前の既存画像) 場合は画像URLをそのまま返します。
+    """
+    if not image_url or not image_url.startswith(IMAGE_URL_PREFIX):
+        return image_url
+    stem = os.path.splitext(os.path.basename(image_url))[0]
+    if stem not in _existing_thumbnails:
+        if not os.path.exists(os.path.join(THUMBNAIL_DIR, f"{stem}.webp")):
+            return image_url
+        _existing_thumbnails.add(stem)
+    return f"{THUMBNAIL_URL_PREFIX}{stem}.webp"
+
+
+def receive_upload(upload: UploadFile) -> Tuple[str, str]:
+    """
+    アップロードされたファイルを一時ファイルへチャンク単位で書き込み、(一時ファイルのパス, SHA-256) を返します。
+    MAX_UPLOAD_BYTESを超えた時点で書き込みを中止し、ImageTooLargeErrorを送出します。
+    一時ファイルは保存先と同じディレクトリに作るため、store_uploadでの置き換えはアトミックに行われます。
+    """
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=IMAGE_DIR, prefix=".upload-", suffix=".tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = upload.file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise ImageTooLargeError(f"Image exceeds the maximum size of {MAX_UPLOAD_BYTES} bytes")
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest()
+
+
+def content_file_name(digest: str, original_name: str) -> str:
+    extension = os.path.splitext(original_name or "")[1].lower()
+    if not SAFE_EXTENSION.match(extension):
+        extension = ""
+    return f"{digest}{extension}"
+
+
+def store_upload(temp_path: str, file_name: str) -> str:
+    """
+    一時ファイルを保存先へリネームし、サムネイルの生成を予約して画像URLを返します。
+    同じ内容の画像が既に保存されている場合は、一時ファイルを捨てて既存のファイルを共有します。
+    """
+    file_path = os.path.join(IMAGE_DIR, file_name)
+    try:
+        # GCの猶予期間を延ばすため、既存のファイルの最終更新時刻を更新しておく
+        os.utime(file_path)
+    except FileNotFoundError:
+        # 存在しない (確認の直後にgc-imagesや削除した部品の画像の削除で消された場合も含む) 場合は保存する
+        os.replace(temp_path, file_path)
+    else:
+        os.remove(temp_path)
+    stem = os.path.splitext(file_name)[0]
+    if not os.path.exists(os.path.join(THUMBNAIL_DIR, f"{stem}.webp")):
+        _executor.submit(generate_thumbnail, file_path)
+    return f"{IMAGE_URL_PREFIX}{file_name}"
+
+
+def discard(path: str):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def generate_thumbnail(file_path: str):
+    """画像を縮小したWebPのサムネイルを作成し、そのパスを返します。失敗した場合はNoneを返します。"""
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    thumbnail_path = os.path.join(THUMBNAIL_DIR, f"{stem}.webp")
+    temp_path = None
+    try:
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        with Image.open(file_path) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(THUMBNAIL_SIZE)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            fd, temp_path = tempfile.mkstemp(dir=THUMBNAIL_DIR, prefix=".thumb-", suffix=".tmp")
+            with os.fdopen(fd, "wb") as buffer:
+                image.save(buffer, format="WEBP", quality=80)
+        os.replace(temp_path, thumbnail_path)
+        _existing_thumbnails.add(stem)
+        return thumbnail_path
+    except Exception as e:
+        logger.warning("Failed to generate thumbnail for %s: %s", file_path, e)
+        discard(temp_path)
+        return None
+
+
+def backfill_thumbnails() -> List[str]:
+    """サムネイルの無い保存済みの画像 (サムネイル導入前の画像など) のサムネイルを作成し、作成したパスのリストを返します。"""
+    if not os.path.isdir(IMAGE_DIR):
+        return []
+    created = []
+    for entry in sorted(os.scandir(IMAGE_DIR), key=lambda entry: entry.name):
+        if not entry.is_file() or not CONTENT_ADDRESSED_NAME.match(entry.name):
+            continue
+        stem = os.path.splitext(entry.name)[0]
+        if os.path.exists(os.path.join(THUMBNAIL_DIR, f"{stem}.webp")):
+            continue
+        thumbnail_path = generate_thumbnail(entry.path)
+        if thumbnail_path:
+            created.append(thumbnail_path)
+    return created
+
+
+def collect_garbage(referenced_urls: Iterable[str], dry_run: bool = False) -> List[str]:
+    """
+    どの部品からも参照されていない画像とサムネイル、書き込み途中で残った一時ファイルを削除し、
+    削除した (dry_runの場合は削除対象の) パスのリストを返します。
+    GC_GRACE_SECONDSより新しいファイルは、DBへの登録前の可能性があるため対象外とします。
+    """
+    referenced = {
+        os.path.basename(url) for url in referenced_urls if url and url.startswith(IMAGE_URL_PREFIX)
+    }
+    referenced_stems = {os.path.splitext(name)[0] for name in referenced}
+    cutoff = time.time() - GC_GRACE_SECONDS
+    removed = []
+
+    def sweep(directory: str, is_referenced):
+        if not os.path.isdir(directory):
+            return
+        for entry in os.scandir(directory):
+            if not entry.is_file() or is_referenced(entry.name) or entry.stat().st_mtime > cutoff:
+                continue
+            if not dry_run:
+                os.remove(entry.path)
+                _existing_thumbnails.discard(os.path.splitext(entry.name)[0])
+            removed.append(entry.path)
+
+    sweep(IMAGE_DIR, lambda name: name in referenced)
+    sweep(THUMBNAIL_DIR, lambda name: os.path.splitext(name)[0] in referenced_stems)
+    return removed
+
+
+def remove_unreferenced(image_urls: Iterable[str], find_referenced: Callable[[List[str]], Set[str]]) -> List[str]:
+    """
+    削除した部品の画像のうち、他の部品から参照されていないものとそのサムネイルを削除し、削除したパスのリストを返します。
+    同じ内容の画像は部品間で共有されるため、find_referenced(urls) で参照が残っているURLを確認してから削除します。
+    GC_GRACE_SECONDSより新しい画像は、登録中の部品が共有する可能性があるため残します (gc-imagesで削除されます)。
+    """
+    urls = sorted({url for url in image_urls if url and url.startswith(IMAGE_URL_PREFIX)})
+    if not urls:
+        return []
+    referenced = find_referenced(urls)
+    cutoff = time.time() - GC_GRACE_SECONDS
+    removed = []
+    for url in urls:
+        if url in referenced:
+            continue
+        name = os.path.basename(url)
+        image_path = os.path.join(IMAGE_DIR, name)
+        try:
+            if os.stat(image_path).st_mtime > cutoff:
+                continue
+        except FileNotFoundError:
+            pass
+        _existing_thumbnails.discard(os.path.splitext(name)[0])
+        for path in (image_path, os.path.join(THUMBNAIL_DIR, f"{os.path.splitext(name)[0]}.webp")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed.append(path)
+    return removed
+
+
+def _remove_unreferenced_in_background(image_urls: List[str], find_referenced):
+    try:
+        remove_unreferenced(image_urls, find_referenced)
+    except Exception:
+        # 残った画像は gc-images で削除される
+        logger.exception("Failed to remove images of deleted parts")
+
+
+def schedule_removal(image_urls: Iterable[str], find_referenced: Callable[[List[str]], Set[str]]):
+    """remove_unreferencedをバックグラウンドのワーカーで実行します (削除のリクエストを待たせない)。"""
+    image_urls = list(image_urls)
+    if image_urls:
+        _cleanup_executor.submit(_remove_unreferenced_in_background, image_urls, find_referenced)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    画像のアップロードで、リクエスト本文がMAX_UPLOAD_BYTES (とマルチパートの分) を超える場合に413を返すASGIミドルウェア。
+    フォームの解析では本文全体が一時ファイルに書き出されるため、Content-Lengthで解析前に拒否し、
+    Content-Lengthがない (チャンク転送の) 場合も受信したバイト数が上限を超えた時点で読み込みを中止します。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not UPLOAD_PATH.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        limit = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+        too_large = JSONResponse(
+            {"detail": f"Image exceeds the maximum size of {MAX_UPLOAD_BYTES} bytes"}, status_code=413
+        )
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            await too_large(scope, receive, send)
+            return
+
+        state = {"received": 0, "exceeded": False, "started": False}
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > limit:
+                    state["exceeded"] = True
+                    raise ImageTooLargeError(f"Image exceeds the maximum size of {MAX_UPLOAD_BYTES} bytes")
+            return message
+
+        async def guarded_send(message):
+            if message["type"] == "http.response.start":
+                if state["started"]:
+                    return
+                state["started"] = True
+                if state["exceeded"]:
+                    # 読み込みを中止した場合は、アプリの応答 (本文の解析エラー) の代わりに413を返す
+                    await too_large(scope, receive, send)
+                    return
+            elif state["exceeded"]:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except ImageTooLargeError:
+            if not state["started"]:
+                state["started"] = True
+                await too_large(scope, receive, send)
+
+
+class ImageStaticFiles(StaticFiles):
+    """内容のハッシュをファイル名とする画像に、変更されないことを示すCache-Controlを付けて配信します。"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        name = os.path.basename(full_path)
+        stem = os.path.splitext(name)[0]
+        if CONTENT_ADDRESSED_NAME.match(name) or CONTENT_ADDRESSED_NAME.match(stem):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+def shutdown():
+    _executor.shutdown(wait=False)
+    _cleanup_executor.shutdown(wait=False)
@@ -0,0 +1,298 @@
+"""
+在庫の増減イベント (バーコードの読み取りなど) を高頻度で受け付けるための取り込みログ。
+
+受け付けたイベントはローカルの追記専用ファイルに書き込み、fsyncした時点で応答します
+(同時に届いた書き込みは1回のfsyncにまとめます)。DBへの反映はバックグラウンドのタスクが
+INGEST_FLUSH_SECONDSごとに行い、その間に溜まったイベントを1つのトランザクションでまとめて反映します
+(同じ在庫へのイベントは1回のUPDATEにまとめられるため、コミットの回数がイベント数に比例しません)。
+
+反映済みの連番はDB (Ingest_Log_Positions) に在庫の更新と同じトランザクションで記録するため、
+クラッシュ後の起動時にログに残っているイベントを再生しても、同じイベントが二重に反映されることはありません。
+1回の追記は1行 ({"seq": 最初の連番, "events": [[在庫ID, 増減], ...]}) として書くため、
+書き込み中に停止した場合も、応答していない追記が途中まで反映されることはありません。
+ログはINGEST_LOG_COMPACT_BYTESを超えると、未反映のイベントだけを残して書き直します。
+
+ログは1つのプロセスだけが使えます (複数のワーカーで起動する場合は無効にしてください)。
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import orjson
+from anyio import to_thread
+from crud.inventory import EVENT_ALREADY_APPLIED
+
+INGEST_ENABLED = os.getenv("INGEST_ENABLED", "false").lower() == "true"
+INGEST_LOG_PATH = os.getenv("INGEST_LOG_PATH", "ingest/inventory_adjustments.log")
+# DBへ反映する間隔と、1回のトランザクションで反映するイベントの上限
+INGEST_FLUSH_SECONDS = float(os.getenv("INGEST_FLUSH_SECONDS", "0.05"))
+INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "5000"))
+# ログを書き直す大きさ (バイト)
+INGEST_LOG_COMPACT_BYTES = int(os.getenv("INGEST_LOG_COMPACT_BYTES", str(1024 * 1024)))
+# 処理結果を保持するイベントの数 (これより古いイベントは結果の代わりにRESULT_UNKNOWNを返す)
+RESULT_RETENTION = 100000
+# 反映済みだが、結果を保持していないイベント (再起動前に反映されたものなど)
+RESULT_UNKNOWN = EVENT_ALREADY_APPLIED
+# DBへの反映に失敗した後、再び試みるまでの秒数
+RETRY_SECONDS = 1.0
+
+logger = logging.getLogger("mast.ingest")
+
+# (連番, 在庫ID, 増減)
+Event = Tuple[int, int, int]
+
+
+class IngestLog:
+    """
+    apply_events(log_id, events) は、イベントを連番順にDBへ反映し、連番ごとの結果を返す同期関数です
+    (スレッドプールで実行します)。ログの再生で渡された反映済みのイベントは、反映せずに読み飛ばす必要があります。
+    """
+
+    def __init__(
+        self,
+        apply_events: Callable[[str, List[Event]], Dict[int, str]],
+        path: str = INGEST_LOG_PATH,
+        flush_seconds: float = INGEST_FLUSH_SECONDS,
+        max_batch: int = INGEST_MAX_BATCH,
+        compact_bytes: int = INGEST_LOG_COMPACT_BYTES,
+    ):
+        self._apply_events = apply_events
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self.compact_bytes = compact_bytes
+        # 追記・連番の採番・未反映のイベントを守るロックと、同時に届いた書き込みのfsyncをまとめるロック
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._lock_fd: Optional[int] = None
+        # ファイルを作り直した場合に、DBに記録した別のログの反映位置と混同しないためのID
+        self.log_id = ""
+        self._next_seq = 1
+        # fsync済みの最後の連番と、DBへの反映を終えた最後の連番
+        self._synced_seq = 0
+        self._applied_seq = 0
+        self._pending: List[Event] = []
+        self._results: "OrderedDict[int, str]" = OrderedDict()
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._fd is not None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def open(self):
+        """ログを開き、残っているイベントを未反映として読み込みます (ファイルがなければ作成します)。"""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # 同じログを別のプロセスが使っていないことを確認する
+        self._lock_fd = os.open(self.path + ".lock", os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            raise RuntimeError(f"Ingest log {self.path} is in use by another process")
+
+        if not os.path.exists(self.path):
+            self.log_id = uuid.uuid4().hex
+            self._write_file(self.path, [], 1)
+        else:
+            self._recover()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        self._synced_seq = self._next_seq - 1
+        self._applied_seq = self._pending[0][0] - 1 if self._pending else self._next_seq - 1
+        if self._pending:
+            logger.info("Replaying %d ingested events from %s", len(self._pending), self.path)
+
+    def _recover(self):
+        with open(self.path, "rb") as f:
+            lines = f.read().split(b"\n")
+        header = orjson.loads(lines[0])
+        self.log_id = header["log_id"]
+        self._next_seq = header["next_seq"]
+        valid_bytes = len(lines[0]) + 1
+        for index, line in enumerate(lines[1:], start=1):
+            if not line:
+                continue
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # 書き込み中に停止した最後の行は、応答していない追記のため捨てる
+                if index == len(lines) - 1:
+                    logger.warning("Discarding a partially written record at the end of %s", self.path)
+                    break
+                raise
+            events = [
+                (record["seq"] + offset, inventory_id, delta)
+                for offset, (inventory_id, delta) in enumerate(record["events"])
+            ]
+            self._pending.extend(events)
+            self._next_seq = max(self._next_seq, events[-1][0] + 1)
+            valid_bytes += len(line) + 1
+        if valid_bytes < os.path.getsize(self.path):
+            os.truncate(self.path, valid_bytes)
+
+    @staticmethod
+    def _encode(events: Sequence[Event]) -> bytes:
+        """連番が連続するイベントを1行にします。"""
+        record = {"seq": events[0][0], "events": [[inventory_id, delta] for _, inventory_id, delta in events]}
+        return orjson.dumps(record) + b"\n"
+
+    def _write_file(self, path: str, events: Sequence[Event], next_seq: int):
+        """先頭にログのIDと次の連番を書いたファイルを作り、fsyncしてから置き換えます。"""
+        header = orjson.dumps({"log_id": self.log_id, "next_seq": next_seq}) + b"\n"
+        tmp_path = path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            # 書き直す場合は未反映のイベントを1件ずつの行にする
+            _write_all(fd, header + b"".join(self._encode([event]) for event in events))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+        # ファイル名の置き換えを確実に残す
+        dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def append(self, items: Sequence[Tuple[int, int]]) -> List[int]:
+        """
+        (在庫ID, 増減) をログに追記し、fsyncしてから連番のリストを返します。
+        戻った時点でイベントは失われず、後でDBに反映されます。
+        """
+        if self._fd is None:
+            raise RuntimeError("Ingest log is not open")
+        if not items:
+            return []
+        with self._lock:
+            first = self._next_seq
+            events = [(first + offset, inventory_id, delta) for offset, (inventory_id, delta) in enumerate(items)]
+            _write_all(self._fd, self._encode(events))
+            self._next_seq += len(events)
+            self._pending.extend(events)
+        self._sync(events[-1][0])
+        return [seq for seq, _, _ in events]
+
+    def _sync(self, seq: int):
+        # fsyncの間に追記された分も、次にロックを取ったスレッドがまとめてfsyncする
+        with self._sync_lock:
+            if self._synced_seq >= seq:
+                return
+            with self._lock:
+                target = self._next_seq - 1
+                fd = self._fd
+            os.fsync(fd)
+            self._synced_seq = target
+
+    async def start(self):
+        """ログを開いて、DBへの反映を始めます。"""
+        if not self.is_open:
+            await to_thread.run_sync(self.open)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """DBへの反映を止めます。未反映のイベントはログに残り、次の起動時に反映されます。"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _run(self):
+        while True:
+            try:
+                applied = await self.flush()
+            except Exception as e:
+                logger.warning("Failed to apply ingested events (retrying in %.1f seconds): %s", RETRY_SECONDS, e)
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+            # 上限まで溜まっていた場合は、待たずに続きを反映する
+            if applied < self.max_batch:
+                await asyncio.sleep(self.flush_seconds)
+
+    async def flush(self) -> int:
+        """fsync済みの未反映のイベントを最大max_batch件反映し、反映した件数を返します。"""
+        with self._lock:
+            batch = [event for event in self._pending[:self.max_batch] if event[0] <= self._synced_seq]
+        if not batch:
+            return 0
+        results = await to_thread.run_sync(self._apply_events, self.log_id, batch)
+        with self._lock:
+            del self._pending[:len(batch)]
+        self._applied_seq = batch[-1][0]
+        for seq, _, _ in batch:
+            self._results[seq] = results.get(seq, RESULT_UNKNOWN)
+        while len(self._results) > RESULT_RETENTION:
+            self._results.popitem(last=False)
+        for seq in [seq for seq in self._waiters if seq <= self._applied_seq]:
+            for future in self._waiters.pop(seq):
+                if not future.done():
+                    future.set_result(self._results.get(seq, RESULT_UNKNOWN))
+        if os.fstat(self._fd).st_size >= self.compact_bytes:
+            await to_thread.run_sync(self._compact)
+        return len(batch)
+
+    def _compact(self):
+        """未反映のイベントだけを残してログを書き直します。"""
+        with self._sync_lock, self._lock:
+            self._write_file(self.path, self._pending, self._next_seq)
+            os.close(self._fd)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            # 書き直したファイルはfsync済みのため、未反映のイベントはすべて失われない
+            self._synced_seq = self._next_seq - 1
+
+    def result(self, seq: int) -> Optional[str]:
+        """反映済みのイベントの結果を返します。まだ反映されていない場合はNoneを返します。"""
+        if seq < 1 or seq >= self._next_seq:
+            raise KeyError(seq)
+        if seq > self._applied_seq:
+            return None
+        return self._results.get(seq, RESULT_UNKNOWN)
+
+    async def wait(self, seq: int, timeout: float) -> Optional[str]:
+        """
+        イベントがDBに反映されるまで最大timeout秒待ち、結果を返します。
+        時間内に反映されなかった場合はNoneを返し、存在しない連番の場合はKeyErrorを送出します。
+        """
+        result = self.result(seq)
+        if result is not None:
+            return result
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(seq, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(seq)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[seq]
+
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
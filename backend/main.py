@@ -1,15 +1,48 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from anyio import to_thread
 from routers import inventory, parts, category
+import database
+import ingest
+from cache import cache
+import images
+import metrics
 import os
 
-app = FastAPI()
+# 同期エンドポイントを実行するスレッドプールの大きさ
+# DB接続の空き待ちはスレッド上で行われるため、接続プールより大きくしておく
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "200"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # DBへの接続はバックグラウンドで行い、接続の完了を待たずにリクエストを受け付ける
+    database.start_pool()
+    # 取り込みログに残っている未反映のイベントは、ここで開始するタスクが反映する
+    if ingest.INGEST_ENABLED:
+        await inventory.ingest_log.start()
+    yield
+    await inventory.ingest_log.stop()
+    database.stop_pool()
+    images.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+# ルートごとのレイテンシーとクエリ時間を記録する (METRICS_ENABLED=false で無効)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# レプリカを使う場合、書き込みを行ったクライアントの読み取りをしばらく主DBに送る
+app.add_middleware(database.StickyPrimaryMiddleware)
+
+# 上限を超える画像のアップロードは、本文を受信・解析する前に拒否する
+app.add_middleware(images.UploadSizeLimitMiddleware)
 
 # 静的ファイル用のディレクトリが存在することを確認
 os.makedirs("static/images", exist_ok=True)
 
-# 静的ファイルのマウント
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# 静的ファイルのマウント (内容のハッシュ名の画像には長期キャッシュ用のヘッダーを付ける)
+app.mount("/static", images.ImageStaticFiles(directory="static"), name="static")
 
 # ルーターを登録
 app.include_router(inventory.router)
@@ -20,4 +53,33 @@ app.include_router(category.router)
 def read_root():
     return {"message": "Hello from FastAPI!"}
 
+# 接続プールの利用状況 (使用率・待ち時間・タイムアウト回数) を返します
+@app.get("/db/pool-stats")
+def read_pool_stats():
+    return database.get_pool_stats()
+
+# プロセスが応答できるか (livenessプローブ用)。DBの状態に関わらず200を返し、DB停止時の再起動を防ぐ
+@app.get("/health/live")
+async def read_liveness():
+    return {"status": "ok"}
+
+# DBに接続できるか (readinessプローブ用)。接続できない間は503を返し、振り分けの対象から外させる
+@app.get("/health/ready")
+def read_readiness():
+    if not database.is_ready():
+        return JSONResponse(status_code=503, content={"status": "unavailable"})
+    return {"status": "ok"}
+
+# 読み取りキャッシュのヒット・ミス回数を返します
+@app.get("/cache/stats")
+def read_cache_stats():
+    return cache.stats()
+
+# レイテンシー・クエリ時間・接続プールの状態をPrometheus形式で返します
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # 接続に失敗した場合、関連するエンドポイントは503エラーを返します。
@@ -0,0 +1,279 @@
+"""
+リクエスト・クエリ単位の計測と、Prometheus形式での出力。
+
+- MetricsMiddleware: ルートごとのレイテンシーをヒストグラムに記録し、
+  Server-Timingヘッダーで DB (クエリ実行) / pool (接続の空き待ち) / app (それ以外) の内訳を返します。
+- instrument(): DB接続をラップし、カーソルが実行したクエリの時間と行数を記録します。
+  SLOW_QUERY_SECONDSを超えたクエリはSQL文とともにログへ出力します。
+
+METRICS_ENABLED=false の場合は接続のラップとミドルウェアでの計測を行いません。
+"""
+import bisect
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+# スローログに出力するSQL文の最大文字数
+SLOW_QUERY_MAX_SQL_LENGTH = 2000
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_query_logger = logging.getLogger("mast.slow_query")
+
+
+class Histogram:
+    """ラベルの組み合わせごとに、累積バケット・合計・件数を保持するヒストグラム"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [バケットごとの件数 (+Inf を含む), 合計]
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labels, value in snapshot:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route", ["method", "route", "status"]
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds", "Time spent executing queries per HTTP request", ["method", "route"]
+)
+QUERY_LATENCY = Histogram("db_query_duration_seconds", "Latency of SQL statements", ["operation"])
+QUERY_ROWS = Counter("db_query_rows_total", "Rows fetched or affected by SQL statements", ["operation"])
+SLOW_QUERIES = Counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_SECONDS", ["operation"])
+POOL_WAIT = Histogram("db_pool_wait_seconds", "Time spent waiting for a pooled connection", [])
+
+# 出力時に値を取得するゲージ (名前, 説明, 値を返す関数)
+_gauges: List[Tuple[str, str, Callable[[], float]]] = []
+
+
+def register_gauge(name: str, documentation: str, callback: Callable[[], float]):
+    _gauges.append((name, documentation, callback))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in (REQUEST_LATENCY, REQUEST_DB_TIME, QUERY_LATENCY, QUERY_ROWS, SLOW_QUERIES, POOL_WAIT):
+        lines.extend(metric.render())
+    for name, documentation, callback in _gauges:
+        lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {callback()}"])
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimings:
+    """1リクエスト中のクエリ実行時間と接続の待ち時間の合計"""
+
+    __slots__ = ("db_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+
+# 同期エンドポイントはスレッドプールで実行されるが、コンテキストはコピーされるため同じオブジェクトを参照できる
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+_OPERATION = re.compile(r"^\s*(\w+)")
+_KNOWN_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _operation(sql: str) -> str:
+    match = _OPERATION.match(sql)
+    operation = match.group(1).upper() if match else ""
+    return operation if operation in _KNOWN_OPERATIONS else "OTHER"
+
+
+def observe_pool_wait(seconds: float):
+    if not METRICS_ENABLED:
+        return
+    POOL_WAIT.observe((), seconds)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.pool_wait_seconds += seconds
+
+
+class TimedCursor:
+    """execute()の時間と、取得・更新した行数を記録するカーソルのラッパー"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._operation = "OTHER"
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._operation = _operation(operation)
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            QUERY_LATENCY.observe((self._operation,), elapsed)
+            timings = _current_timings.get()
+            if timings is not None:
+                timings.db_seconds += elapsed
+            if self._operation != "SELECT":
+                QUERY_ROWS.inc((self._operation,), max(self._cursor.rowcount or 0, 0))
+            if elapsed >= SLOW_QUERY_SECONDS:
+                SLOW_QUERIES.inc((self._operation,))
+                sql = _WHITESPACE.sub(" ", operation).strip()[:SLOW_QUERY_MAX_SQL_LENGTH]
+                slow_query_logger.warning("Slow query (%.3fs): %s", elapsed, sql)
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        elapsed = time.perf_counter() - start
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.db_seconds += elapsed
+        return result
+
+    def fetchone(self):
+        row = self._timed_fetch(self._cursor.fetchone)
+        if row is not None:
+            QUERY_ROWS.inc((self._operation,))
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._timed_fetch(self._cursor.fetchmany, size)
+        QUERY_ROWS.inc((self._operation,), len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_fetch(self._cursor.fetchall)
+        QUERY_ROWS.inc((self._operation,), len(rows))
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+
+class InstrumentedConnection:
+    """cursor()がTimedCursorを返すDB接続のラッパー。それ以外の操作は元の接続に委譲します。"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def instrument(connection):
+    if not METRICS_ENABLED:
+        return connection
+    return InstrumentedConnection(connection)
+
+
+class MetricsMiddleware:
+    """ルートごとのレイテンシーを記録し、Server-Timingヘッダーに内訳を付けるASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total_ms = (time.perf_counter() - start) * 1000
+                db_ms = timings.db_seconds * 1000
+                pool_ms = timings.pool_wait_seconds * 1000
+                app_ms = max(total_ms - db_ms - pool_ms, 0.0)
+                header = f"db;dur={db_ms:.1f}, pool;dur={pool_ms:.1f}, app;dur={app_ms:.1f}"
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
+            # ルートのパターン (例: /parts/{parts_id}) をラベルにして、系列の数を抑える
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "<unmatched>"
+            method = scope["method"]
+            REQUEST_LATENCY.observe((method, route_label, str(status)), time.perf_counter() - start)
+            REQUEST_DB_TIME.observe((method, route_label), timings.db_seconds)
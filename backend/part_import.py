@@ -0,0 +1,158 @@
+"""
+部品の一括登録 (CSV / JSONL)。
+
+ファイルを1行ずつ読み込みながら検証し、IMPORT_CHUNK_SIZE行ごとに
+crud.parts.bulk_create で複数行INSERTとしてまとめて登録します。
+不正な行はエラーとして記録し、ファイル全体の登録は中断しません。
+
+CSVのヘッダー / JSONLのキー: title, category (カテゴリー名) または category_id, quantity, p_num
+"""
+import csv
+import json
+from typing import IO, Dict, Iterator, List, Optional, Set, Tuple
+import mysql.connector
+from pydantic import ValidationError
+import schemas
+from crud import category as crud_category
+from crud import parts as crud_parts
+
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+
+# 1トランザクションで登録する行数
+IMPORT_CHUNK_SIZE = 1000
+# レスポンスに含める行エラーの上限
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def add_error(self, line: int, error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def to_dict(self) -> dict:
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def detect_format(file_name: Optional[str], content_type: Optional[str] = None) -> str:
+    name = (file_name or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or (content_type or "").endswith(("jsonl", "ndjson")):
+        return FORMAT_JSONL
+    return FORMAT_CSV
+
+
+def _decode_lines(stream: IO[bytes]) -> Iterator[str]:
+    # SpooledTemporaryFileはPython 3.9ではTextIOWrapperで包めないため、行ごとにデコードする
+    for index, raw in enumerate(stream):
+        yield raw.decode("utf-8-sig" if index == 0 else "utf-8")
+
+
+def parse_rows(stream: IO[bytes], fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """バイナリストリームを1行ずつ解析し、(行番号, 行の内容, 解析エラー) を返します。"""
+    text = _decode_lines(stream)
+    if fmt == FORMAT_JSONL:
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "Each line must be a JSON object"
+                continue
+            yield line_no, record, None
+    else:
+        reader = csv.DictReader(text)
+        for record in reader:
+            # ヘッダーが1行目のため、データ行の行番号はreader.line_numで数える
+            cleaned = {key: value for key, value in record.items() if key and value not in (None, "")}
+            yield reader.line_num, cleaned, None
+
+
+def _validate(record: dict, category_ids: Dict[str, int], known_ids: Set[int]) -> Tuple[Optional[tuple], Optional[str]]:
+    try:
+        row = schemas.PartImportRow(**record)
+    except ValidationError as e:
+        messages = "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+        return None, messages
+    if row.category_id is not None:
+        if row.category_id not in known_ids:
+            return None, f"Unknown category_id: {row.category_id}"
+        c_id = row.category_id
+    elif row.category is not None:
+        c_id = category_ids.get(row.category)
+        if c_id is None:
+            return None, f"Unknown category: {row.category}"
+    else:
+        return None, "category or category_id is required"
+    return (c_id, row.p_num, row.title, row.quantity), None
+
+
+def _insert_chunk(db: mysql.connector.MySQLConnection, chunk: List[Tuple[int, tuple]], result: ImportResult):
+    # 型番の重複は、既存の部品とチャンク内の両方を事前に確認する
+    existing = crud_parts.find_existing_p_nums(db, [row[1] for _, row in chunk if row[1] is not None])
+    seen = set()
+    valid = []
+    for line_no, row in chunk:
+        p_num = row[1]
+        if p_num is not None and (p_num in existing or p_num in seen):
+            result.add_error(line_no, f"Duplicate p_num: {p_num}")
+            continue
+        if p_num is not None:
+            seen.add(p_num)
+        valid.append((line_no, row))
+    if not valid:
+        return
+
+    try:
+        crud_parts.bulk_create(db, [row for _, row in valid])
+        result.imported += len(valid)
+    except mysql.connector.Error:
+        # 同時に登録された型番などでチャンク全体が失敗した場合は、1行ずつ登録してエラー行を特定する
+        for line_no, row in valid:
+            try:
+                crud_parts.bulk_create(db, [row])
+                result.imported += 1
+            except mysql.connector.Error as e:
+                result.add_error(line_no, f"Database error: {e.msg}")
+
+
+def import_parts(
+    db: mysql.connector.MySQLConnection,
+    stream: IO[bytes],
+    fmt: str = FORMAT_CSV,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> ImportResult:
+    """ストリームから部品を読み込み、chunk_size行ごとのトランザクションで登録します。"""
+    # カテゴリー名は最初に1回だけ解決する
+    category_ids = crud_category.get_id_map(db)
+    known_ids = set(category_ids.values())
+    db.commit()
+    result = ImportResult()
+    chunk: List[Tuple[int, tuple]] = []
+    for line_no, record, error in parse_rows(stream, fmt):
+        if error is None:
+            row, error = _validate(record, category_ids, known_ids)
+        if error is not None:
+            result.add_error(line_no, error)
+            continue
+        chunk.append((line_no, row))
+        if len(chunk) >= chunk_size:
+            _insert_chunk(db, chunk, result)
+            chunk = []
+    if chunk:
+        _insert_chunk(db, chunk, result)
+    return result
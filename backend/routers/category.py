@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import List
 import mysql.connector
 import schemas
 from crud import category as crud_category
-from database import get_db_connection
+from crud import low_stock as crud_low_stock
+from crud import summary as crud_summary
+from crud import versions as crud_versions
+from conditional import make_etag, is_not_modified, not_modified_response, set_etag
+from database import get_db_connection, get_read_db_connection
 
 router = APIRouter(
     prefix="/categories",
@@ -11,11 +15,47 @@ router = APIRouter(
 )
 
 @router.get("", response_model=List[schemas.Category])
-def get_categories_data(db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
+def get_categories_data(request: Request, response: Response, db: mysql.connector.MySQLConnection = Depends(get_read_db_connection)):
     if db is None:
         raise HTTPException(status_code=503, detail="Database connection failed")
     try:
-        categories = crud_category.get_all(db)
+        # カテゴリーが変更されていなければ、一覧を取得せずに304を返す
+        version = crud_versions.get(db, crud_versions.TABLE_CATEGORY)
+        etag = make_etag("categories", version)
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
+        categories = crud_category.get_all(db, version)
+        set_etag(response, etag)
         return categories
     except mysql.connector.Error as e:
         raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+
+# カテゴリーごとの部品数・合計数量・在庫0の部品数 (書き込み時に更新される集計表から返す)
+@router.get("/summary", response_model=List[schemas.CategorySummary])
+def get_categories_summary(request: Request, response: Response, db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    try:
+        version = crud_versions.get(
+            db, crud_versions.TABLE_PARTS, crud_versions.TABLE_INVENTORY, crud_versions.TABLE_CATEGORY
+        )
+        etag = make_etag("categories-summary", version)
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
+        summaries = crud_summary.get_all(db)
+        set_etag(response, etag)
+        return summaries
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+
+# カテゴリー内の在庫に共通の発注点 (在庫ごとに発注点を設定していない場合に使われる)
+@router.put("/{category_id}/reorder-point")
+def update_default_reorder_point(category_id: int, item: schemas.ReorderPointUpdate, db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    try:
+        if not crud_low_stock.set_category_default(db, category_id, item.reorder_point):
+            raise HTTPException(status_code=404, detail="Category not found")
+        return {"message": "Reorder point updated successfully", "category_id": category_id, "reorder_point": item.reorder_point}
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
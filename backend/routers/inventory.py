@@ -1,27 +1,224 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
 import mysql.connector
+import orjson
 import schemas
+import change_feed
+import ingest
+import metrics
+from crud import changes as crud_changes
 from crud import inventory as crud_inventory
-from database import get_db_connection
+from crud import low_stock as crud_low_stock
+from database import get_db_connection, pooled_connection
 
 router = APIRouter(
     prefix="/inventory",
     tags=["inventory"],
 )
 
+# 変更フィードがスレッドプール上で使う問い合わせ (リクエストとは別にプールから接続を借りる)
+def _fetch_changes_since(after_id: int):
+    with pooled_connection() as db:
+        return crud_changes.get_since(db, after_id)
+
+def _fetch_changes_by_ids(change_ids: List[int]):
+    with pooled_connection() as db:
+        return crud_changes.get_by_ids(db, change_ids)
+
+def _fetch_change_bounds():
+    with pooled_connection() as db:
+        return crud_changes.get_bounds(db)
+
+feed = change_feed.ChangeFeed(_fetch_changes_since, _fetch_changes_by_ids, _fetch_change_bounds)
+
+# 取り込みログのイベントをDBに反映する (バックグラウンドのタスクからスレッドプール上で呼ばれる)
+def _apply_ingested_events(log_id: str, events: List[ingest.Event]):
+    with pooled_connection() as db:
+        return crud_inventory.apply_adjustment_events(db, log_id, events)
+
+ingest_log = ingest.IngestLog(_apply_ingested_events)
+
+metrics.register_gauge(
+    "ingest_pending_events", "Ingested inventory events not yet applied to the database",
+    lambda: ingest_log.pending_count,
+)
+
+# 取り込んだイベントの反映を待つ最大秒数
+MAX_INGEST_WAIT_SECONDS = 30
+
+# 接続が切れた場合に、ブラウザが再接続するまでの待ち時間 (ミリ秒)
+SSE_RETRY_MILLISECONDS = 3000
+
+async def _sse_events(first, subscription):
+    yield f"retry: {SSE_RETRY_MILLISECONDS}\n\n".encode()
+    # 遅れてコミットされた変更はIDが小さいため、再接続の位置が戻らないようidは増えた場合のみ送る
+    max_id = -1
+    async for name, event_id, data in _chain(first, subscription):
+        if name == change_feed.EVENT_HEARTBEAT:
+            yield b": keep-alive\n\n"
+            continue
+        lines = []
+        if event_id is not None and event_id > max_id:
+            max_id = event_id
+            lines.append(f"id: {event_id}".encode())
+        lines.append(f"event: {name}".encode())
+        payload = {key: value for key, value in data.items() if key != "id"} if data else {}
+        lines.append(b"data: " + orjson.dumps(payload))
+        yield b"\n".join(lines) + b"\n\n"
+
+async def _chain(first, rest):
+    yield first
+    async for item in rest:
+        yield item
+
+# 在庫の変更 ({inventoryId, partsId, quantity, op}) をServer-Sent Eventsで配信する
+# 再接続時はLast-Event-IDヘッダー (またはlast_event_id) 以降の変更を再送し、再送できない場合はresetを送る
+@router.get("/changes/stream")
+async def stream_inventory_changes(request: Request, last_event_id: Optional[int] = Query(None, ge=0)):
+    header = request.headers.get("last-event-id")
+    if header:
+        try:
+            last_event_id = int(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    subscription = feed.subscribe(last_event_id)
+    try:
+        # 変更履歴を読めない場合はレスポンスを開始する前に503を返す
+        first = await subscription.__anext__()
+    except Exception as e:
+        await subscription.aclose()
+        raise HTTPException(status_code=503, detail=f"Change feed unavailable: {e}")
+    return StreamingResponse(
+        _sse_events(first, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# SSEを使えないクライアント向けに、after_idより後の変更を返す
+@router.get("/changes")
+def get_inventory_changes(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(crud_changes.CHANGE_PAGE_SIZE, ge=1, le=crud_changes.CHANGE_PAGE_SIZE),
+    db: mysql.connector.MySQLConnection = Depends(get_db_connection)
+):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    try:
+        rows = crud_changes.get_since(db, after_id, limit)
+        return {"changes": rows, "last_id": rows[-1]["id"] if rows else after_id}
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+
+# 発注点を下回っている在庫の一覧。next_after_idを after_id に指定して次のページを取得する
+@router.get("/low-stock")
+def get_low_stock(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(crud_low_stock.LOW_STOCK_PAGE_SIZE, ge=1, le=crud_low_stock.MAX_LOW_STOCK_PAGE_SIZE),
+    category_id: Optional[int] = None,
+    db: mysql.connector.MySQLConnection = Depends(get_db_connection)
+):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    try:
+        # 次ページの有無を判定するため1件多く取得する
+        rows = crud_low_stock.get_page(db, after_id, limit + 1, category_id)
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+    items = rows[:limit]
+    next_after_id = items[-1]["inventoryId"] if len(rows) > limit else None
+    return {"items": items, "next_after_id": next_after_id}
+
+# 在庫の増減イベントを取り込みログに追記し、DBへの反映を待たずに応答する (INGEST_ENABLED=true の場合のみ)
+# 反映はバックグラウンドでまとめて行う。返された連番を GET /inventory/ingest/{seq} に指定すると結果を受け取れる
+@router.post("/ingest", status_code=202)
+def ingest_inventory_events(items: List[schemas.BatchInventoryAdjustItem]):
+    if not ingest_log.is_open:
+        raise HTTPException(status_code=503, detail="Ingestion is disabled")
+    try:
+        seqs = ingest_log.append([(item.id, item.delta) for item in items])
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Ingest log write error: {e}")
+    return {
+        "accepted": len(seqs),
+        "first_seq": seqs[0] if seqs else None,
+        "last_seq": seqs[-1] if seqs else None,
+    }
+
+# 取り込んだイベントがDBに反映されるまで最大timeout秒待ち、結果 (applied / not_found / insufficient) を返す
+# 時間内に反映されなかった場合は202を返す
+@router.get("/ingest/{seq}")
+async def wait_for_ingested_event(seq: int, timeout: float = Query(0, ge=0, le=MAX_INGEST_WAIT_SECONDS)):
+    if not ingest_log.is_open:
+        raise HTTPException(status_code=503, detail="Ingestion is disabled")
+    try:
+        result = await ingest_log.wait(seq, timeout)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if result is None:
+        return JSONResponse(status_code=202, content={"seq": seq, "applied": False})
+    return {"seq": seq, "applied": True, "result": result}
+
 @router.put("/batch")
 def update_batch_inventory(items: List[schemas.BatchInventoryUpdateItem], db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
     if db is None:
         raise HTTPException(status_code=503, detail="Database connection failed")
     try:
-        crud_inventory.update_batch_items(db, items)
-        return {"message": "Inventory updated successfully"}
+        version, not_found, conflicts = crud_inventory.update_batch_items(db, items)
+        return {
+            "message": "Inventory updated successfully",
+            "updated": len({item.id for item in items}) - len(not_found) - len(conflicts),
+            "version": version,
+            "not_found": not_found,
+            "conflicts": conflicts,
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+
+# 在庫数量の相対的な増減。/{inventory_id}/adjust より先に定義する必要がある
+@router.post("/batch/adjust")
+def adjust_batch_inventory(items: List[schemas.BatchInventoryAdjustItem], db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    try:
+        new_quantities, not_found = crud_inventory.adjust_batch_items(db, items)
+        return {
+            "message": "Inventory adjusted successfully",
+            "items": [{"id": inventory_id, "quantity": quantity} for inventory_id, quantity in new_quantities.items()],
+            "not_found": not_found,
+        }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except mysql.connector.Error as e:
         raise HTTPException(status_code=500, detail=f"Database query error: {e}")
 
+@router.post("/{inventory_id}/adjust")
+def adjust_inventory(inventory_id: int, item: schemas.InventoryAdjustment, db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    try:
+        new_quantity = crud_inventory.adjust_item(db, inventory_id, item.delta)
+        if new_quantity is None:
+            raise HTTPException(status_code=404, detail="Inventory item not found")
+        return {"message": "Inventory adjusted successfully", "inventory_id": inventory_id, "new_quantity": new_quantity}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+
+@router.put("/{inventory_id}/reorder-point")
+def update_reorder_point(inventory_id: int, item: schemas.ReorderPointUpdate, db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    try:
+        if not crud_low_stock.set_reorder_point(db, inventory_id, item.reorder_point):
+            raise HTTPException(status_code=404, detail="Inventory item not found")
+        return {"message": "Reorder point updated successfully", "inventory_id": inventory_id, "reorder_point": item.reorder_point}
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+
 @router.put("/{inventory_id}")
 def update_inventory(inventory_id: int, item: schemas.InventoryUpdate, db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
     if db is None:
@@ -30,9 +227,15 @@ def update_inventory(inventory_id: int, item: schemas.InventoryUpdate, db: mysql
         raise HTTPException(status_code=400, detail="Quantity cannot be negative")
     
     try:
-        rowcount = crud_inventory.update_item(db, inventory_id, item.quantity)
-        if rowcount == 0:
+        version = crud_inventory.update_item(db, inventory_id, item.quantity, item.version)
+        if version is None:
             raise HTTPException(status_code=404, detail="Inventory item not found")
-        return {"message": "Inventory updated successfully", "inventory_id": inventory_id, "new_quantity": item.quantity}
+        return {
+            "message": "Inventory updated successfully", "inventory_id": inventory_id,
+            "new_quantity": item.quantity, "version": version,
+        }
+    except crud_inventory.VersionConflict as e:
+        # 他の更新が先に保存されている。現在の値を返し、クライアントに再編集させる
+        raise HTTPException(status_code=409, detail={"message": "Version conflict", "conflicts": e.conflicts})
     except mysql.connector.Error as e:
         raise HTTPException(status_code=500, detail=f"Database query error: {e}")
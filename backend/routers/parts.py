@@ -1,45 +1,346 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import List, Literal, Optional, Union
 import mysql.connector
-import shutil
-import os
+import base64
+import binascii
+import importlib.util
+import itertools
+import json
+import orjson
 import schemas
+import compression
+import images
+import export
+import part_import
 from crud import parts as crud_parts
-from database import get_db_connection
+from crud import versions as crud_versions
+from conditional import make_etag, is_not_modified, not_modified_response
+from database import get_db_connection, get_read_db_connection, pooled_connection
 
 router = APIRouter(
     prefix="/parts",
     tags=["parts"],
 )
 
-@router.get("", response_model=List[schemas.Part])
+# 1ページあたりの最大件数
+MAX_PAGE_SIZE = 1000
+
+# 一括検索 (POST /parts/lookup) で1回に指定できる型番と部品IDの合計の上限
+MAX_LOOKUP_KEYS = 10000
+
+# 一括削除 (POST /parts/delete) で1回に指定できる部品IDの上限
+MAX_BULK_DELETE = 10000
+
+# 削除した部品の画像がまだ参照されているかを確認する (画像を消すワーカーのスレッドから呼ばれる)
+def _find_referenced_image_urls(image_urls: List[str]):
+    with pooled_connection() as db:
+        return crud_parts.find_referenced_image_urls(db, image_urls)
+
+def _encode_cursor(last_id: int) -> str:
+    # クライアントには中身を意識させない不透明なトークンとして返す
+    payload = json.dumps({"after_id": last_id}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        after_id = json.loads(base64.urlsafe_b64decode(padded))["after_id"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(after_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after_id
+
+# 差分同期の開始位置 (既存の行は行バージョン0のため、それより前から読む)
+SYNC_START = (-1, 0)
+
+def _encode_sync_token(position) -> str:
+    payload = json.dumps({"v": position[0], "id": position[1]}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def _decode_sync_token(token: str):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        position = (payload["v"], payload["id"])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid since token")
+    if not all(isinstance(value, int) for value in position):
+        raise HTTPException(status_code=400, detail="Invalid since token")
+    return position
+
+# fieldsで指定できる項目 (thumbnailUrlはimageUrlから求める)
+PART_FIELDS = list(crud_parts.PART_COLUMNS) + ["thumbnailUrl"]
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if fields is None:
+        return None
+    requested = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in PART_FIELDS]
+    if not requested or unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown) or fields}")
+    return requested
+
+def _query_columns(fields: Optional[List[str]], paginated: bool) -> Optional[List[str]]:
+    """レスポンスの項目から、SELECTする列を求めます。"""
+    if fields is None:
+        return None
+    columns = [field for field in fields if field != "thumbnailUrl"]
+    if "thumbnailUrl" in fields and "imageUrl" not in columns:
+        columns.append("imageUrl")
+    # 次ページのカーソルを作るため、ページ指定時は主キーも取得する
+    if paginated and "id" not in columns:
+        columns.append("id")
+    return columns
+
+def _shape_row(row: dict, fields: Optional[List[str]]) -> dict:
+    # キャッシュされた行を書き換えないよう、新しい辞書を作る
+    if fields is None:
+        return {**row, "thumbnailUrl": images.thumbnail_url(row["imageUrl"])}
+    return {
+        field: images.thumbnail_url(row["imageUrl"]) if field == "thumbnailUrl" else row[field]
+        for field in fields
+    }
+
+def _stream_ndjson(rows, fields=None):
+    for row in rows:
+        yield orjson.dumps(_shape_row(row, fields)) + b"\n"
+
+# 一覧はorjsonで直接返すため、response_modelの代わりに返す形式をOpenAPIに記述する
+@router.get(
+    "",
+    response_model=None,
+    responses={
+        200: {
+            "description": (
+                "部品の一覧。fieldsを指定した場合は指定した項目のみを含み、stream=trueの場合はNDJSONで返す。"
+                "facets=trueの場合は一覧とカテゴリーごとの件数を持つオブジェクト (PartsWithFacets) を返す"
+            ),
+            "headers": {
+                "X-Change-Id": {
+                    "description": (
+                        "一覧に反映済みの在庫の変更の最新のID。"
+                        "GET /inventory/changes/stream の last_event_id に指定すると、以降の変更を取りこぼさずに受け取れる"
+                    ),
+                    "schema": {"type": "integer"},
+                },
+            },
+            "model": Union[List[schemas.Part], List[schemas.PartFields], schemas.PartsWithFacets],
+            "content": {"application/x-ndjson": {"schema": {"type": "string"}}},
+        },
+    },
+)
 def get_parts_data(
+    request: Request,
     name: Optional[str] = None,
     category_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    search: Literal["like", "fulltext"] = crud_parts.SEARCH_LIKE,
+    stream: bool = False,
+    fields: Optional[str] = Query(None, description="返す項目をカンマ区切りで指定 (例: inventoryId,quantity)"),
+    facets: bool = Query(
+        False, description="trueの場合、{parts, facets} の形式でnameに一致する部品のカテゴリーごとの件数も返す"
+    ),
+    db: mysql.connector.MySQLConnection = Depends(get_read_db_connection)
+):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    if facets and stream:
+        raise HTTPException(status_code=400, detail="facets cannot be combined with stream")
+    if cursor is not None:
+        after_id = _decode_cursor(cursor)
+    selected = _parse_fields(fields)
+    encoding = compression.negotiate(request.headers.get("accept-encoding"))
+
+    # 一覧に関わるテーブルが変更されていなければ、JOINを実行せずに304を返す
+    # 変更の購読を一覧と同じ時点から始められるよう、在庫の変更の最新のIDも同じスナップショットで読む
+    try:
+        version, change_id = crud_versions.get_with_latest_change(
+            db, crud_versions.TABLE_PARTS, crud_versions.TABLE_INVENTORY, crud_versions.TABLE_CATEGORY
+        )
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+    # 圧縮の有無で内容が異なるため、圧縮方式ごとに別のETagにする
+    query = str(request.url.query)
+    etag = make_etag("parts", version, f"{query}|{encoding}" if encoding else query)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    # NDJSON形式で、サーバー側カーソルから読み出した行を順次送信する
+    if stream:
+        rows = crud_parts.iter_all(
+            db, name=name, category_id=category_id, after_id=after_id, limit=limit, search=search,
+            fields=_query_columns(selected, paginated=False),
+        )
+        try:
+            # クエリエラーをレスポンス送信前に検出するため、先頭行だけ先に読み出す
+            first = next(rows, None)
+        except mysql.connector.Error as e:
+            raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+        if first is not None:
+            rows = itertools.chain([first], rows)
+        return StreamingResponse(
+            _stream_ndjson(rows, selected), media_type="application/x-ndjson",
+            headers={"ETag": etag, "Cache-Control": "no-cache", "X-Change-Id": str(change_id)},
+        )
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Change-Id": str(change_id)}
+    columns = _query_columns(selected, paginated=limit is not None)
+    try:
+        if limit is None:
+            parts = crud_parts.get_all(
+                db, name=name, category_id=category_id, after_id=after_id, search=search, fields=columns,
+                version=version,
+            )
+        else:
+            # 次ページの有無を判定するため1件多く取得する
+            parts = crud_parts.get_all(
+                db, name=name, category_id=category_id, after_id=after_id, limit=limit + 1, search=search,
+                fields=columns, version=version,
+            )
+            if len(parts) > limit:
+                parts = parts[:limit]
+                headers["X-Next-Cursor"] = _encode_cursor(parts[-1]["id"])
+        # カテゴリーごとの件数は、カテゴリーごとに一覧を問い合わせずに1回の集計で求める
+        category_counts = crud_parts.get_facets(db, name=name, search=search, version=version) if facets else None
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+
+    # 行ごとのPydanticモデルの生成を省き、orjsonで直接JSONにする (項目はschemas.Partと同じ)
+    rows = [_shape_row(row, selected) for row in parts]
+    body = orjson.dumps({"parts": rows, "facets": category_counts} if facets else rows)
+    return compression.encoded_response(body, encoding, "application/json", headers)
+
+# 部品・在庫の全件をCSV / NDJSON / Parquetでエクスポートする (ERPとの突き合わせ用)
+@router.get("/export")
+def export_parts(
+    format: Literal["csv", "ndjson", "parquet"] = export.FORMAT_CSV,
+    category_id: Optional[int] = None,
+    modified_since: Optional[datetime] = None,
     db: mysql.connector.MySQLConnection = Depends(get_db_connection)
 ):
     if db is None:
         raise HTTPException(status_code=503, detail="Database connection failed")
+    if format == export.FORMAT_PARQUET and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+
+    batches = crud_parts.iter_export_batches(db, category_id=category_id, modified_since=modified_since)
     try:
-        parts = crud_parts.get_all(db, name=name, category_id=category_id)
-        return parts
+        # クエリエラーをレスポンス送信前に検出するため、先頭のチャンクだけ先に読み出す
+        first = next(batches, None)
     except mysql.connector.Error as e:
         raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+    if first is not None:
+        batches = itertools.chain([first], batches)
+    file_name = f"parts-{datetime.now().strftime('%Y%m%d%H%M%S')}.{format}"
+    return StreamingResponse(
+        export.encode(batches, format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
+
+# 前回の同期以降に作成・更新・削除された部品を返す (モバイル端末などの差分同期用)
+# sinceを省略すると全件を返すため、has_moreがfalseになるまでnext_sinceを指定して読み進める
+@router.get("/changes")
+def get_part_changes(
+    since: Optional[str] = None,
+    limit: int = Query(crud_parts.SYNC_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: mysql.connector.MySQLConnection = Depends(get_db_connection)
+):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    since_version, since_id = _decode_sync_token(since) if since is not None else SYNC_START
+    try:
+        upserts, deletes, position, has_more = crud_parts.get_changes_since(db, since_version, since_id, limit)
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+    return {
+        "upserts": [_shape_row(row, None) for row in upserts],
+        "deletes": deletes,
+        "next_since": _encode_sync_token(position),
+        "has_more": has_more,
+    }
+
+# 型番・部品IDで部品をまとめて検索する (バーコードリーダーで読み取った棚全体を1回で照会する)
+# 見つかった部品は型番・部品IDをキーとする辞書で返し、見つからなかったものはnot_foundに返す
+@router.post("/lookup")
+def lookup_parts(request: schemas.PartLookup, db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    if len(request.p_nums) + len(request.ids) > MAX_LOOKUP_KEYS:
+        raise HTTPException(status_code=400, detail=f"Too many keys (max {MAX_LOOKUP_KEYS})")
+    try:
+        by_p_num, by_id = crud_parts.lookup(db, request.p_nums, request.ids)
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+    return {
+        "p_nums": {str(p_num): _shape_row(row, None) for p_num, row in by_p_num.items()},
+        "ids": {str(part_id): _shape_row(row, None) for part_id, row in by_id.items()},
+        "not_found": {
+            "p_nums": [p_num for p_num in dict.fromkeys(request.p_nums) if p_num not in by_p_num],
+            "ids": [part_id for part_id in dict.fromkeys(request.ids) if part_id not in by_id],
+        },
+    }
+
+# CSV/JSONLファイルから部品を一括登録する (不正な行はエラーとして報告し、残りの行は登録する)
+@router.post("/import")
+def import_parts(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "jsonl"]] = None,
+    db: mysql.connector.MySQLConnection = Depends(get_db_connection)
+):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    fmt = format or part_import.detect_format(file.filename, file.content_type)
+    try:
+        result = part_import.import_parts(db, file.file, fmt)
+        return result.to_dict()
+    except UnicodeDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"File must be UTF-8 encoded: {e}")
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+    finally:
+        file.file.close()
+
+# 部品をまとめて削除する。画像は応答後にバックグラウンドで、他の部品から参照されていなければ削除する
+@router.post("/delete")
+def delete_parts(request: schemas.PartBulkDelete, db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    if len(request.ids) > MAX_BULK_DELETE:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {MAX_BULK_DELETE})")
+    try:
+        deleted, image_urls = crud_parts.delete_many(db, request.ids)
+    except mysql.connector.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database query error: {e}")
+    images.schedule_removal(image_urls, _find_referenced_image_urls)
+    deleted_ids = set(deleted)
+    return {
+        "message": "Parts deleted successfully",
+        "deleted": len(deleted),
+        "not_found": [part_id for part_id in dict.fromkeys(request.ids) if part_id not in deleted_ids],
+    }
 
 @router.delete("/{parts_id}")
 def delete_part(parts_id: int, db: mysql.connector.MySQLConnection = Depends(get_db_connection)):
     if db is None:
         raise HTTPException(status_code=503, detail="Database connection failed")
     try:
-        rowcount = crud_parts.delete_by_id(db, parts_id)
-        if rowcount == 0:
+        deleted, image_urls = crud_parts.delete_many(db, [parts_id])
+        if not deleted:
             raise HTTPException(status_code=404, detail="Part not found")
+        images.schedule_removal(image_urls, _find_referenced_image_urls)
         return {"message": "Part deleted successfully", "parts_id": parts_id}
     except mysql.connector.Error as e:
         raise HTTPException(status_code=500, detail=f"Database query error: {e}")
 
+# ファイル保存とDBアクセスはブロッキング処理のため、同期関数としてスレッドプール上で実行する
 @router.post("", response_model=schemas.Part)
-async def create_part(
+def create_part(
     title: str = Form(...),
     category_id: int = Form(...),
     quantity: int = Form(...),
@@ -49,27 +350,21 @@ async def create_part(
     if db is None:
         raise HTTPException(status_code=503, detail="Database connection failed")
 
-    image_url = None
-    file_path = None
-
+    temp_path = None
     try:
+        # 部品を登録する前に画像を一時ファイルへ受け取り、サイズ超過の場合は登録しない
+        if file:
+            temp_path, digest = images.receive_upload(file)
+
         # 部品情報と在庫情報をデータベースに登録
         created_part = crud_parts.create(db, title, category_id, quantity)
         part_id = created_part['id']
 
-        if file:
-            # ファイル名を安全に生成
-            file_extension = os.path.splitext(file.filename)[1]
-            file_name = f"{part_id}{file_extension}"
-            file_path = os.path.join("static", "images", file_name)
-
-            # ファイルを保存
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            # 画像URLを生成
-            image_url = f"/static/images/{file_name}"
-            
+        if temp_path:
+            # 内容のハッシュをファイル名として保存 (同じ画像は1つのファイルを共有する)
+            image_url = images.store_upload(temp_path, images.content_file_name(digest, file.filename))
+            temp_path = None
+
             # データベースの画像URLを更新
             crud_parts.update_image_url(db, part_id, image_url)
             created_part['imageUrl'] = image_url
@@ -77,22 +372,22 @@ async def create_part(
         db.commit()
         return created_part
 
+    except images.ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except mysql.connector.Error as e:
         db.rollback()
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
         raise HTTPException(status_code=500, detail=f"Database query error: {e}")
     except Exception as e:
         db.rollback()
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
         raise HTTPException(status_code=500, detail=f"Could not process file: {e}")
     finally:
+        images.discard(temp_path)
         if file:
             file.file.close()
 
+# create_partと同様、イベントループを塞がないよう同期関数として定義する
 @router.post("/{parts_id}/image")
-async def upload_part_image(
+def upload_part_image(
     parts_id: int,
     file: UploadFile = File(...),
     db: mysql.connector.MySQLConnection = Depends(get_db_connection)
@@ -100,45 +395,37 @@ async def upload_part_image(
     if db is None:
         raise HTTPException(status_code=503, detail="Database connection failed")
 
-    file_path = None
+    temp_path = None
     try:
-        # ファイル名を安全に生成 (例: 1.jpg)
-        file_extension = os.path.splitext(file.filename)[1]
-        file_name = f"{parts_id}{file_extension}"
-        
-        # 保存先ディレクトリのパスを生成
-        save_dir = os.path.join("static", "images")
-        os.makedirs(save_dir, exist_ok=True)
-        file_path = os.path.join(save_dir, file_name)
-
-        # ファイルを保存
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 画像URLを生成
-        image_url = f"/static/images/{file_name}"
-        
+        # 上限サイズを確認しながら一時ファイルへ書き込む
+        temp_path, digest = images.receive_upload(file)
+
+        # 内容のハッシュをファイル名として保存する (例: 3a7b...e9.jpg)
+        # 再アップロードでURLが変わるため、古い画像がキャッシュから返されることはない
+        image_url = images.store_upload(temp_path, images.content_file_name(digest, file.filename))
+        temp_path = None
+
         # データベースの画像URLを更新
         crud_parts.update_image_url(db, parts_id, image_url)
-        
+
         db.commit()
 
         return {
             "message": "Image uploaded successfully",
             "parts_id": parts_id,
-            "image_url": image_url
+            "image_url": image_url,
+            "thumbnail_url": images.thumbnail_url(image_url),
         }
 
+    except images.ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except mysql.connector.Error as e:
         db.rollback()
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
         raise HTTPException(status_code=500, detail=f"Database query error: {e}")
     except Exception as e:
         db.rollback()
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
         raise HTTPException(status_code=500, detail=f"Could not process file: {e}")
     finally:
+        images.discard(temp_path)
         if file:
             file.file.close()
@@ -1,13 +1,28 @@
-from pydantic import BaseModel, ConfigDict
-from typing import List
+from pydantic import BaseModel, ConfigDict, Field, computed_field
+from typing import List, Optional, Union
+import images
 
 # --- Inventory Schemas ---
 class InventoryUpdate(BaseModel):
     quantity: int
+    # 取得時のバージョン。指定した場合は、その後に他の更新があれば409を返す
+    version: Optional[int] = None
 
 class BatchInventoryUpdateItem(BaseModel):
     id: int
     quantity: int
+    version: Optional[int] = None
+
+class InventoryAdjustment(BaseModel):
+    delta: int
+
+class BatchInventoryAdjustItem(BaseModel):
+    id: int
+    delta: int
+
+class ReorderPointUpdate(BaseModel):
+    # Noneの場合は発注点を解除する (在庫の場合はカテゴリーの既定値に戻す)
+    reorder_point: Optional[int] = Field(None, ge=0)
 
 # --- Parts Schemas ---
 class Part(BaseModel):
@@ -20,9 +35,62 @@ class Part(BaseModel):
     quantity: int
     imageUrl: str
 
+    # 一覧表示用の縮小画像 (WebP)。アップロード後にバックグラウンドで生成される
+    @computed_field
+    @property
+    def thumbnailUrl(self) -> str:
+        return images.thumbnail_url(self.imageUrl)
+
+class PartFields(BaseModel):
+    """fieldsで項目を指定した部品一覧の行 (指定した項目のみを含む)"""
+    id: Optional[int] = None
+    inventoryId: Optional[int] = None
+    title: Optional[str] = None
+    category: Optional[str] = None
+    quantity: Optional[int] = None
+    imageUrl: Optional[str] = None
+    thumbnailUrl: Optional[str] = None
+    # 在庫のバージョン (PUT /inventory の楽観的排他制御に使う)
+    version: Optional[int] = None
+
+class CategoryFacet(BaseModel):
+    """検索条件に一致する部品のカテゴリーごとの件数"""
+    categoryId: int
+    category: str
+    count: int
+
+class PartsWithFacets(BaseModel):
+    """facets=trueを指定した部品一覧 (一覧とカテゴリーごとの件数)"""
+    # fieldsを指定した場合は、指定した項目のみを含む行になる
+    parts: List[Union[Part, PartFields]]
+    facets: List[CategoryFacet]
+
+class PartImportRow(BaseModel):
+    """一括登録 (CSV/JSONL) の1行。カテゴリーは名前かIDのいずれかで指定する"""
+    title: str = Field(min_length=1, max_length=255)
+    category: Optional[str] = None
+    category_id: Optional[int] = None
+    quantity: int = Field(0, ge=0)
+    p_num: Optional[int] = None
+
+class PartLookup(BaseModel):
+    """型番・部品IDによる一括検索 (バーコードで読み取った棚の部品をまとめて照会する)"""
+    p_nums: List[int] = []
+    ids: List[int] = []
+
+class PartBulkDelete(BaseModel):
+    ids: List[int]
+
 # --- Category Schemas ---
 class Category(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     id: int
     name: str
+
+class CategorySummary(BaseModel):
+    categoryId: int
+    category: str
+    partCount: int
+    totalQuantity: int
+    zeroStockCount: int
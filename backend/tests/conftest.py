@@ -1,15 +1,19 @@
+import os
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock
 
+# テスト中にバックグラウンドでDBへ接続しないよう、起動時の接続の作成を無効にします
+# (接続プールはインポート時には接続しないため、パッチを当てずにインポートできます)
+os.environ.setdefault("DB_POOL_WARM_SIZE", "0")
+
 @pytest.fixture(autouse=True)
-def patch_db_pool(monkeypatch):
-    """
-    テスト中に実際のDB接続が行われるのを防ぐため、MySQLConnectionPoolにパッチを適用します。
-    このフィクスチャは、各テストの実行前に自動的に実行されます。
-    """
-    # database.pyのモジュールレベルでコネクションプールが作成されるのを防ぎます
-    monkeypatch.setattr("mysql.connector.pooling.MySQLConnectionPool", MagicMock())
+def clear_cache():
+    """テスト間で読み取りキャッシュの内容が共有されないよう、各テストの前に消去します。"""
+    from cache import cache
+    cache.clear()
+    yield
+    cache.clear()
 
 @pytest.fixture
 def mock_db_connection():
@@ -29,10 +33,11 @@ def client(mock_db_connection):
     """
     # monkeypatchが有効な状態でインポートされるように、ここでインポートします
     from main import app
-    from database import get_db_connection
+    from database import get_db_connection, get_read_db_connection
 
     # テスト期間中、依存関係をオーバーライドします
     app.dependency_overrides[get_db_connection] = lambda: mock_db_connection
+    app.dependency_overrides[get_read_db_connection] = lambda: mock_db_connection
     
     with TestClient(app) as test_client:
         yield test_client
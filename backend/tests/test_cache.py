@@ -0,0 +1,140 @@
+import time
+from cache import Cache, MemoryBackend, RedisBackend
+
+class FakeRedis:
+    """テスト用のRedisの代替。get/set/incr/scan_iter/deleteのみを辞書で実装します。"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value, time.monotonic() + ex if ex else None)
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.data[key] = (str(value), None)
+        return value
+
+    def scan_iter(self, pattern):
+        prefix = pattern.rstrip("*")
+        return [key for key in list(self.data) if key.startswith(prefix)]
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+def test_memory_backend_evicts_least_recently_used():
+    # 準備
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", 1, ttl=60)
+    backend.set("b", 2, ttl=60)
+    backend.get("a")
+
+    # 実行
+    backend.set("c", 3, ttl=60)
+
+    # 検証: 最も古く参照された "b" が追い出される
+    assert backend.get("a") == 1
+    assert backend.get("b") is None
+    assert backend.get("c") == 3
+
+def test_memory_backend_evicts_by_total_rows():
+    # 準備: 行数の合計は5行まで
+    backend = MemoryBackend(max_entries=10, max_rows=5)
+    backend.set("a", [1, 2, 3], ttl=60)
+
+    # 実行
+    backend.set("b", [4, 5, 6], ttl=60)
+
+    # 検証: エントリ数に余裕があっても、行数の合計が上限を超えた分は古い順に追い出される
+    assert backend.get("a") is None
+    assert backend.get("b") == [4, 5, 6]
+
+def test_cache_does_not_store_large_results():
+    # 準備
+    cache = Cache(MemoryBackend(), ttl=60, max_entry_rows=2)
+    calls = []
+    def loader():
+        calls.append(1)
+        return [{"id": 1}, {"id": 2}, {"id": 3}]
+
+    # 実行: 上限を超える行数の結果は毎回読み込む
+    cache.get_or_load("parts", ["get_all", None], loader)
+    cache.get_or_load("parts", ["get_all", None], loader)
+
+    # 検証
+    assert len(calls) == 2
+
+def test_memory_backend_expires_entries():
+    # 準備
+    backend = MemoryBackend()
+    backend.set("a", 1, ttl=0)
+
+    # 検証
+    assert backend.get("a") is None
+
+def test_cache_counts_hits_and_misses_and_invalidates():
+    # 準備
+    cache = Cache(MemoryBackend(), ttl=60)
+    calls = []
+    def loader():
+        calls.append(1)
+        return [{"id": len(calls)}]
+
+    # 実行・検証: 2回目はキャッシュから返される
+    assert cache.get_or_load("parts", ["get_all", None], loader) == [{"id": 1}]
+    assert cache.get_or_load("parts", ["get_all", None], loader) == [{"id": 1}]
+    assert len(calls) == 1
+
+    # 実行・検証: 無効化後は再読み込みされる
+    cache.invalidate("parts")
+    assert cache.get_or_load("parts", ["get_all", None], loader) == [{"id": 2}]
+    assert cache.stats()["namespaces"]["parts"] == {"hits": 1, "misses": 2}
+
+def test_redis_backend_is_coherent_across_workers():
+    # 準備: 2つのワーカーが同じRedisを共有する
+    redis = FakeRedis()
+    worker_a = Cache(RedisBackend(redis), ttl=60)
+    worker_b = Cache(RedisBackend(redis), ttl=60)
+    worker_a.get_or_load("categories", ["get_all"], lambda: [{"id": 1, "name": "電子部品"}])
+
+    # 実行・検証: ワーカーAが読み込んだ結果をワーカーBも利用できる
+    assert worker_b.get_or_load("categories", ["get_all"], lambda: []) == [{"id": 1, "name": "電子部品"}]
+
+    # 実行・検証: ワーカーBでの無効化がワーカーAにも反映される
+    worker_b.invalidate("categories")
+    assert worker_a.get_or_load("categories", ["get_all"], lambda: []) == []
+
+def test_get_parts_data_is_cached_until_inventory_update(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [
+        {'id': 1, 'inventoryId': 101, 'title': 'Part A', 'category': 'Category A', 'quantity': 10, 'imageUrl': ''},
+    ]
+
+    def list_queries():
+        return [call for call in mock_cursor.execute.call_args_list if "FROM Parts p" in call.args[0]]
+
+    # 実行・検証: 同じ条件の2回目の取得では一覧のクエリを実行しない
+    client.get("/parts?category_id=1")
+    client.get("/parts?category_id=1")
+    assert len(list_queries()) == 1
+
+    # 実行・検証: 在庫の更新後は再度クエリを実行する
+    mock_cursor.rowcount = 1
+    mock_cursor.fetchone.return_value = (10, 1)
+    client.put("/inventory/101", json={"quantity": 5})
+    client.get("/parts?category_id=1")
+    assert len(list_queries()) == 2
+
+    response = client.get("/cache/stats")
+    assert response.json()["namespaces"]["parts"] == {"hits": 1, "misses": 2}
@@ -0,0 +1,69 @@
+def test_get_categories_data_success(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchone.return_value = (1,)
+    mock_cursor.fetchall.return_value = [{"id": 1, "name": "電子部品"}, {"id": 2, "name": "機械部品"}]
+
+    # 実行
+    response = client.get("/categories")
+
+    # 検証
+    assert response.status_code == 200
+    assert response.json() == [{"id": 1, "name": "電子部品"}, {"id": 2, "name": "機械部品"}]
+    assert "ETag" in response.headers
+
+def test_get_categories_data_not_modified(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchone.return_value = (1,)
+    mock_cursor.fetchall.return_value = [{"id": 1, "name": "電子部品"}]
+    etag = client.get("/categories").headers["ETag"]
+
+    # 実行
+    response = client.get("/categories", headers={"If-None-Match": f'"other", {etag}'})
+
+    # 検証
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_get_categories_summary(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchone.return_value = (3,)
+    summaries = [
+        {"categoryId": 1, "category": "電子部品", "partCount": 5, "totalQuantity": 120, "zeroStockCount": 1},
+        {"categoryId": 2, "category": "機械部品", "partCount": 0, "totalQuantity": 0, "zeroStockCount": 0},
+    ]
+    mock_cursor.fetchall.return_value = summaries
+
+    # 実行
+    response = client.get("/categories/summary")
+
+    # 検証: 部品を走査せず、集計表をカテゴリーと結合して返す
+    assert response.status_code == 200
+    assert response.json() == summaries
+    assert "ETag" in response.headers
+    args, kwargs = mock_cursor.execute.call_args
+    assert "LEFT JOIN Category_Stock_Summary" in args[0]
+    assert "Inventory" not in args[0]
+
+def test_update_default_reorder_point_commits_before_reevaluating(client, mock_db_connection):
+    # 準備: カテゴリーは存在し、在庫が2件ある
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchone.return_value = (1,)
+    mock_cursor.fetchall.return_value = [(5,), (9,)]
+
+    # 実行
+    response = client.put("/categories/3/reorder-point", json={"reorder_point": 10})
+
+    # 検証: カテゴリーの行のロックを解放してから、在庫IDを指定して評価し直す (在庫 → カテゴリーの順のロックと競合しない)
+    assert response.status_code == 200
+    calls = [
+        "commit" if name == "commit" else args[0]
+        for name, args, kwargs in mock_db_connection.mock_calls
+        if name in ("commit", "cursor().execute")
+    ]
+    update_index = next(i for i, sql in enumerate(calls) if sql.startswith("UPDATE Category"))
+    flag_index = next(i for i, sql in enumerate(calls) if "INSERT INTO Low_Stock" in sql)
+    assert "commit" in calls[update_index:flag_index]
+    assert "i.id IN (%s, %s)" in calls[flag_index]
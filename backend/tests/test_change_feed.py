@@ -0,0 +1,58 @@
+import asyncio
+from change_feed import ChangeFeed, EVENT_CHANGE, EVENT_READY, EVENT_RESET
+
+def _change(change_id, quantity):
+    return {"id": change_id, "inventoryId": 101, "partsId": 1, "quantity": quantity, "op": "update"}
+
+def _feed(store):
+    return ChangeFeed(
+        fetch_since=lambda after_id: [row for row in store if row["id"] > after_id],
+        fetch_ids=lambda ids: [row for row in store if row["id"] in ids],
+        fetch_bounds=lambda: (store[0]["id"] if store else None, store[-1]["id"] if store else 0),
+        poll_seconds=0.01,
+        heartbeat_seconds=1,
+    )
+
+def test_change_feed_pushes_changes_and_late_commits():
+    store = []
+
+    async def scenario():
+        # 準備
+        feed = _feed(store)
+        subscription = feed.subscribe()
+        assert await subscription.__anext__() == (EVENT_READY, 0, None)
+
+        # 実行・検証: ポーリングで見つかった変更を順に配信する
+        store.extend([_change(1, 5), _change(3, 7)])
+        assert await subscription.__anext__() == (EVENT_CHANGE, 1, _change(1, 5))
+        assert await subscription.__anext__() == (EVENT_CHANGE, 3, _change(3, 7))
+
+        # 実行・検証: 欠番だったIDが後からコミットされた場合も配信する
+        store.insert(1, _change(2, 6))
+        assert await subscription.__anext__() == (EVENT_CHANGE, 2, _change(2, 6))
+        await subscription.aclose()
+        assert feed.subscriber_count == 0
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+def test_change_feed_resends_after_last_event_id_or_resets():
+    store = [_change(1, 5), _change(2, 6), _change(3, 7)]
+
+    async def scenario():
+        feed = _feed(store)
+
+        # 実行・検証: 再接続時はLast-Event-ID以降の変更を再送する
+        subscription = feed.subscribe(last_event_id=1)
+        assert [await subscription.__anext__() for _ in range(2)] == [
+            (EVENT_CHANGE, 2, _change(2, 6)),
+            (EVENT_CHANGE, 3, _change(3, 7)),
+        ]
+        await subscription.aclose()
+
+        # 実行・検証: 削除済みの変更より前から再開する場合は reset を送る
+        del store[:2]
+        subscription = feed.subscribe(last_event_id=0)
+        assert await subscription.__anext__() == (EVENT_RESET, 3, None)
+        await subscription.aclose()
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
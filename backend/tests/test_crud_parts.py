@@ -15,3 +15,152 @@ def test_get_all_commits_transaction():
 
     # 検証: commitメソッドが1回呼び出されたことを確認
     mock_db.commit.assert_called_once()
+
+def test_iter_all_reads_in_chunks_and_consumes_on_early_close():
+    """
+    iter_allがチャンク単位で読み出し、途中で閉じられた場合は未読の結果を読み捨てることを確認するテスト。
+    """
+    # 準備
+    mock_db = Mock()
+    mock_cursor = mock_db.cursor.return_value
+    mock_cursor.fetchmany.side_effect = [[{'id': 1}, {'id': 2}], [{'id': 3}], []]
+
+    # 実行: 1行だけ読んでジェネレーターを閉じる
+    rows = crud_parts.iter_all(mock_db, chunk_size=2)
+    assert next(rows) == {'id': 1}
+    rows.close()
+
+    # 検証
+    mock_cursor.fetchmany.assert_called_once_with(2)
+    mock_db.consume_results.assert_called_once()
+    mock_cursor.close.assert_called_once()
+    mock_db.commit.assert_called_once()
+
+def test_fulltext_search_strips_boolean_operators():
+    """
+    全文検索の検索語からBOOLEAN MODEの演算子が取り除かれ、演算子のみの場合はLIKE検索になることを確認するテスト。
+    """
+    # 準備
+    mock_db = Mock()
+    mock_cursor = mock_db.cursor.return_value
+    mock_cursor.fetchall.return_value = []
+
+    # 実行・検証: 演算子は区切りとして扱われる
+    crud_parts.get_all(mock_db, name='M6+"ボルト"', search=crud_parts.SEARCH_FULLTEXT)
+    args, kwargs = mock_cursor.execute.call_args
+    assert args[1] == ("+M6* +ボルト*", "+M6* +ボルト*")
+
+    # 実行・検証: 検索語が残らない場合は部分一致検索にフォールバックする
+    crud_parts.get_all(mock_db, name="***", search=crud_parts.SEARCH_FULLTEXT)
+    args, kwargs = mock_cursor.execute.call_args
+    assert "p.p_name LIKE %s" in args[0]
+    assert args[1] == ("%***%",)
+
+def test_fulltext_search_falls_back_to_like_for_short_terms(monkeypatch):
+    """
+    ngram_token_sizeより短い語 (1文字の検索など) を含む全文検索が、部分一致検索になることを確認するテスト。
+    """
+    # 準備
+    monkeypatch.setattr("crud.parts.NGRAM_TOKEN_SIZE", 2)
+    mock_db = Mock()
+    mock_cursor = mock_db.cursor.return_value
+    mock_cursor.fetchall.return_value = []
+
+    # 実行・検証: 1文字の語は部分一致検索になる
+    crud_parts.get_all(mock_db, name="赤", search=crud_parts.SEARCH_FULLTEXT)
+    args, kwargs = mock_cursor.execute.call_args
+    assert "MATCH" not in args[0]
+    assert args[1] == ("%赤%",)
+
+    # 実行・検証: 複数の語のうち1つでも短い場合は、全体を部分一致検索にする
+    crud_parts.get_all(mock_db, name="LED 赤", search=crud_parts.SEARCH_FULLTEXT)
+    args, kwargs = mock_cursor.execute.call_args
+    assert "MATCH" not in args[0]
+    assert args[1] == ("%LED 赤%",)
+
+    # 実行・検証: 全ての語が十分な長さなら全文検索を使う
+    crud_parts.get_all(mock_db, name="LED 赤色", search=crud_parts.SEARCH_FULLTEXT)
+    args, kwargs = mock_cursor.execute.call_args
+    assert args[1] == ("+LED* +赤色*", "+LED* +赤色*")
+
+def test_lookup_queries_in_chunks_with_deduplicated_keys():
+    """
+    lookupが重複を除いた型番・部品IDをchunk_size件ずつのIN句で検索し、1回だけコミットすることを確認するテスト。
+    """
+    # 準備
+    mock_db = Mock()
+    mock_cursor = mock_db.cursor.return_value
+    mock_cursor.fetchall.side_effect = [
+        [{'id': 1, 'pNum': 30}],
+        [{'id': 3, 'pNum': 10}],
+        [{'id': 1, 'pNum': 30}],
+    ]
+
+    # 実行
+    by_p_num, by_id = crud_parts.lookup(mock_db, p_nums=[30, 10, 20, 30], part_ids=[1], chunk_size=2)
+
+    # 検証: 型番は2件と1件の2回、部品IDは1回で検索する
+    assert [call.args[1] for call in mock_cursor.execute.call_args_list] == [(10, 20), (30,), (1,)]
+    assert "p.p_num IN (%s, %s)" in mock_cursor.execute.call_args_list[0].args[0]
+    assert "p.id IN (%s)" in mock_cursor.execute.call_args_list[2].args[0]
+    assert set(by_p_num) == {10, 30}
+    assert set(by_id) == {1}
+    mock_db.commit.assert_called_once()
+
+def test_get_all_keeps_replica_results_separate_from_primary():
+    """
+    レプリカから読んだ一覧が、主DBから読む場合にキャッシュから返されないことを確認するテスト。
+    """
+    # 準備
+    replica_db = Mock(mast_replica=True)
+    replica_db.cursor.return_value.fetchall.return_value = [{'id': 1}]
+    primary_db = Mock()
+    primary_db.cursor.return_value.fetchall.return_value = [{'id': 1}, {'id': 2}]
+
+    # 実行
+    crud_parts.get_all(replica_db)
+    from_replica = crud_parts.get_all(replica_db)
+    from_primary = crud_parts.get_all(primary_db)
+
+    # 検証: レプリカの結果は2回目にキャッシュから返し、主DBは自身の結果を読む
+    replica_db.cursor.return_value.execute.assert_called_once()
+    assert from_replica == [{'id': 1}]
+    assert from_primary == [{'id': 1}, {'id': 2}]
+
+def test_get_all_reloads_when_table_version_changes():
+    """
+    他のプロセスによる書き込みでこのプロセスのキャッシュが無効化されなくても、
+    テーブルのバージョンが変われば読み直すことを確認するテスト。
+    """
+    # 準備
+    mock_db = Mock()
+    mock_db.cursor.return_value.fetchall.side_effect = [[{'id': 1}], [{'id': 1}, {'id': 2}]]
+
+    # 実行
+    before = crud_parts.get_all(mock_db, name="version-keyed", version=10)
+    cached = crud_parts.get_all(mock_db, name="version-keyed", version=10)
+    after = crud_parts.get_all(mock_db, name="version-keyed", version=11)
+
+    # 検証
+    assert before == cached == [{'id': 1}]
+    assert after == [{'id': 1}, {'id': 2}]
+
+def test_delete_many_locks_rows_before_recording_changes():
+    """
+    delete_manyが部品と在庫の行をFOR UPDATEでロックしてから変更履歴を記録することを確認するテスト。
+    """
+    # 準備
+    mock_db = Mock()
+    mock_cursor = mock_db.cursor.return_value
+    mock_cursor.fetchall.return_value = [(1, 10, 5, '')]
+
+    # 実行
+    deleted, _ = crud_parts.delete_many(mock_db, [1, 2])
+
+    # 検証: 変更履歴は見つかった部品のみ記録する
+    statements = [c.args[0] for c in mock_cursor.execute.call_args_list]
+    lock_index = next(i for i, sql in enumerate(statements) if sql.endswith("FOR UPDATE"))
+    record_index = next(i for i, sql in enumerate(statements) if "INSERT INTO Inventory_Changes" in sql)
+    assert deleted == [1]
+    assert lock_index < record_index
+    assert mock_cursor.execute.call_args_list[record_index].args[1][-1] == 1
@@ -0,0 +1,212 @@
+from unittest.mock import MagicMock
+import threading
+import pytest
+
+@pytest.fixture
+def database(monkeypatch):
+    """サイズ1の接続プールと、待ち時間の短いタイムアウトを設定したdatabaseモジュールを返します。"""
+    # conftestのパッチが有効な状態でインポートされるように、ここでインポートします
+    import database
+    monkeypatch.setattr(database, "cnx_pool", MagicMock())
+    monkeypatch.setattr(database, "_pool_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(database, "pool_stats", database.PoolStats(1))
+    monkeypatch.setattr(database, "DB_POOL_ACQUIRE_TIMEOUT", 0.01)
+    return database
+
+def test_get_db_connection_waits_and_times_out_when_pool_is_busy(database):
+    # 準備: 1つ目の接続を使用中にする
+    first = database.get_db_connection()
+    conn = next(first)
+    assert conn is not None
+    assert database.get_pool_stats()["in_use"] == 1
+
+    # 実行: 空きがないため、タイムアウト後にNoneが返される (ルーターは503を返す)
+    second = database.get_db_connection()
+    assert next(second) is None
+
+    # 検証
+    stats = database.get_pool_stats()
+    assert stats["timeouts_total"] == 1
+    assert stats["utilization"] == 1.0
+
+    # 接続を返却すると、再び取得できる
+    first.close()
+    assert database.get_pool_stats()["in_use"] == 0
+    third = database.get_db_connection()
+    assert next(third) is not None
+    third.close()
+    assert database.get_pool_stats()["acquired_total"] == 2
+
+def test_pool_slot_is_released_when_get_connection_fails(database):
+    # 準備
+    database.cnx_pool.get_connection.side_effect = database.mysql.connector.Error("boom")
+
+    # 実行
+    assert next(database.get_db_connection()) is None
+
+    # 検証: 失敗した取得でセマフォが消費されたままにならない
+    database.cnx_pool.get_connection.side_effect = None
+    gen = database.get_db_connection()
+    assert next(gen) is not None
+    gen.close()
+
+def test_read_pool_stats(client):
+    # 実行
+    response = client.get("/db/pool-stats")
+
+    # 検証
+    assert response.status_code == 200
+    assert {"size", "in_use", "utilization", "wait_seconds_max", "timeouts_total"} <= set(response.json())
+
+@pytest.fixture
+def connections(monkeypatch):
+    """mysql.connector.connectが作った (モックの) 接続のリストを返します。"""
+    import database
+    from mysql.connector.connection import MySQLConnection
+    created = []
+
+    def connect(**config):
+        cnx = MagicMock(spec=MySQLConnection)
+        cnx.is_connected.return_value = True
+        created.append(cnx)
+        return cnx
+
+    monkeypatch.setattr(database.mysql.connector, "connect", connect)
+    return created
+
+def _lazy_pool(size=2):
+    import database
+    return database.LazyConnectionPool(pool_size=size, pool_name="test_pool", host="db", user="u", password="p")
+
+def test_lazy_pool_connects_only_when_needed(connections):
+    # 実行
+    pool = _lazy_pool()
+
+    # 検証: 作成時には接続せず、取得した時点で1つずつ作る
+    assert connections == []
+    conn = pool.get_connection()
+    assert len(connections) == 1
+    conn.close()
+    pool.get_connection().close()
+    assert len(connections) == 1
+
+def test_lazy_pool_pings_only_idle_connections(connections, monkeypatch):
+    # 準備
+    import database
+    pool = _lazy_pool()
+    pool.get_connection().close()
+    [cnx] = connections
+
+    # 実行・検証: 直前に返却された接続はpingせずに再利用する
+    pool.get_connection().close()
+    cnx.is_connected.assert_not_called()
+
+    # 実行・検証: 一定時間使われていなかった接続はpingし、切断されていれば作り直す
+    monkeypatch.setattr(database, "DB_POOL_HEALTHCHECK_IDLE_SECONDS", 0)
+    cnx.is_connected.return_value = False
+    pool.get_connection().close()
+    cnx.is_connected.assert_called_once()
+    assert len(connections) == 2
+
+def test_lazy_pool_backs_off_after_connect_failure(monkeypatch):
+    # 準備: DBに接続できない
+    import database
+    attempts = []
+
+    def connect(**config):
+        attempts.append(config)
+        raise database.mysql.connector.Error("Can't connect")
+
+    monkeypatch.setattr(database.mysql.connector, "connect", connect)
+    pool = _lazy_pool()
+
+    # 実行: 1回目は接続を試みて失敗し、待ち時間の間は接続を試みずに失敗する
+    with pytest.raises(database.mysql.connector.Error):
+        pool.get_connection()
+    with pytest.raises(database.pooling.PoolError):
+        pool.get_connection()
+
+    # 検証
+    assert len(attempts) == 1
+    assert not pool.available
+
+def test_health_endpoints(client, monkeypatch):
+    # 準備: DBに接続できない
+    monkeypatch.setattr("database.is_ready", lambda: False)
+
+    # 実行・検証: livenessはDBの状態に関わらず200、readinessは503を返す
+    assert client.get("/health/live").status_code == 200
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "unavailable"}
+
+@pytest.fixture
+def replica(database, monkeypatch):
+    """レプリカを設定し、遅延0秒と確認済みの状態にしたdatabaseモジュールを返します。"""
+    monkeypatch.setattr(database, "DB_REPLICA_HOST", "db-replica")
+    monkeypatch.setattr(database, "replica_pool", MagicMock())
+    monkeypatch.setattr(database, "_replica_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(database, "replica_pool_stats", database.PoolStats(1))
+    monkeypatch.setattr(database, "_replica_lag", 0)
+    monkeypatch.setattr(database, "_replica_checked_at", database.time.monotonic())
+    return database
+
+def _read_connection(database, cookies=None):
+    from starlette.requests import Request
+    headers = [(b"cookie", "; ".join(f"{k}={v}" for k, v in cookies.items()).encode())] if cookies else []
+    gen = database.get_read_db_connection(Request({"type": "http", "headers": headers}))
+    conn = next(gen)
+    gen.close()
+    return conn
+
+def test_read_connection_routing(replica, monkeypatch):
+    # 実行・検証: 遅延がしきい値以下であればレプリカから読む
+    assert _read_connection(replica) is not None
+    assert replica.replica_pool.get_connection.call_count == 1
+    assert replica.cnx_pool.get_connection.call_count == 0
+
+    # 実行・検証: 直前に書き込みを行ったクライアントは主DBから読む
+    _read_connection(replica, {replica.STICKY_PRIMARY_COOKIE: "1"})
+    assert replica.cnx_pool.get_connection.call_count == 1
+
+    # 実行・検証: 遅延がしきい値を超えている場合は主DBから読む
+    monkeypatch.setattr(replica, "_replica_lag", replica.DB_REPLICA_MAX_LAG_SECONDS + 1)
+    _read_connection(replica)
+    assert replica.cnx_pool.get_connection.call_count == 2
+
+    # 実行・検証: レプリカに接続できない場合も主DBから読み、レプリカのセマフォは返却されている
+    monkeypatch.setattr(replica, "_replica_lag", 0)
+    replica.replica_pool.get_connection.side_effect = replica.mysql.connector.Error("boom")
+    assert _read_connection(replica) is not None
+    assert replica.cnx_pool.get_connection.call_count == 3
+    assert replica.replica_pool_stats.snapshot()["in_use"] == 0
+    assert replica._replica_slots.acquire(blocking=False)
+
+def test_check_replica_lag(replica):
+    # 準備
+    cursor = replica.replica_pool.get_connection.return_value.cursor.return_value
+    cursor.fetchall.return_value = [{"Seconds_Behind_Source": 1}]
+    cursor.rowcount = 1
+
+    # 実行・検証: 遅延を記録する
+    replica.check_replica_lag()
+    assert replica._replica_lag == 1
+    assert replica.replica_usable()
+
+    # 実行・検証: レプリケーションが停止している場合は遅延が不明となり、主DBから読む
+    cursor.fetchall.return_value = [{"Seconds_Behind_Source": None}]
+    replica.check_replica_lag()
+    assert replica._replica_lag is None
+    assert not replica.replica_usable()
+
+def test_write_request_sets_sticky_primary_cookie(client, mock_db_connection, monkeypatch):
+    # 準備
+    import database
+    monkeypatch.setattr(database, "DB_REPLICA_HOST", "db-replica")
+    mock_db_connection.cursor.return_value.rowcount = 1
+
+    # 実行・検証: 書き込みのリクエストにはCookieを付け、読み取りのリクエストには付けない
+    response = client.delete("/parts/1")
+    assert response.cookies.get(database.STICKY_PRIMARY_COOKIE) == "1"
+    assert f"Max-Age={database.DB_STICKY_PRIMARY_SECONDS}" in response.headers["set-cookie"]
+    assert "set-cookie" not in client.get("/health/live").headers
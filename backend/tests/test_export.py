@@ -0,0 +1,59 @@
+import io
+from datetime import datetime
+import pyarrow.parquet as pq
+import export
+
+EXPORT_ROWS = [
+    {"id": 1, "inventoryId": 1, "pNum": 10001, "title": "LED 5mm 赤色", "categoryId": 1, "category": "電子部品",
+     "quantity": 150, "imageUrl": "", "updatedAt": datetime(2024, 5, 1, 9, 30)},
+    {"id": 2, "inventoryId": 2, "pNum": None, "title": "ナット, M6", "categoryId": 1, "category": "電子部品",
+     "quantity": 0, "imageUrl": "/static/images/a.jpg", "updatedAt": datetime(2024, 5, 2, 10, 0)},
+]
+
+def test_export_csv_streams_rows_from_unbuffered_cursor(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchmany.side_effect = [EXPORT_ROWS[:1], EXPORT_ROWS[1:], []]
+
+    # 実行
+    response = client.get("/parts/export?format=csv&category_id=1&modified_since=2024-05-01T00:00:00")
+
+    # 検証: チャンクごとに読み出し、絞り込み条件をSQLに渡す
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text == (
+        "id,inventoryId,pNum,title,categoryId,category,quantity,imageUrl,updatedAt\n"
+        "1,1,10001,LED 5mm 赤色,1,電子部品,150,,2024-05-01T09:30:00\n"
+        '2,2,,"ナット, M6",1,電子部品,0,/static/images/a.jpg,2024-05-02T10:00:00\n'
+    )
+    mock_db_connection.cursor.assert_called_with(dictionary=True, buffered=False)
+    query, params = mock_cursor.execute.call_args.args
+    assert "p.c_id = %s AND (p.updated_at >= %s OR i.updated_at >= %s)" in query
+    assert params == (1, datetime(2024, 5, 1), datetime(2024, 5, 1))
+
+def test_export_parquet_writes_one_row_group_per_chunk(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchmany.side_effect = [EXPORT_ROWS[:1], EXPORT_ROWS[1:], []]
+
+    # 実行
+    response = client.get("/parts/export?format=parquet")
+
+    # 検証
+    assert response.status_code == 200
+    parquet_file = pq.ParquetFile(io.BytesIO(response.content))
+    assert parquet_file.num_row_groups == 2
+    table = parquet_file.read()
+    assert table.column_names == export.COLUMNS
+    assert table.column("title").to_pylist() == ["LED 5mm 赤色", "ナット, M6"]
+    assert table.column("pNum").to_pylist() == [10001, None]
+
+def test_export_ndjson_encodes_each_row():
+    # 実行
+    data = b"".join(export.encode([EXPORT_ROWS[:1]], export.FORMAT_NDJSON)).decode()
+
+    # 検証
+    assert data == (
+        '{"id": 1, "inventoryId": 1, "pNum": 10001, "title": "LED 5mm 赤色", "categoryId": 1, '
+        '"category": "電子部品", "quantity": 150, "imageUrl": "", "updatedAt": "2024-05-01T09:30:00"}\n'
+    )
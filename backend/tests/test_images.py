@@ -0,0 +1,193 @@
+import os
+import time
+from PIL import Image
+import images
+
+def test_generate_thumbnail_creates_small_webp(monkeypatch, tmp_path):
+    # 準備: 大きな画像を保存しておく
+    monkeypatch.setattr("images.THUMBNAIL_DIR", str(tmp_path / "thumbs"))
+    source = tmp_path / "1.png"
+    Image.new("RGB", (1200, 800), "red").save(source)
+
+    # 実行
+    thumbnail_path = images.generate_thumbnail(str(source))
+
+    # 検証: 縦横比を保ったまま最大辺が256pxのWebPが作成される
+    assert thumbnail_path == str(tmp_path / "thumbs" / "1.webp")
+    with Image.open(thumbnail_path) as thumbnail:
+        assert thumbnail.format == "WEBP"
+        assert thumbnail.size == (256, 171)
+
+def test_generate_thumbnail_ignores_broken_image(monkeypatch, tmp_path):
+    # 準備
+    monkeypatch.setattr("images.THUMBNAIL_DIR", str(tmp_path / "thumbs"))
+    source = tmp_path / "1.jpg"
+    source.write_bytes(b"not an image")
+
+    # 実行・検証: 失敗してもNoneを返し、一時ファイルを残さない
+    assert images.generate_thumbnail(str(source)) is None
+    assert list((tmp_path / "thumbs").iterdir()) == []
+
+def test_thumbnail_url(monkeypatch, tmp_path):
+    # 準備: 12.jpg のサムネイルだけが存在する
+    thumbs = tmp_path / "thumbs"
+    thumbs.mkdir()
+    (thumbs / "12.webp").write_bytes(b"thumb")
+    monkeypatch.setattr("images.THUMBNAIL_DIR", str(thumbs))
+    monkeypatch.setattr("images._existing_thumbnails", set())
+
+    # 実行・検証: サムネイルの無い画像や外部の画像は画像URLのまま返す
+    assert images.thumbnail_url("/static/images/12.jpg") == "/static/images/thumbs/12.webp"
+    assert images.thumbnail_url("/static/images/13.jpg") == "/static/images/13.jpg"
+    assert images.thumbnail_url("http://example.com/a.jpg") == "http://example.com/a.jpg"
+    assert images.thumbnail_url("") == ""
+
+def test_thumbnail_url_follows_generation_and_removal(monkeypatch, tmp_path):
+    # 準備
+    thumbs = tmp_path / "thumbs"
+    monkeypatch.setattr("images.IMAGE_DIR", str(tmp_path))
+    monkeypatch.setattr("images.THUMBNAIL_DIR", str(thumbs))
+    monkeypatch.setattr("images._existing_thumbnails", set())
+    name = "a" * 64
+    source = tmp_path / f"{name}.png"
+    Image.new("RGB", (10, 10), "red").save(source)
+    old = time.time() - images.GC_GRACE_SECONDS - 60
+    os.utime(source, (old, old))
+    url = f"/static/images/{name}.png"
+
+    # 実行・検証: 生成後はサムネイルのURLを返す
+    assert images.thumbnail_url(url) == url
+    images.generate_thumbnail(str(source))
+    assert images.thumbnail_url(url) == f"/static/images/thumbs/{name}.webp"
+
+    # 実行・検証: 画像を削除した後は、確認済みの記録も残さない
+    images.remove_unreferenced([url], lambda urls: set())
+    assert images.thumbnail_url(url) == url
+
+def test_backfill_thumbnails_creates_only_missing(monkeypatch, tmp_path):
+    # 準備: サムネイル済みの画像、サムネイルの無い画像、対象外のファイル
+    thumbs = tmp_path / "thumbs"
+    thumbs.mkdir()
+    monkeypatch.setattr("images.IMAGE_DIR", str(tmp_path))
+    monkeypatch.setattr("images.THUMBNAIL_DIR", str(thumbs))
+    monkeypatch.setattr("images._existing_thumbnails", set())
+    done, missing = "a" * 64, "b" * 64
+    Image.new("RGB", (10, 10), "red").save(tmp_path / f"{done}.png")
+    (thumbs / f"{done}.webp").write_bytes(b"existing")
+    Image.new("RGB", (10, 10), "blue").save(tmp_path / f"{missing}.png")
+    Image.new("RGB", (10, 10), "green").save(tmp_path / "other.png")
+
+    # 実行
+    created = images.backfill_thumbnails()
+
+    # 検証: サムネイルの無い画像だけ作成し、既存のサムネイルは変更しない
+    assert created == [str(thumbs / f"{missing}.webp")]
+    assert sorted(p.name for p in thumbs.iterdir()) == [f"{done}.webp", f"{missing}.webp"]
+    assert (thumbs / f"{done}.webp").read_bytes() == b"existing"
+
+def test_collect_garbage_removes_only_old_unreferenced_files(monkeypatch, tmp_path):
+    # 準備
+    thumbs = tmp_path / "thumbs"
+    thumbs.mkdir()
+    monkeypatch.setattr("images.IMAGE_DIR", str(tmp_path))
+    monkeypatch.setattr("images.THUMBNAIL_DIR", str(thumbs))
+    referenced = "a" * 64 + ".jpg"
+    unreferenced = "b" * 64 + ".png"
+    recent = "c" * 64 + ".jpg"
+    for path in (tmp_path / referenced, tmp_path / unreferenced, tmp_path / recent,
+                 thumbs / ("a" * 64 + ".webp"), thumbs / ("b" * 64 + ".webp")):
+        path.write_bytes(b"x")
+    old = time.time() - images.GC_GRACE_SECONDS - 10
+    for path in (tmp_path / referenced, tmp_path / unreferenced, thumbs / ("a" * 64 + ".webp"), thumbs / ("b" * 64 + ".webp")):
+        os.utime(path, (old, old))
+
+    # 実行: dry_runでは削除しない
+    planned = images.collect_garbage([f"/static/images/{referenced}", "http://example.com/x.jpg"], dry_run=True)
+    assert (tmp_path / unreferenced).exists()
+
+    # 実行
+    removed = images.collect_garbage([f"/static/images/{referenced}"])
+
+    # 検証: 参照されていない古い画像とそのサムネイルのみ削除される
+    assert sorted(removed) == sorted(planned) == sorted([str(tmp_path / unreferenced), str(thumbs / ("b" * 64 + ".webp"))])
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_file()) == sorted([referenced, recent])
+
+def test_remove_unreferenced_keeps_shared_and_recent_images(monkeypatch, tmp_path):
+    # 準備
+    thumbs = tmp_path / "thumbs"
+    thumbs.mkdir()
+    monkeypatch.setattr("images.IMAGE_DIR", str(tmp_path))
+    monkeypatch.setattr("images.THUMBNAIL_DIR", str(thumbs))
+    shared = "a" * 64 + ".jpg"
+    orphan = "b" * 64 + ".png"
+    recent = "c" * 64 + ".jpg"
+    for path in (tmp_path / shared, tmp_path / orphan, tmp_path / recent, thumbs / ("b" * 64 + ".webp")):
+        path.write_bytes(b"x")
+    old = time.time() - images.GC_GRACE_SECONDS - 10
+    for path in (tmp_path / shared, tmp_path / orphan):
+        os.utime(path, (old, old))
+    urls = [f"/static/images/{name}" for name in (shared, orphan, recent)] + ["http://example.com/x.jpg"]
+    checked = []
+
+    def find_referenced(image_urls):
+        checked.extend(image_urls)
+        return {f"/static/images/{shared}"}
+
+    # 実行
+    removed = images.remove_unreferenced(urls, find_referenced)
+
+    # 検証: 他の部品が参照している画像と、最近アップロードされた画像は残る
+    assert sorted(removed) == sorted([str(tmp_path / orphan), str(thumbs / ("b" * 64 + ".webp"))])
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_file()) == sorted([shared, recent])
+    assert "http://example.com/x.jpg" not in checked
+
+def test_schedule_removal_logs_failures(caplog):
+    # 準備
+    def find_referenced(image_urls):
+        raise RuntimeError("db down")
+
+    # 実行: ワーカーで実行される処理を直接呼び出す
+    images._remove_unreferenced_in_background(["/static/images/" + "d" * 64 + ".jpg"], find_referenced)
+
+    # 検証: 失敗はログに残る
+    assert "Failed to remove images of deleted parts" in caplog.text
+    assert "db down" in caplog.text
+
+def test_store_upload_saves_file_removed_concurrently(monkeypatch, tmp_path):
+    # 準備: 同じ内容の画像は保存済みだが、更新時刻を更新する前に削除される
+    monkeypatch.setattr("images.IMAGE_DIR", str(tmp_path))
+    monkeypatch.setattr("images.THUMBNAIL_DIR", str(tmp_path / "thumbs"))
+    monkeypatch.setattr("images._executor", type("Executor", (), {"submit": lambda self, *args: None})())
+    file_name = "e" * 64 + ".jpg"
+    (tmp_path / file_name).write_bytes(b"x")
+    temp_path = tmp_path / ".upload-1.tmp"
+    temp_path.write_bytes(b"x")
+    utime = os.utime
+    def utime_after_removal(path, *args):
+        os.remove(path)
+        utime(path, *args)
+    monkeypatch.setattr("images.os.utime", utime_after_removal)
+
+    # 実行
+    image_url = images.store_upload(str(temp_path), file_name)
+
+    # 検証: エラーにせず、アップロードされたファイルを保存する
+    assert image_url == f"/static/images/{file_name}"
+    assert (tmp_path / file_name).read_bytes() == b"x"
+    assert not temp_path.exists()
+
+def test_content_addressed_images_are_served_as_immutable(client, tmp_path):
+    # 準備
+    digest_name = "d" * 64 + ".jpg"
+    path = os.path.join("static", "images", digest_name)
+    with open(path, "wb") as f:
+        f.write(b"image")
+    try:
+        # 実行
+        response = client.get(f"/static/images/{digest_name}")
+
+        # 検証
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == images.IMMUTABLE_CACHE_CONTROL
+    finally:
+        os.remove(path)
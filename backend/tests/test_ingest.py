@@ -0,0 +1,108 @@
+import asyncio
+from unittest.mock import MagicMock
+from crud import inventory as crud_inventory
+from ingest import IngestLog, RESULT_UNKNOWN
+
+def _log(path, applied, **kwargs):
+    def apply_events(log_id, events):
+        applied.append((log_id, list(events)))
+        return {seq: crud_inventory.EVENT_APPLIED for seq, _, _ in events}
+    return IngestLog(apply_events, path=str(path), flush_seconds=0.01, **kwargs)
+
+def test_ingest_log_applies_events_in_batches_and_wakes_waiters(tmp_path):
+    applied = []
+
+    async def scenario():
+        # 準備
+        log = _log(tmp_path / "events.log", applied)
+        await log.start()
+
+        # 実行: 複数回の追記を1回のトランザクションにまとめて反映する
+        assert log.append([(101, -1), (102, 5)]) == [1, 2]
+        assert log.append([(101, -1)]) == [3]
+        result = await log.wait(3, timeout=5)
+        await log.stop()
+        return log, result
+
+    log, result = asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    # 検証
+    assert result == crud_inventory.EVENT_APPLIED
+    assert applied == [(log.log_id, [(1, 101, -1), (2, 102, 5), (3, 101, -1)])]
+    assert log.pending_count == 0
+
+def test_ingest_log_replays_unapplied_events_after_restart(tmp_path):
+    path = tmp_path / "events.log"
+    applied = []
+
+    # 準備: 反映する前に停止し、最後の追記は書き込みの途中で途切れている
+    log = _log(path, applied)
+    log.open()
+    log.append([(101, -1), (102, 5)])
+    asyncio.run(log.stop())
+    with open(path, "ab") as f:
+        f.write(b'{"seq": 3, "events": [[10')
+
+    # 実行
+    restarted = _log(path, applied)
+    restarted.open()
+
+    # 検証: 同じログIDで未反映のイベントを読み直し、途切れた行は捨てて続きの連番を振る
+    assert restarted.log_id == log.log_id
+    assert restarted.pending_count == 2
+    assert restarted.result(1) is None
+    assert restarted.append([(103, 1)]) == [3]
+    asyncio.run(restarted.flush())
+    assert applied == [(log.log_id, [(1, 101, -1), (2, 102, 5), (3, 103, 1)])]
+    asyncio.run(restarted.stop())
+
+def test_ingest_log_compaction_keeps_only_unapplied_events(tmp_path):
+    path = tmp_path / "events.log"
+    applied = []
+
+    async def scenario():
+        # 準備: 1回に1件ずつ反映し、反映のたびに書き直す
+        log = _log(path, applied, max_batch=1, compact_bytes=0)
+        log.open()
+        log.append([(101, -1), (102, 5)])
+
+        # 実行
+        await log.flush()
+        await log.stop()
+        return log
+
+    log = asyncio.run(scenario())
+    restarted = _log(path, applied)
+    restarted.open()
+
+    # 検証: 反映済みのイベントはログから消え、連番は続きから振られる
+    assert restarted.pending_count == 1
+    assert restarted.result(1) == RESULT_UNKNOWN
+    assert restarted.append([(103, 1)]) == [3]
+    asyncio.run(restarted.stop())
+
+def test_apply_adjustment_events_skips_applied_and_rejects_negative():
+    # 準備: 連番1までは反映済み、在庫101は数量1
+    mock_db = MagicMock()
+    mock_cursor = mock_db.cursor.return_value
+    mock_cursor.lastrowid = 10
+    mock_cursor.fetchone.return_value = (1,)
+    mock_cursor.fetchall.return_value = [(101, 1, 7)]
+    events = [(1, 101, -1), (2, 101, -1), (3, 101, -1), (4, 999, 1)]
+
+    # 実行
+    results = crud_inventory.apply_adjustment_events(mock_db, "log", events)
+
+    # 検証: 同じ在庫のイベントは順に適用し、負になるイベントだけを拒否する
+    assert results == {
+        1: crud_inventory.EVENT_ALREADY_APPLIED,
+        2: crud_inventory.EVENT_APPLIED,
+        3: crud_inventory.EVENT_INSUFFICIENT,
+        4: crud_inventory.EVENT_NOT_FOUND,
+    }
+    update, stamp = [c for c in mock_cursor.execute.call_args_list if c.args[0].startswith("UPDATE Inventory SET")]
+    assert update.args[1] == (101, 0, 101)
+    assert stamp.args[1] == (10, 101)
+    position = next(c for c in mock_cursor.execute.call_args_list if c.args[0].startswith("INSERT INTO Ingest_Log_Positions"))
+    assert position.args[1] == ("log", 4)
+    mock_db.commit.assert_called_once()
@@ -1,19 +1,74 @@
+def _executed(mock_cursor, prefix):
+    """指定した文で始まるSQLの呼び出しだけを取り出します。"""
+    return [call for call in mock_cursor.execute.call_args_list if call.args[0].startswith(prefix)]
+
 def test_update_inventory_success(client, mock_db_connection):
-    # 準備
+    # 準備: 採番した行バージョン (モックでは更新前の数量と同じlastrowid)
     mock_cursor = mock_db_connection.cursor.return_value
     mock_cursor.rowcount = 1
+    mock_cursor.lastrowid = 20
 
     # 実行
     response = client.put("/inventory/1", json={"quantity": 50})
 
-    # 検証
+    # 検証: 行をロックして読まずに、1つのUPDATE文で更新する
     assert response.status_code == 200
-    assert response.json() == {"message": "Inventory updated successfully", "inventory_id": 1, "new_quantity": 50}
+    assert response.json() == {
+        "message": "Inventory updated successfully", "inventory_id": 1, "new_quantity": 50, "version": 20,
+    }
+    assert not _executed(mock_cursor, "SELECT")
+
+def test_update_inventory_with_version_is_conditional(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.rowcount = 1
+    mock_cursor.lastrowid = 20
+
+    # 実行
+    client.put("/inventory/1", json={"quantity": 50, "version": 7})
+
+    # 検証: 取得時のバージョンと一致する場合のみ更新し、採番したバージョンはコミット直前に付ける
+    [(args, kwargs), (stamp_args, _)] = _executed(mock_cursor, "UPDATE Inventory")
+    assert args[0].endswith("WHERE id = %s AND row_version = %s")
+    assert args[1] == (50, 1, 7)
+    assert stamp_args == ("UPDATE Inventory SET row_version = %s WHERE id IN (%s)", (20, 1))
+
+def test_update_inventory_version_conflict(client, mock_db_connection):
+    # 準備: バージョンが異なり更新されず、在庫は存在する
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.rowcount = 0
+    mock_cursor.fetchone.return_value = (12, 9)
+
+    # 実行
+    response = client.put("/inventory/1", json={"quantity": 50, "version": 7})
+
+    # 検証: 現在の数量とバージョンを返す
+    assert response.status_code == 409
+    assert response.json() == {
+        "detail": {"message": "Version conflict", "conflicts": [{"id": 1, "quantity": 12, "version": 9}]},
+    }
+
+def test_update_inventory_same_quantity_still_stamps_version(client, mock_db_connection):
+    # 準備: 同じ数量のため変更行数は0で、在庫は存在しバージョンも一致する
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.rowcount = 0
+    mock_cursor.fetchone.return_value = (50, 7)
+    mock_cursor.lastrowid = 20
+
+    # 実行
+    response = client.put("/inventory/1", json={"quantity": 50, "version": 7})
+
+    # 検証: 競合ではなく更新として扱い、新しいバージョンを返す
+    assert response.status_code == 200
+    assert response.json()["version"] == 20
+    [(args, kwargs)] = _executed(mock_cursor, "SELECT quantity, row_version")
+    assert args[0].endswith("FOR UPDATE")
 
 def test_update_inventory_not_found(client, mock_db_connection):
     # 準備
     mock_cursor = mock_db_connection.cursor.return_value
     mock_cursor.rowcount = 0
+    mock_cursor.fetchone.return_value = None
 
     # 実行
     response = client.put("/inventory/999", json={"quantity": 50})
@@ -30,8 +85,11 @@ def test_update_inventory_negative_quantity(client):
     assert response.status_code == 400
     assert response.json() == {"detail": "Quantity cannot be negative"}
 
-def test_update_batch_inventory_success(client):
+def test_update_batch_inventory_success(client, mock_db_connection):
     # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [(1, 0, 3, 5), (2, 5, 4, 6)]
+    mock_cursor.lastrowid = 42
     items = [{"id": 1, "quantity": 10}, {"id": 2, "quantity": 20}]
 
     # 実行
@@ -39,4 +97,279 @@ def test_update_batch_inventory_success(client):
 
     # 検証
     assert response.status_code == 200
-    assert response.json() == {"message": "Inventory updated successfully"}
+    assert response.json() == {
+        "message": "Inventory updated successfully", "updated": 2, "version": 42, "not_found": [], "conflicts": [],
+    }
+    # 全件を1回のCASE式UPDATEで更新し、コミット直前に採番した行バージョンを付ける
+    [(args, kwargs), (stamp_args, _)] = _executed(mock_cursor, "UPDATE Inventory")
+    assert args[0] == (
+        "UPDATE Inventory SET quantity = CASE id WHEN %s THEN %s WHEN %s THEN %s END WHERE id IN (%s, %s)"
+    )
+    assert args[1] == (1, 10, 2, 20, 1, 2)
+    assert stamp_args == ("UPDATE Inventory SET row_version = %s WHERE id IN (%s, %s)", (42, 1, 2))
+    mock_db_connection.commit.assert_called_once()
+
+def test_update_batch_inventory_reports_not_found(client, mock_db_connection):
+    # 準備: ID 999 は存在しない
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [(1, 0, 3, 5)]
+    mock_cursor.lastrowid = 42
+    items = [{"id": 1, "quantity": 10}, {"id": 999, "quantity": 20}]
+
+    # 実行
+    response = client.put("/inventory/batch", json=items)
+
+    # 検証: 存在するIDのみ更新し、存在しないIDを報告する
+    assert response.status_code == 200
+    assert response.json() == {
+        "message": "Inventory updated successfully", "updated": 1, "version": 42, "not_found": [999], "conflicts": [],
+    }
+    [(args, kwargs), (stamp_args, _)] = _executed(mock_cursor, "UPDATE Inventory")
+    assert args[1] == (1, 10, 1)
+    assert stamp_args[1] == (42, 1)
+
+def test_update_batch_inventory_negative_quantity_is_rejected_before_query(client, mock_db_connection):
+    # 準備
+    items = [{"id": 1, "quantity": 10}, {"id": 2, "quantity": -1}]
+
+    # 実行
+    response = client.put("/inventory/batch", json=items)
+
+    # 検証: 数量の検証はDBへの問い合わせより前に行われる
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Quantity for item 2 cannot be negative"}
+    mock_db_connection.cursor.return_value.execute.assert_not_called()
+
+def test_adjust_inventory_success(client, mock_db_connection):
+    # 準備: 行バージョンと加算後の数量がLAST_INSERT_IDとして返される
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.rowcount = 1
+    mock_cursor.lastrowid = 7
+
+    # 実行
+    response = client.post("/inventory/1/adjust", json={"delta": -3})
+
+    # 検証: 加算と負数チェックを1つのUPDATE文で行う
+    assert response.status_code == 200
+    assert response.json() == {"message": "Inventory adjusted successfully", "inventory_id": 1, "new_quantity": 7}
+    [(args, kwargs), _] = _executed(mock_cursor, "UPDATE Inventory")
+    assert args == (
+        "UPDATE Inventory SET quantity = LAST_INSERT_ID(quantity + %s) WHERE id = %s AND quantity + %s >= 0",
+        (-3, 1, -3),
+    )
+    assert not _executed(mock_cursor, "SELECT")
+
+def test_adjust_inventory_insufficient_quantity(client, mock_db_connection):
+    # 準備: 更新されず、在庫は存在する
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.rowcount = 0
+    mock_cursor.fetchone.return_value = (2,)
+
+    # 実行
+    response = client.post("/inventory/1/adjust", json={"delta": -3})
+
+    # 検証
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Insufficient quantity for item 1"}
+
+def test_adjust_inventory_not_found(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.rowcount = 0
+    mock_cursor.fetchone.return_value = None
+
+    # 実行
+    response = client.post("/inventory/999/adjust", json={"delta": 5})
+
+    # 検証
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Inventory item not found"}
+
+def test_adjust_batch_inventory_merges_deltas(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [(1, 10, 3), (2, 5, 3)]
+    mock_cursor.lastrowid = 42
+    items = [{"id": 1, "delta": -2}, {"id": 2, "delta": 3}, {"id": 1, "delta": -1}, {"id": 999, "delta": 1}]
+
+    # 実行
+    response = client.post("/inventory/batch/adjust", json=items)
+
+    # 検証: 同じIDの加算はまとめられ、1回のUPDATEで反映される
+    assert response.status_code == 200
+    assert response.json() == {
+        "message": "Inventory adjusted successfully",
+        "items": [{"id": 1, "quantity": 7}, {"id": 2, "quantity": 8}],
+        "not_found": [999],
+    }
+    [(args, kwargs), (stamp_args, _)] = _executed(mock_cursor, "UPDATE Inventory")
+    assert args[0] == (
+        "UPDATE Inventory SET quantity = quantity + CASE id WHEN %s THEN %s WHEN %s THEN %s END WHERE id IN (%s, %s)"
+    )
+    assert args[1] == (1, -3, 2, 3, 1, 2)
+    assert stamp_args[1] == (42, 1, 2)
+
+def test_adjust_batch_inventory_insufficient_rolls_back(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [(1, 1, 3)]
+
+    # 実行
+    response = client.post("/inventory/batch/adjust", json=[{"id": 1, "delta": -2}])
+
+    # 検証
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Insufficient quantity for items [1]"}
+    mock_db_connection.rollback.assert_called_once()
+    mock_db_connection.commit.assert_not_called()
+
+def test_update_inventory_records_change(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.rowcount = 1
+    mock_cursor.fetchone.return_value = (10, 3)
+
+    # 実行
+    client.put("/inventory/101", json={"quantity": 5})
+
+    # 検証: 更新後の数量を同じトランザクションで変更履歴に追加する
+    [(args, kwargs)] = _executed(mock_cursor, "INSERT INTO Inventory_Changes")
+    assert "SELECT id, parts_id, quantity, %s FROM Inventory WHERE id IN (%s)" in args[0]
+    assert args[1] == ("update", 101)
+    mock_db_connection.commit.assert_called_once()
+
+def test_get_inventory_changes(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [
+        {"id": 8, "inventoryId": 101, "partsId": 1, "quantity": 5, "op": "update"},
+    ]
+
+    # 実行
+    response = client.get("/inventory/changes?after_id=7")
+
+    # 検証
+    assert response.status_code == 200
+    assert response.json() == {
+        "changes": [{"id": 8, "inventoryId": 101, "partsId": 1, "quantity": 5, "op": "update"}],
+        "last_id": 8,
+    }
+    assert mock_cursor.execute.call_args.args[1] == (7, 1000)
+
+def test_sse_events_format_changes_without_moving_event_id_backwards():
+    import asyncio
+    from routers import inventory
+
+    async def subscription():
+        yield ("inventory", 3, {"id": 3, "inventoryId": 101, "partsId": 1, "quantity": 2, "op": "update"})
+        # 遅れてコミットされた変更 (IDが小さい)
+        yield ("inventory", 2, {"id": 2, "inventoryId": 102, "partsId": 2, "quantity": None, "op": "delete"})
+        yield ("heartbeat", None, None)
+
+    async def collect():
+        return [chunk async for chunk in inventory._sse_events(("ready", 1, None), subscription())]
+
+    # 実行
+    chunks = asyncio.run(collect())
+
+    # 検証
+    assert chunks == [
+        b"retry: 3000\n\n",
+        b"id: 1\nevent: ready\ndata: {}\n\n",
+        b'id: 3\nevent: inventory\ndata: {"inventoryId":101,"partsId":1,"quantity":2,"op":"update"}\n\n',
+        b'event: inventory\ndata: {"inventoryId":102,"partsId":2,"quantity":null,"op":"delete"}\n\n',
+        b": keep-alive\n\n",
+    ]
+
+def test_update_batch_inventory_applies_summary_deltas(client, mock_db_connection):
+    # 準備: ID 1 (カテゴリー3) は0から10へ、ID 2 (カテゴリー3) は5から0へ、ID 3 (カテゴリー1) は7から8へ
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [(1, 0, 3, 5), (2, 5, 3, 5), (3, 7, 1, 5)]
+    items = [{"id": 1, "quantity": 10}, {"id": 2, "quantity": 0}, {"id": 3, "quantity": 8}]
+
+    # 実行
+    response = client.put("/inventory/batch", json=items)
+
+    # 検証: カテゴリーごとに増減をまとめ、カテゴリーIDの順に1回の文で反映する
+    assert response.status_code == 200
+    [(args, kwargs)] = _executed(mock_cursor, "INSERT INTO Category_Stock_Summary")
+    assert "ON DUPLICATE KEY UPDATE" in args[0]
+    assert args[1] == (1, 0, 1, 0, 3, 0, 5, 0)
+
+def test_update_batch_inventory_evaluates_low_stock_for_updated_rows(client, mock_db_connection):
+    # 準備: ID 999 は存在しない
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [(1, 0, 3, 5), (2, 5, 3, 5)]
+    items = [{"id": 1, "quantity": 10}, {"id": 2, "quantity": 0}, {"id": 999, "quantity": 1}]
+
+    # 実行
+    client.put("/inventory/batch", json=items)
+
+    # 検証: 更新した在庫だけを発注点と比較する
+    [(flag_args, _)] = _executed(mock_cursor, "\n    INSERT INTO Low_Stock")
+    [(clear_args, _)] = _executed(mock_cursor, "\n    DELETE l FROM Low_Stock")
+    assert "i.id IN (%s, %s)" in flag_args[0]
+    assert flag_args[1] == clear_args[1] == (1, 2)
+
+def test_get_low_stock_returns_next_after_id(client, mock_db_connection):
+    # 準備: limit+1件を返し、次ページが存在する状態にする
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [
+        {"inventoryId": 5, "id": 1, "title": "Part A", "category": "電子部品", "quantity": 1, "reorderPoint": 10,
+         "flaggedAt": "2024-01-01T00:00:00"},
+        {"inventoryId": 9, "id": 4, "title": "Part D", "category": "電子部品", "quantity": 0, "reorderPoint": 5,
+         "flaggedAt": "2024-01-02T00:00:00"},
+    ]
+
+    # 実行
+    response = client.get("/inventory/low-stock?after_id=3&limit=1&category_id=1")
+
+    # 検証
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["inventoryId"] for item in body["items"]] == [5]
+    assert body["next_after_id"] == 5
+    args, kwargs = mock_cursor.execute.call_args
+    assert "WHERE l.inventory_id > %s AND p.c_id = %s ORDER BY l.inventory_id LIMIT %s" in args[0]
+    assert args[1] == (3, 1, 2)
+
+def test_update_reorder_point_not_found(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchone.return_value = (0,)
+
+    # 実行
+    response = client.put("/inventory/999/reorder-point", json={"reorder_point": 10})
+
+    # 検証: 存在しない在庫は評価しない
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Inventory item not found"}
+    assert not _executed(mock_cursor, "\n    INSERT INTO Low_Stock")
+
+def test_update_batch_inventory_reports_version_conflicts(client, mock_db_connection):
+    # 準備: ID 2 は取得後に他の更新でバージョンが6から8に進んでいる
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [(1, 0, 3, 5), (2, 4, 3, 8)]
+    mock_cursor.lastrowid = 42
+    items = [{"id": 1, "quantity": 10, "version": 5}, {"id": 2, "quantity": 20, "version": 6}]
+
+    # 実行
+    response = client.put("/inventory/batch", json=items)
+
+    # 検証: バージョンが一致した項目のみ更新し、競合した項目は現在の値とともに返す
+    assert response.status_code == 200
+    assert response.json() == {
+        "message": "Inventory updated successfully", "updated": 1, "version": 42, "not_found": [],
+        "conflicts": [{"id": 2, "quantity": 4, "version": 8}],
+    }
+    [(args, kwargs), (stamp_args, _)] = _executed(mock_cursor, "UPDATE Inventory")
+    assert args[1] == (1, 10, 1)
+    assert stamp_args[1] == (42, 1)
+
+def test_ingest_inventory_events_when_disabled(client):
+    # 実行: INGEST_ENABLED が設定されていない場合は取り込みログを開かない
+    response = client.post("/inventory/ingest", json=[{"id": 101, "delta": -1}])
+
+    # 検証
+    assert response.status_code == 503
+    assert client.get("/inventory/ingest/1").status_code == 503
@@ -0,0 +1,49 @@
+import logging
+from unittest.mock import MagicMock
+import metrics
+
+def test_timed_cursor_records_query_time_rows_and_slow_queries(monkeypatch, caplog):
+    # 準備: すべてのクエリをスロークエリとして扱う
+    monkeypatch.setattr(metrics, "SLOW_QUERY_SECONDS", 0.0)
+    raw_conn = MagicMock()
+    raw_cursor = raw_conn.cursor.return_value
+    raw_cursor.fetchall.return_value = [(1,), (2,)]
+    db = metrics.instrument(raw_conn)
+
+    # 実行
+    with caplog.at_level(logging.WARNING, logger="mast.slow_query"):
+        cursor = db.cursor(dictionary=True)
+        cursor.execute("SELECT id\n    FROM Parts WHERE id > %s", (0,))
+        rows = cursor.fetchall()
+    db.commit()
+
+    # 検証: 元のカーソルと接続に委譲しつつ、時間・行数・SQL文を記録する
+    assert rows == [(1,), (2,)]
+    raw_conn.cursor.assert_called_once_with(dictionary=True)
+    raw_cursor.execute.assert_called_once_with("SELECT id\n    FROM Parts WHERE id > %s", (0,))
+    raw_conn.commit.assert_called_once()
+    assert "Slow query" in caplog.text and "SELECT id FROM Parts WHERE id > %s" in caplog.text
+    rendered = metrics.render()
+    assert 'db_query_duration_seconds_count{operation="SELECT"}' in rendered
+    assert 'db_slow_queries_total{operation="SELECT"}' in rendered
+
+def test_instrument_returns_connection_unchanged_when_disabled(monkeypatch):
+    # 準備
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    raw_conn = MagicMock()
+
+    # 実行・検証
+    assert metrics.instrument(raw_conn) is raw_conn
+
+def test_metrics_endpoint_reports_route_latency(client):
+    # 実行
+    response = client.get("/")
+    metrics_response = client.get("/metrics")
+
+    # 検証: ルートのパターンをラベルにし、Server-Timingで内訳を返す
+    assert "db;dur=" in response.headers["server-timing"]
+    assert metrics_response.status_code == 200
+    assert metrics_response.headers["content-type"].startswith("text/plain")
+    body = metrics_response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in body
+    assert "db_pool_in_use " in body
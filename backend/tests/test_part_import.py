@@ -0,0 +1,114 @@
+import io
+import pytest
+from unittest.mock import Mock
+import mysql.connector
+import part_import
+from crud import parts as crud_parts
+
+def test_bulk_create_inserts_rows_with_multi_row_statements():
+    # 準備
+    mock_db = Mock()
+    mock_cursor = mock_db.cursor.return_value
+    mock_cursor.lastrowid = 100
+    # auto_increment_increment = 2 の場合など、採番されたIDは連続しない
+    mock_cursor.fetchall.return_value = [(100, 1, 10001, "LED 5mm 赤色"), (102, 2, None, "ナット M6")]
+
+    # 実行
+    part_ids = crud_parts.bulk_create(mock_db, [(1, 10001, "LED 5mm 赤色", 5), (2, None, "ナット M6", 0)])
+
+    # 検証: Parts, Inventoryへの挿入はそれぞれ1回で、読み直したIDで在庫行を作る
+    assert part_ids == [100, 102]
+    calls = mock_cursor.execute.call_args_list
+    assert calls[0].args == (
+        "INSERT INTO Parts (c_id, p_num, p_name) VALUES (%s, %s, %s), (%s, %s, %s)",
+        (1, 10001, "LED 5mm 赤色", 2, None, "ナット M6"),
+    )
+    assert calls[1].args == (
+        "SELECT id, c_id, p_num, p_name FROM Parts WHERE id >= %s AND row_version = 0 ORDER BY id LIMIT %s",
+        (100, 2),
+    )
+    assert calls[2].args == (
+        "INSERT INTO Inventory (parts_id, quantity) VALUES (%s, %s), (%s, %s)",
+        (100, 5, 102, 0),
+    )
+    # 行バージョンはコミット直前に採番して付ける (モックではlastrowidの100が行バージョンになる)
+    stamps = [c.args for c in calls if "SET row_version" in c.args[0]]
+    assert stamps == [
+        ("UPDATE Parts SET row_version = %s WHERE id IN (%s, %s)", (100, 100, 102)),
+        ("UPDATE Inventory SET row_version = %s WHERE parts_id IN (%s, %s)", (100, 100, 102)),
+    ]
+    mock_db.commit.assert_called_once()
+
+def test_bulk_create_rolls_back_when_inserted_rows_cannot_be_identified():
+    # 準備: 読み直した行が挿入した行と一致しない
+    mock_db = Mock()
+    mock_cursor = mock_db.cursor.return_value
+    mock_cursor.lastrowid = 100
+    mock_cursor.fetchall.return_value = [(100, 1, 10001, "LED 5mm 赤色")]
+
+    # 実行・検証: 在庫行を誤った部品に付けずにロールバックする
+    with pytest.raises(mysql.connector.Error):
+        crud_parts.bulk_create(mock_db, [(1, 10001, "LED 5mm 赤色", 5), (2, None, "ナット M6", 0)])
+    assert not [c for c in mock_cursor.execute.call_args_list if c.args[0].startswith("INSERT INTO Inventory")]
+    mock_db.rollback.assert_called_once()
+    mock_db.commit.assert_not_called()
+
+def test_import_parts_reports_row_errors_and_batches_valid_rows(monkeypatch):
+    # 準備
+    created = []
+    monkeypatch.setattr("crud.category.get_id_map", lambda db: {"電子部品": 1, "工具": 3})
+    # 既存の型番と、前のチャンクで登録された型番を重複として扱う
+    monkeypatch.setattr(
+        "crud.parts.find_existing_p_nums",
+        lambda db, p_nums: {20001} | {row[1] for rows in created for row in rows} & set(p_nums),
+    )
+    monkeypatch.setattr("crud.parts.bulk_create", lambda db, rows: created.append(list(rows)))
+    csv_data = (
+        "﻿title,category,quantity,p_num\n"
+        "LED 5mm 赤色,電子部品,150,10001\n"
+        "ニッパー,工具,6,\n"
+        "不明な部品,存在しない,1,\n"
+        "ボルト M6×20,工具,-1,\n"
+        "ナット M6,工具,3,20001\n"
+        "\"改行を含む\n部品名\",電子部品,2,10001\n"
+        ",電子部品,1,\n"
+    ).encode("utf-8")
+
+    # 実行
+    result = part_import.import_parts(Mock(), io.BytesIO(csv_data), part_import.FORMAT_CSV, chunk_size=2)
+
+    # 検証
+    assert created == [
+        [(1, 10001, "LED 5mm 赤色", 150), (3, None, "ニッパー", 6)],
+    ]
+    assert result.imported == 2
+    errors = {error["line"]: error["error"] for error in result.to_dict()["errors"]}
+    assert errors[4] == "Unknown category: 存在しない"
+    assert errors[5].startswith("quantity:")
+    assert errors[6] == "Duplicate p_num: 20001"
+    assert errors[8] == "Duplicate p_num: 10001"
+    assert errors[9].startswith("title:")
+    assert result.failed == 5
+
+def test_import_parts_falls_back_to_single_rows_on_chunk_error(monkeypatch):
+    # 準備: 2行目だけが一意制約に違反する
+    monkeypatch.setattr("crud.category.get_id_map", lambda db: {"工具": 3})
+    monkeypatch.setattr("crud.parts.find_existing_p_nums", lambda db, p_nums: set())
+    def bulk_create(db, rows):
+        if any(row[2] == "重複" for row in rows):
+            raise mysql.connector.IntegrityError(msg="Duplicate entry")
+        return list(range(len(rows)))
+    monkeypatch.setattr("crud.parts.bulk_create", bulk_create)
+    jsonl = (
+        '{"title": "スパナ 10mm", "category": "工具", "quantity": 8}\n'
+        '{"title": "重複", "category_id": 3}\n'
+        'not json\n'
+    ).encode("utf-8")
+
+    # 実行
+    result = part_import.import_parts(Mock(), io.BytesIO(jsonl), part_import.FORMAT_JSONL)
+
+    # 検証
+    assert result.imported == 1
+    assert [error["line"] for error in result.errors] == [3, 2]
+    assert result.errors[1]["error"] == "Database error: Duplicate entry"
@@ -1,4 +1,6 @@
 import os
+import json
+import hashlib
 
 def test_get_parts_data_success_no_filter(client, mock_db_connection):
     # 準備
@@ -14,8 +16,8 @@ def test_get_parts_data_success_no_filter(client, mock_db_connection):
     # 検証
     assert response.status_code == 200
     expected_data = [
-        {'id': 1, 'inventoryId': 101, 'title': 'Part A', 'category': 'Category A', 'quantity': 10, 'imageUrl': 'http://example.com/a.jpg'},
-        {'id': 2, 'inventoryId': 102, 'title': 'Part B', 'category': 'Category B', 'quantity': 20, 'imageUrl': 'http://example.com/b.jpg'},
+        {'id': 1, 'inventoryId': 101, 'title': 'Part A', 'category': 'Category A', 'quantity': 10, 'imageUrl': 'http://example.com/a.jpg', 'thumbnailUrl': 'http://example.com/a.jpg'},
+        {'id': 2, 'inventoryId': 102, 'title': 'Part B', 'category': 'Category B', 'quantity': 20, 'imageUrl': 'http://example.com/b.jpg', 'thumbnailUrl': 'http://example.com/b.jpg'},
     ]
     assert response.json() == expected_data
     # crud.get_all が引数なしで呼ばれたことを確認
@@ -38,7 +40,7 @@ def test_get_parts_data_success_with_name_filter(client, mock_db_connection):
     # 検証
     assert response.status_code == 200
     expected_data = [
-        {'id': 1, 'inventoryId': 101, 'title': 'Part A', 'category': 'Category A', 'quantity': 10, 'imageUrl': 'http://example.com/a.jpg'},
+        {'id': 1, 'inventoryId': 101, 'title': 'Part A', 'category': 'Category A', 'quantity': 10, 'imageUrl': 'http://example.com/a.jpg', 'thumbnailUrl': 'http://example.com/a.jpg'},
     ]
     assert response.json() == expected_data
     # crud.get_all が LIKE 句付きのクエリで呼ばれたことを確認
@@ -64,7 +66,7 @@ def test_get_parts_data_success_with_category_filter(client, mock_db_connection)
     # 検証
     assert response.status_code == 200
     expected_data = [
-        {'id': 2, 'inventoryId': 102, 'title': 'Part B', 'category': 'Category B', 'quantity': 20, 'imageUrl': 'http://example.com/b.jpg'},
+        {'id': 2, 'inventoryId': 102, 'title': 'Part B', 'category': 'Category B', 'quantity': 20, 'imageUrl': 'http://example.com/b.jpg', 'thumbnailUrl': 'http://example.com/b.jpg'},
     ]
     assert response.json() == expected_data
     # crud.get_all が WHERE 句付きのクエリで呼ばれたことを確認
@@ -78,6 +80,8 @@ def test_delete_part_success(client, mock_db_connection):
     # 準備
     mock_cursor = mock_db_connection.cursor.return_value
     mock_cursor.rowcount = 1
+    # 削除する部品の行 (id, c_id, quantity, imageUrl)
+    mock_cursor.fetchall.return_value = [(1, 10, 5, '')]
 
     # 実行
     response = client.delete("/parts/1")
@@ -90,6 +94,7 @@ def test_delete_part_not_found(client, mock_db_connection):
     # 準備
     mock_cursor = mock_db_connection.cursor.return_value
     mock_cursor.rowcount = 0
+    mock_cursor.fetchall.return_value = []
 
     # 実行
     response = client.delete("/parts/999")
@@ -98,6 +103,33 @@ def test_delete_part_not_found(client, mock_db_connection):
     assert response.status_code == 404
     assert response.json() == {"detail": "Part not found"}
 
+def test_delete_parts_bulk(client, mock_db_connection, monkeypatch):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [(1, 10, 5, '/images/a.png'), (2, 10, 0, '')]
+    scheduled = []
+    monkeypatch.setattr("images.schedule_removal", lambda urls, find_referenced: scheduled.append(list(urls)))
+
+    # 実行
+    response = client.post("/parts/delete", json={"ids": [2, 1, 999]})
+
+    # 検証
+    assert response.status_code == 200
+    assert response.json() == {"message": "Parts deleted successfully", "deleted": 2, "not_found": [999]}
+    # 画像の削除は応答後のワーカーに任せる
+    assert scheduled == [['/images/a.png']]
+    delete_calls = [c for c in mock_cursor.execute.call_args_list if c.args[0].startswith("DELETE FROM Parts")]
+    assert len(delete_calls) == 1
+    assert delete_calls[0].args[1] == (1, 2)
+    mock_db_connection.commit.assert_called_once()
+
+def test_delete_parts_bulk_too_many(client, mock_db_connection):
+    # 実行
+    response = client.post("/parts/delete", json={"ids": list(range(10001))})
+
+    # 検証
+    assert response.status_code == 400
+
 def test_create_part_success(client, mock_db_connection):
     # 準備
     mock_cursor = mock_db_connection.cursor.return_value
@@ -130,7 +162,7 @@ def test_create_part_success(client, mock_db_connection):
     assert response_data["category"] == mock_created_part["category"]
 
 
-def test_upload_part_image_success(client, mock_db_connection, monkeypatch):
+def test_upload_part_image_success(client, mock_db_connection, monkeypatch, tmp_path):
     # 準備
     part_id = 1
     file_content = b"test image content"
@@ -140,40 +172,403 @@ def test_upload_part_image_success(client, mock_db_connection, monkeypatch):
     mock_update_image_url = lambda db, p_id, url: None
     monkeypatch.setattr("crud.parts.update_image_url", mock_update_image_url)
 
-    # ファイル保存関連のos/shutil関数をモック
-    original_join = os.path.join
-    def mock_join(*args):
-        if args[0] == "static" and args[1] == "images":
-            return "/tmp/static/images"
-        return original_join(*args)
-    monkeypatch.setattr("os.path.join", mock_join)
-    monkeypatch.setattr("os.makedirs", lambda *args, **kwargs: None)
-    monkeypatch.setattr("shutil.copyfileobj", lambda src, dest: None)
-    # `open`をモックして、ファイル書き込みをシミュレート
-    from unittest.mock import mock_open
-    monkeypatch.setattr("builtins.open", mock_open())
+    # 画像の保存先を一時ディレクトリに変更し、サムネイルの生成は行わない
+    monkeypatch.setattr("images.IMAGE_DIR", str(tmp_path))
+    monkeypatch.setattr("images.THUMBNAIL_DIR", str(tmp_path / "thumbs"))
+    monkeypatch.setattr("images._existing_thumbnails", set())
+    monkeypatch.setattr("images._executor.submit", lambda *args: None)
 
     # 実行
-    with open(file_name, "wb") as f:
-        f.write(file_content)
-    
-    with open(file_name, "rb") as f:
-        response = client.post(
-            f"/parts/{part_id}/image",
-            files={"file": (file_name, f, "image/jpeg")}
-        )
-
-    # 後片付け
-    # os.remove(file_name) # openをモックしているので、物理ファイルは作成されない
+    response = client.post(
+        f"/parts/{part_id}/image",
+        files={"file": (file_name, file_content, "image/jpeg")}
+    )
 
     # 検証
     assert response.status_code == 200
-    # レスポンスの image_url は固定のファイル名に基づいていることを確認
-    expected_url = f"/static/images/{part_id}.jpg"
     response_data = response.json()
     assert response_data["message"] == "Image uploaded successfully"
     assert response_data["parts_id"] == part_id
-    # APIの実装に合わせて、ファイル名が part_id に基づいていることを確認
+    # ファイル名が画像の内容のハッシュに基づいていることを確認
+    digest = hashlib.sha256(file_content).hexdigest()
     file_extension = os.path.splitext(file_name)[1]
-    expected_file_name = f"{part_id}{file_extension}"
-    assert expected_file_name in response_data["image_url"]
+    expected_file_name = f"{digest}{file_extension}"
+    assert response_data["image_url"] == f"/static/images/{expected_file_name}"
+    # サムネイルが生成されるまでは画像そのもののURLを返す
+    assert response_data["thumbnail_url"] == response_data["image_url"]
+    # 一時ファイルは残らず、保存先のファイルのみが作成される
+    assert [p.name for p in tmp_path.iterdir()] == [expected_file_name]
+    assert (tmp_path / expected_file_name).read_bytes() == file_content
+
+    # 同じ内容の画像を別の部品にアップロードすると、同じファイルを共有する
+    response = client.post("/parts/2/image", files={"file": ("other.JPG", file_content, "image/jpeg")})
+    assert response.json()["image_url"] == f"/static/images/{expected_file_name}"
+    assert [p.name for p in tmp_path.iterdir()] == [expected_file_name]
+
+def test_upload_part_image_too_large(client, mock_db_connection, monkeypatch, tmp_path):
+    # 準備
+    monkeypatch.setattr("images.IMAGE_DIR", str(tmp_path))
+    monkeypatch.setattr("images.MAX_UPLOAD_BYTES", 10)
+    monkeypatch.setattr("images.UPLOAD_CHUNK_SIZE", 4)
+
+    # 実行
+    response = client.post("/parts/1/image", files={"file": ("big.jpg", b"x" * 11, "image/jpeg")})
+
+    # 検証: 上限を超えた時点で中止し、一時ファイルも削除される
+    assert response.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+    mock_db_connection.cursor.return_value.execute.assert_not_called()
+
+def test_upload_part_image_rejected_before_form_parsing(client, mock_db_connection, monkeypatch):
+    # 準備: フォームの解析 (本文の一時ファイルへの書き出し) が行われたら失敗させる
+    monkeypatch.setattr("images.MAX_UPLOAD_BYTES", 10)
+    monkeypatch.setattr("images.MULTIPART_OVERHEAD_BYTES", 100)
+    monkeypatch.setattr("images.receive_upload", lambda upload: (_ for _ in ()).throw(AssertionError("parsed")))
+    files = {"file": ("big.jpg", b"x" * 1000, "image/jpeg")}
+
+    # 実行・検証: Content-Lengthで上限を超えると判断し、本文を読まずに413を返す
+    response = client.post("/parts/1/image", files=files)
+    assert response.status_code == 413
+
+    # 実行・検証: Content-Lengthがないチャンク転送でも、受信したバイト数が上限を超えた時点で中止する
+    def chunks():
+        yield b"--boundary\r\n"
+        for _ in range(100):
+            yield b"x" * 100
+    response = client.post(
+        "/parts/1/image", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=boundary"}
+    )
+    assert response.status_code == 413
+    mock_db_connection.cursor.return_value.execute.assert_not_called()
+
+def test_get_parts_data_with_limit_returns_next_cursor(client, mock_db_connection):
+    # 準備: limit+1件を返し、次ページが存在する状態にする
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [
+        {'id': 1, 'inventoryId': 101, 'title': 'Part A', 'category': 'Category A', 'quantity': 10, 'imageUrl': ''},
+        {'id': 2, 'inventoryId': 102, 'title': 'Part B', 'category': 'Category B', 'quantity': 20, 'imageUrl': ''},
+        {'id': 3, 'inventoryId': 103, 'title': 'Part C', 'category': 'Category C', 'quantity': 30, 'imageUrl': ''},
+    ]
+
+    # 実行
+    response = client.get("/parts?limit=2")
+
+    # 検証
+    assert response.status_code == 200
+    assert [part['id'] for part in response.json()] == [1, 2]
+    args, kwargs = mock_cursor.execute.call_args
+    assert args[0].endswith(" ORDER BY p.id LIMIT %s")
+    assert args[1] == (3,)
+
+    # 返されたカーソルで次ページを要求すると、最終行のIDより後ろから取得する
+    next_cursor = response.headers["X-Next-Cursor"]
+    mock_cursor.fetchall.return_value = []
+    response = client.get(f"/parts?limit=2&cursor={next_cursor}")
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    args, kwargs = mock_cursor.execute.call_args
+    assert "WHERE p.id > %s" in args[0]
+    assert args[1] == (2, 3)
+
+def test_get_parts_data_invalid_cursor(client):
+    # 実行
+    response = client.get("/parts?cursor=not-a-cursor")
+
+    # 検証
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+def test_get_parts_data_stream_ndjson(client, mock_db_connection):
+    # 準備: サーバー側カーソルがチャンク単位で行を返す
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchmany.side_effect = [
+        [{'id': 1, 'inventoryId': 101, 'title': 'LED 5mm 赤色', 'category': '電子部品', 'quantity': 10, 'imageUrl': ''}],
+        [{'id': 2, 'inventoryId': 102, 'title': 'Part B', 'category': 'Category B', 'quantity': 20, 'imageUrl': ''}],
+        [],
+    ]
+
+    # 実行
+    response = client.get("/parts?stream=true")
+
+    # 検証
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['id'] for line in lines] == [1, 2]
+    assert lines[0]['title'] == 'LED 5mm 赤色'
+    mock_db_connection.cursor.assert_called_with(dictionary=True, buffered=False)
+
+def test_get_parts_data_fulltext_search(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [
+        {'id': 1, 'inventoryId': 101, 'title': 'LED 5mm 赤色', 'category': '電子部品', 'quantity': 150, 'imageUrl': ''},
+    ]
+
+    # 実行
+    response = client.get("/parts?name=LED 赤色&search=fulltext")
+
+    # 検証: 全文インデックスで前方一致検索し、関連度順に並べる
+    assert response.status_code == 200
+    args, kwargs = mock_cursor.execute.call_args
+    assert "WHERE MATCH(p.p_name) AGAINST (%s IN BOOLEAN MODE)" in args[0]
+    assert args[0].endswith(" ORDER BY MATCH(p.p_name) AGAINST (%s IN BOOLEAN MODE) DESC, p.id")
+    assert args[1] == ("+LED* +赤色*", "+LED* +赤色*")
+
+def test_get_parts_data_with_facets(client, mock_db_connection):
+    # 準備: 一覧の行と、カテゴリーごとの件数の行
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.side_effect = [
+        [{'id': 1, 'inventoryId': 101, 'title': 'LED 赤', 'category': '電子部品', 'quantity': 5, 'imageUrl': ''}],
+        [{'categoryId': 1, 'category': '電子部品', 'count': 3}, {'categoryId': 2, 'category': '工具', 'count': 1}],
+    ]
+
+    # 実行
+    response = client.get("/parts?name=LED&category_id=1&facets=true")
+
+    # 検証: カテゴリーの絞り込みに関係なく、nameに一致する件数を1回の集計で返す
+    assert response.status_code == 200
+    assert response.json() == {
+        "parts": [{'id': 1, 'inventoryId': 101, 'title': 'LED 赤', 'category': '電子部品', 'quantity': 5, 'imageUrl': '', 'thumbnailUrl': ''}],
+        "facets": [{'categoryId': 1, 'category': '電子部品', 'count': 3}, {'categoryId': 2, 'category': '工具', 'count': 1}],
+    }
+    args, kwargs = mock_cursor.execute.call_args
+    assert "WHERE p.p_name LIKE %s GROUP BY c.id, c.name" in args[0]
+    assert args[1] == ("%LED%",)
+
+def test_get_parts_data_facets_with_stream(client):
+    # 実行
+    response = client.get("/parts?facets=true&stream=true")
+
+    # 検証
+    assert response.status_code == 400
+
+def test_get_parts_data_invalid_search_mode(client):
+    # 実行
+    response = client.get("/parts?name=LED&search=regex")
+
+    # 検証
+    assert response.status_code == 422
+
+def test_get_parts_data_returns_304_when_etag_matches(client, mock_db_connection):
+    # 準備: テーブルのバージョンを固定する
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchone.return_value = (5, 0)
+    mock_cursor.fetchall.return_value = []
+    first = client.get("/parts?category_id=1")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+    mock_cursor.execute.reset_mock()
+
+    # 実行
+    response = client.get("/parts?category_id=1", headers={"If-None-Match": etag})
+
+    # 検証: バージョンの確認のみ行い、一覧のJOINは実行しない
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    [(args, kwargs)] = mock_cursor.execute.call_args_list
+    assert args[0].startswith("SELECT SUM(version),")
+    assert "FROM Table_Versions" in args[0]
+
+    # 検証: 条件やバージョンが変わるとETagも変わる
+    assert client.get("/parts?category_id=2", headers={"If-None-Match": etag}).status_code == 200
+    mock_cursor.fetchone.return_value = (6, 0)
+    assert client.get("/parts?category_id=1", headers={"If-None-Match": etag}).status_code == 200
+
+def test_get_parts_data_returns_latest_change_id(client, mock_db_connection):
+    # 準備: テーブルのバージョンと、在庫の変更の最新のID
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchone.return_value = (5, 42)
+    mock_cursor.fetchall.return_value = []
+    mock_cursor.fetchmany.return_value = []
+
+    # 実行
+    response = client.get("/parts?category_id=3")
+    stream_response = client.get("/parts?category_id=3&stream=true")
+
+    # 検証: バージョンと同じ文で読んだ変更のIDを返す (変更の購読の開始位置に使う)
+    assert response.status_code == 200
+    assert response.headers["X-Change-Id"] == "42"
+    assert stream_response.headers["X-Change-Id"] == "42"
+    version_queries = [
+        call.args[0] for call in mock_cursor.execute.call_args_list if "Table_Versions" in call.args[0]
+    ]
+    assert version_queries
+    assert all("COALESCE(MAX(id), 0) FROM Inventory_Changes" in query for query in version_queries)
+
+    # 検証: 304では変更のIDを返さない (ブラウザが保持している一覧と組になったIDを上書きしないため)
+    not_modified = client.get("/parts?category_id=3", headers={"If-None-Match": response.headers["ETag"]})
+    assert not_modified.status_code == 304
+    assert "X-Change-Id" not in not_modified.headers
+
+def test_import_parts_endpoint(client, monkeypatch):
+    # 準備
+    monkeypatch.setattr("crud.category.get_id_map", lambda db: {"電子部品": 1})
+    monkeypatch.setattr("crud.parts.find_existing_p_nums", lambda db, p_nums: set())
+    monkeypatch.setattr("crud.parts.bulk_create", lambda db, rows: list(range(len(rows))))
+    jsonl = '{"title": "LED 5mm 赤色", "category": "電子部品", "quantity": 150}\n{"title": "x"}\n'
+
+    # 実行: 拡張子から形式を判定する
+    response = client.post("/parts/import", files={"file": ("parts.jsonl", jsonl.encode(), "application/x-ndjson")})
+
+    # 検証
+    assert response.status_code == 200
+    assert response.json() == {
+        "imported": 1,
+        "failed": 1,
+        "errors": [{"line": 2, "error": "category or category_id is required"}],
+        "errors_truncated": False,
+    }
+
+def test_get_parts_data_commits_after_reading_version(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = []
+
+    # 実行
+    client.get("/parts?name=never-cached")
+
+    # 検証: バージョンを読んだスナップショットを閉じてから一覧を読む (古い行を新しい世代でキャッシュしない)
+    names = [
+        "commit" if name == "commit" else args[0]
+        for name, args, kwargs in mock_db_connection.mock_calls
+        if name in ("commit", "cursor().execute")
+    ]
+    version_index = next(i for i, sql in enumerate(names) if "Table_Versions" in sql)
+    list_index = next(i for i, sql in enumerate(names) if "FROM Parts p" in sql)
+    assert "commit" in names[version_index:list_index]
+
+def test_get_parts_data_sparse_fields_skip_category_join(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [
+        {'inventoryId': 101, 'quantity': 10, 'id': 1},
+        {'inventoryId': 102, 'quantity': 20, 'id': 2},
+    ]
+
+    # 実行
+    response = client.get("/parts?fields=inventoryId,quantity&limit=1")
+
+    # 検証: 指定した項目だけを返し、カテゴリー名を使わないためCategoryをJOINしない
+    assert response.status_code == 200
+    assert response.json() == [{'inventoryId': 101, 'quantity': 10}]
+    assert "X-Next-Cursor" in response.headers
+    query = [call.args[0] for call in mock_cursor.execute.call_args_list if "FROM Parts p" in call.args[0]][0]
+    assert "i.id AS inventoryId" in query and "i.quantity AS quantity" in query
+    assert "p.p_name" not in query
+    assert "JOIN Category" not in query
+
+def test_get_parts_data_unknown_field(client):
+    # 実行
+    response = client.get("/parts?fields=quantity,price")
+
+    # 検証
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Unknown fields: price"}
+
+def test_get_parts_data_compresses_large_listing(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.return_value = [
+        {'id': n, 'inventoryId': n, 'title': f'Part {n}', 'category': '電子部品', 'quantity': n, 'imageUrl': ''}
+        for n in range(100)
+    ]
+
+    # 実行
+    response = client.get("/parts", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/parts", headers={"Accept-Encoding": "identity"})
+
+    # 検証: 圧縮した場合もしない場合も内容は同じで、ETagは圧縮方式ごとに異なる
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert "content-encoding" not in identity.headers
+    assert response.json() == identity.json()
+    assert len(response.json()) == 100
+    assert response.headers["etag"] != identity.headers["etag"]
+
+def test_get_part_changes_returns_upserts_and_deletes(client, mock_db_connection):
+    # 準備: 部品1は更新後に在庫も更新、部品2は削除、部品3は作成された
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.side_effect = [
+        [(5, 1, 0), (6, 2, 1), (7, 1, 0), (7, 3, 0)],
+        [
+            {'id': 1, 'inventoryId': 101, 'title': 'Part A', 'category': 'Category A', 'quantity': 4, 'imageUrl': '', 'version': 7},
+        ],
+    ]
+
+    # 実行
+    response = client.get("/parts/changes?limit=3")
+
+    # 検証: limit件で打ち切り、同じ部品の変更は1件にまとめる
+    assert response.status_code == 200
+    body = response.json()
+    assert [part['id'] for part in body['upserts']] == [1]
+    assert body['upserts'][0]['thumbnailUrl'] == ''
+    assert body['deletes'] == [{'id': 2, 'version': 6}]
+    assert body['has_more'] is True
+    # 部品3は4件目のため、現在の行の取得対象にも含まれない
+    args, kwargs = mock_cursor.execute.call_args
+    assert args[1] == (1,)
+
+    # 返された位置から続きを要求すると、最後に読んだ (行バージョン, 部品ID) より後ろから取得する
+    mock_cursor.fetchall.side_effect = [[]]
+    response = client.get(f"/parts/changes?limit=3&since={body['next_since']}")
+    assert response.json() == {"upserts": [], "deletes": [], "next_since": body['next_since'], "has_more": False}
+    args, kwargs = mock_cursor.execute.call_args
+    assert args[1] == (7, 7, 1, 4) * 3 + (4,)
+
+def test_get_part_changes_invalid_since(client):
+    # 実行
+    response = client.get("/parts/changes?since=not-a-token")
+
+    # 検証
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid since token"}
+
+def test_lookup_parts_reports_unknown_keys(client, mock_db_connection):
+    # 準備
+    mock_cursor = mock_db_connection.cursor.return_value
+    mock_cursor.fetchall.side_effect = [
+        [{'id': 1, 'pNum': 4901, 'inventoryId': 101, 'title': 'Part A', 'category': 'Category A', 'quantity': 10, 'imageUrl': '', 'version': 3}],
+        [],
+    ]
+
+    # 実行
+    response = client.post("/parts/lookup", json={"p_nums": [4901, 4902], "ids": [99]})
+
+    # 検証: 見つかった部品は型番をキーに返し、見つからない型番・IDは別に返す
+    assert response.status_code == 200
+    body = response.json()
+    assert body['p_nums']['4901']['inventoryId'] == 101
+    assert body['p_nums']['4901']['thumbnailUrl'] == ''
+    assert body['ids'] == {}
+    assert body['not_found'] == {"p_nums": [4902], "ids": [99]}
+
+def test_lookup_parts_too_many_keys(client):
+    # 実行
+    response = client.post("/parts/lookup", json={"ids": list(range(10001))})
+
+    # 検証
+    assert response.status_code == 400
+
+def test_parts_list_openapi_describes_sparse_rows(client):
+    # 実行
+    schema = client.get("/openapi.json").json()
+
+    # 検証: 一覧は全項目の行とfieldsで絞り込んだ行のいずれかの配列として記述される
+    content = schema["paths"]["/parts"]["get"]["responses"]["200"]["content"]
+    variants = content["application/json"]["schema"]["anyOf"]
+    assert {variant["items"]["$ref"] for variant in variants if "items" in variant} == {
+        "#/components/schemas/Part", "#/components/schemas/PartFields",
+    }
+    assert "application/x-ndjson" in content
+
+def test_parts_list_openapi_describes_facets_response(client):
+    # 実行
+    schema = client.get("/openapi.json").json()
+
+    # 検証: facets=trueの場合のオブジェクトの形式も記述される
+    variants = schema["paths"]["/parts"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]["anyOf"]
+    assert {"$ref": "#/components/schemas/PartsWithFacets"} in variants
+    facets = schema["components"]["schemas"]["PartsWithFacets"]["properties"]["facets"]
+    assert facets["items"]["$ref"] == "#/components/schemas/CategoryFacet"
@@ -7,7 +7,8 @@ CREATE TABLE Units (
 -- 2. Category（カテゴリー）テーブル
 CREATE TABLE Category (
     id BIGINT PRIMARY KEY AUTO_INCREMENT,
-    name VARCHAR(255) NOT NULL COMMENT 'カテゴリー名'
+    name VARCHAR(255) NOT NULL COMMENT 'カテゴリー名',
+    default_reorder_point BIGINT COMMENT '既定の発注点 (在庫ごとの発注点がない場合に使用)'
 ) COMMENT = 'カテゴリーマスタテーブル';
 
 -- 3. Category_Units（中間テーブル：カテゴリ-単位）
@@ -27,6 +28,8 @@ CREATE TABLE Parts (
     p_num BIGINT UNIQUE COMMENT '型番',
     p_name VARCHAR(255) NOT NULL COMMENT '部品名',
     imageUrl VARCHAR(255) COMMENT '画像URL',
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新日時',
+    row_version BIGINT NOT NULL DEFAULT 0 COMMENT '行バージョン (差分同期用)',
     FOREIGN KEY (c_id) REFERENCES Category(id) ON DELETE RESTRICT ON UPDATE CASCADE
 ) COMMENT = '部品マスタテーブル';
 
@@ -35,12 +38,94 @@ CREATE TABLE Inventory (
     id BIGINT PRIMARY KEY AUTO_INCREMENT,
     parts_id BIGINT NOT NULL COMMENT '部品ID',
     quantity BIGINT NOT NULL DEFAULT 0 COMMENT '数量',
+    reorder_point BIGINT COMMENT '発注点 (NULLの場合はカテゴリーの既定値)',
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新日時',
+    row_version BIGINT NOT NULL DEFAULT 0 COMMENT '行バージョン (差分同期用)',
     FOREIGN KEY (parts_id) REFERENCES Parts(id) ON DELETE CASCADE ON UPDATE CASCADE
 ) COMMENT = '在庫管理テーブル';
 
+-- 6. Table_Versions（テーブル変更カウンター）
+-- 書き込み処理ごとに対象テーブルのversionを進め、ETagによる条件付きリクエストに使用する
+-- RowVersion は Parts / Inventory の row_version の採番に使用する
+CREATE TABLE Table_Versions (
+    name VARCHAR(64) PRIMARY KEY COMMENT 'テーブル名',
+    version BIGINT NOT NULL DEFAULT 0 COMMENT '変更カウンター'
+) COMMENT = 'テーブル変更カウンター';
+
+INSERT INTO Table_Versions (name) VALUES ('Parts'), ('Inventory'), ('Category'), ('RowVersion');
+
+-- カテゴリーはアプリの外 (SQLや管理ツール) で変更されるため、トリガーでCategoryのカウンターを進める
+CREATE TRIGGER trg_category_insert_version AFTER INSERT ON Category FOR EACH ROW
+    UPDATE Table_Versions SET version = version + 1 WHERE name = 'Category';
+CREATE TRIGGER trg_category_update_version AFTER UPDATE ON Category FOR EACH ROW
+    UPDATE Table_Versions SET version = version + 1 WHERE name = 'Category';
+CREATE TRIGGER trg_category_delete_version AFTER DELETE ON Category FOR EACH ROW
+    UPDATE Table_Versions SET version = version + 1 WHERE name = 'Category';
+
+-- 7. Inventory_Changes（在庫の変更履歴）
+-- 在庫の作成・更新・削除ごとに1行追加し、idをSSEのイベントIDとして変更を配信する
+CREATE TABLE Inventory_Changes (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT COMMENT 'イベントID',
+    inventory_id BIGINT NOT NULL COMMENT '在庫ID',
+    parts_id BIGINT NOT NULL COMMENT '部品ID',
+    quantity BIGINT COMMENT '変更後の数量 (削除の場合はNULL)',
+    operation ENUM('create', 'update', 'delete') NOT NULL COMMENT '変更の種類',
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '変更日時'
+) COMMENT = '在庫の変更履歴';
+
+-- 8. Parts_Tombstones（削除された部品）
+-- 差分同期 (GET /parts/changes) のクライアントに削除を伝えるため、削除時の行バージョンとともに残す
+CREATE TABLE Parts_Tombstones (
+    parts_id BIGINT PRIMARY KEY COMMENT '削除された部品ID',
+    row_version BIGINT NOT NULL COMMENT '削除時の行バージョン',
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '削除日時'
+) COMMENT = '削除された部品の記録';
+
+-- 9. Category_Stock_Summary（カテゴリー別の在庫集計）
+-- 在庫・部品の書き込み処理で増減を反映し、GET /categories/summary で返す
+-- 集計がずれた場合は python cli.py rebuild-summary で作り直す
+CREATE TABLE Category_Stock_Summary (
+    c_id BIGINT PRIMARY KEY COMMENT 'カテゴリーID',
+    part_count BIGINT NOT NULL DEFAULT 0 COMMENT '部品数',
+    total_quantity BIGINT NOT NULL DEFAULT 0 COMMENT '合計数量',
+    zero_stock_count BIGINT NOT NULL DEFAULT 0 COMMENT '在庫0の部品数',
+    FOREIGN KEY (c_id) REFERENCES Category(id) ON DELETE CASCADE ON UPDATE CASCADE
+) COMMENT = 'カテゴリー別の在庫集計';
+
+-- 10. Low_Stock（在庫不足の在庫）
+-- 在庫の書き込み処理で、更新した在庫だけを発注点と比較して追加・削除する
+-- 主キーの順に読むことで、GET /inventory/low-stock をキーセットページングで返す
+CREATE TABLE Low_Stock (
+    inventory_id BIGINT PRIMARY KEY COMMENT '在庫ID',
+    parts_id BIGINT NOT NULL COMMENT '部品ID',
+    quantity BIGINT NOT NULL COMMENT '数量',
+    reorder_point BIGINT NOT NULL COMMENT '下回った発注点',
+    flagged_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '発注点を下回った日時',
+    FOREIGN KEY (inventory_id) REFERENCES Inventory(id) ON DELETE CASCADE ON UPDATE CASCADE
+) COMMENT = '発注点を下回っている在庫';
+
+-- 11. Ingest_Log_Positions（取り込みログの反映位置）
+-- 在庫の増減イベントの取り込みログ (ingest.py) ごとに、在庫に反映済みの最後の連番を記録する
+-- 在庫の更新と同じトランザクションで進めるため、ログを再生しても同じイベントは二重に反映されない
+CREATE TABLE Ingest_Log_Positions (
+    log_id VARCHAR(64) PRIMARY KEY COMMENT '取り込みログのID',
+    applied_seq BIGINT NOT NULL DEFAULT 0 COMMENT '反映済みの最後の連番',
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新日時'
+) COMMENT = '取り込みログの反映位置';
+
 -- インデックス作成（パフォーマンス向上のため）
 CREATE INDEX idx_category_units_c_id ON Category_Units(c_id);
 CREATE INDEX idx_category_units_u_id ON Category_Units(u_id);
 CREATE INDEX idx_parts_c_id ON Parts(c_id);
 CREATE INDEX idx_parts_p_num ON Parts(p_num);
-CREATE INDEX idx_inventory_parts_id ON Inventory(parts_id);
\ No newline at end of file
+CREATE INDEX idx_inventory_parts_id ON Inventory(parts_id);
+CREATE INDEX idx_parts_updated_at ON Parts(updated_at);
+CREATE INDEX idx_inventory_updated_at ON Inventory(updated_at);
+CREATE INDEX idx_inventory_changes_changed_at ON Inventory_Changes(changed_at);
+CREATE INDEX idx_parts_row_version ON Parts(row_version);
+CREATE INDEX idx_inventory_row_version ON Inventory(row_version, parts_id);
+CREATE INDEX idx_parts_tombstones_row_version ON Parts_Tombstones(row_version);
+CREATE INDEX idx_parts_image_url ON Parts(imageUrl);
+
+-- 部品名の全文検索用インデックス（日本語の部品名に対応するためngramパーサーを使用）
+CREATE FULLTEXT INDEX ft_parts_p_name ON Parts(p_name) WITH PARSER ngram;
@@ -125,6 +125,18 @@ INSERT INTO Inventory (parts_id, quantity) VALUES
 (24, 15),   -- ウエス
 (25, 8);    -- マスキングテープ
 
+-- 6. Category_Stock_Summary（カテゴリー別の在庫集計）を投入した部品・在庫から作成
+INSERT INTO Category_Stock_Summary (c_id, part_count, total_quantity, zero_stock_count)
+SELECT
+    c.id,
+    COUNT(i.id),
+    COALESCE(SUM(i.quantity), 0),
+    COALESCE(SUM(i.quantity = 0), 0)
+FROM Category c
+LEFT JOIN Parts p ON p.c_id = c.id
+LEFT JOIN Inventory i ON i.parts_id = p.id
+GROUP BY c.id;
+
 -- データ確認用クエリ（コメントアウトしてあります）
 /*
 -- 各テーブルのデータ件数確認
@@ -0,0 +1,5 @@
+-- 既存のデータベースに部品名の全文検索用インデックスを追加するマイグレーション
+-- 新規構築時は 01_initdb.sql で作成されるため実行不要です
+-- 実行例: mysql -u <ユーザ> -p <データベース名> < database/migrations/001_parts_name_fulltext.sql
+
+CREATE FULLTEXT INDEX ft_parts_p_name ON Parts(p_name) WITH PARSER ngram;
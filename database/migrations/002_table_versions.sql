@@ -0,0 +1,9 @@
+-- 既存のデータベースにテーブル変更カウンターを追加するマイグレーション
+-- 新規構築時は 01_initdb.sql で作成されるため実行不要です
+
+CREATE TABLE Table_Versions (
+    name VARCHAR(64) PRIMARY KEY COMMENT 'テーブル名',
+    version BIGINT NOT NULL DEFAULT 0 COMMENT '変更カウンター'
+) COMMENT = 'テーブル変更カウンター';
+
+INSERT INTO Table_Versions (name) VALUES ('Parts'), ('Inventory'), ('Category');
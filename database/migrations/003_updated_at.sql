@@ -0,0 +1,11 @@
+-- 既存のデータベースに更新日時の列を追加するマイグレーション
+-- 新規構築時は 01_initdb.sql で作成されるため実行不要です
+-- (エクスポートの modified_since による絞り込みに使用します)
+
+ALTER TABLE Parts
+    ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新日時',
+    ADD INDEX idx_parts_updated_at (updated_at);
+
+ALTER TABLE Inventory
+    ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新日時',
+    ADD INDEX idx_inventory_updated_at (updated_at);
@@ -0,0 +1,13 @@
+-- 既存のデータベースに在庫の変更履歴テーブルを追加するマイグレーション
+-- 新規構築時は 01_initdb.sql で作成されるため実行不要です
+
+CREATE TABLE Inventory_Changes (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT COMMENT 'イベントID',
+    inventory_id BIGINT NOT NULL COMMENT '在庫ID',
+    parts_id BIGINT NOT NULL COMMENT '部品ID',
+    quantity BIGINT COMMENT '変更後の数量 (削除の場合はNULL)',
+    operation ENUM('create', 'update', 'delete') NOT NULL COMMENT '変更の種類',
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '変更日時'
+) COMMENT = '在庫の変更履歴';
+
+CREATE INDEX idx_inventory_changes_changed_at ON Inventory_Changes(changed_at);
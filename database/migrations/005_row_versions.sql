@@ -0,0 +1,18 @@
+-- 既存のデータベースに差分同期 (GET /parts/changes) 用の行バージョンを追加するマイグレーション
+-- 新規構築時は 01_initdb.sql で作成されるため実行不要です
+-- 既存の行は row_version = 0 となり、since を指定しない最初の同期で返されます
+
+ALTER TABLE Parts ADD COLUMN row_version BIGINT NOT NULL DEFAULT 0 COMMENT '行バージョン (差分同期用)';
+ALTER TABLE Inventory ADD COLUMN row_version BIGINT NOT NULL DEFAULT 0 COMMENT '行バージョン (差分同期用)';
+
+INSERT INTO Table_Versions (name) VALUES ('RowVersion');
+
+CREATE TABLE Parts_Tombstones (
+    parts_id BIGINT PRIMARY KEY COMMENT '削除された部品ID',
+    row_version BIGINT NOT NULL COMMENT '削除時の行バージョン',
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '削除日時'
+) COMMENT = '削除された部品の記録';
+
+CREATE INDEX idx_parts_row_version ON Parts(row_version);
+CREATE INDEX idx_inventory_row_version ON Inventory(row_version, parts_id);
+CREATE INDEX idx_parts_tombstones_row_version ON Parts_Tombstones(row_version);
@@ -0,0 +1,22 @@
+-- 既存のデータベースにカテゴリー別の在庫集計テーブルを追加するマイグレーション
+-- 新規構築時は 01_initdb.sql で作成されるため実行不要です
+-- 作成後、既存の部品と在庫から集計を作ります (python cli.py rebuild-summary と同じ内容)
+
+CREATE TABLE Category_Stock_Summary (
+    c_id BIGINT PRIMARY KEY COMMENT 'カテゴリーID',
+    part_count BIGINT NOT NULL DEFAULT 0 COMMENT '部品数',
+    total_quantity BIGINT NOT NULL DEFAULT 0 COMMENT '合計数量',
+    zero_stock_count BIGINT NOT NULL DEFAULT 0 COMMENT '在庫0の部品数',
+    FOREIGN KEY (c_id) REFERENCES Category(id) ON DELETE CASCADE ON UPDATE CASCADE
+) COMMENT = 'カテゴリー別の在庫集計';
+
+INSERT INTO Category_Stock_Summary (c_id, part_count, total_quantity, zero_stock_count)
+SELECT
+    c.id,
+    COUNT(i.id),
+    COALESCE(SUM(i.quantity), 0),
+    COALESCE(SUM(i.quantity = 0), 0)
+FROM Category c
+LEFT JOIN Parts p ON p.c_id = c.id
+LEFT JOIN Inventory i ON i.parts_id = p.id
+GROUP BY c.id;
@@ -0,0 +1,15 @@
+-- 既存のデータベースに発注点と在庫不足の一覧を追加するマイグレーション
+-- 新規構築時は 01_initdb.sql で作成されるため実行不要です
+-- 追加時点では発注点が未設定のため、在庫不足の一覧は空です
+
+ALTER TABLE Category ADD COLUMN default_reorder_point BIGINT COMMENT '既定の発注点 (在庫ごとの発注点がない場合に使用)';
+ALTER TABLE Inventory ADD COLUMN reorder_point BIGINT COMMENT '発注点 (NULLの場合はカテゴリーの既定値)' AFTER quantity;
+
+CREATE TABLE Low_Stock (
+    inventory_id BIGINT PRIMARY KEY COMMENT '在庫ID',
+    parts_id BIGINT NOT NULL COMMENT '部品ID',
+    quantity BIGINT NOT NULL COMMENT '数量',
+    reorder_point BIGINT NOT NULL COMMENT '下回った発注点',
+    flagged_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '発注点を下回った日時',
+    FOREIGN KEY (inventory_id) REFERENCES Inventory(id) ON DELETE CASCADE ON UPDATE CASCADE
+) COMMENT = '発注点を下回っている在庫';
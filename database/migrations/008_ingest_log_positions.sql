@@ -0,0 +1,8 @@
+-- 既存のデータベースに取り込みログの反映位置のテーブルを追加するマイグレーション
+-- 新規構築時は 01_initdb.sql で作成されるため実行不要です
+
+CREATE TABLE Ingest_Log_Positions (
+    log_id VARCHAR(64) PRIMARY KEY COMMENT '取り込みログのID',
+    applied_seq BIGINT NOT NULL DEFAULT 0 COMMENT '反映済みの最後の連番',
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新日時'
+) COMMENT = '取り込みログの反映位置';
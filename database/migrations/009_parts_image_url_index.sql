@@ -0,0 +1,6 @@
+-- 既存のデータベースに画像URLのインデックスを追加するマイグレーション
+-- 新規構築時は 01_initdb.sql で作成されるため実行不要です
+-- 部品の削除後に画像が他の部品から参照されているかを確認する問い合わせ (find_referenced_image_urls) と、
+-- gc-images で参照されている画像URLを読み出す問い合わせに使用します
+
+CREATE INDEX idx_parts_image_url ON Parts(imageUrl);
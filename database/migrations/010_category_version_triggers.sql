@@ -0,0 +1,13 @@
+-- 既存のデータベースに、カテゴリーの変更でTable_VersionsのCategoryのカウンターを進めるトリガーを追加するマイグレーション
+-- 新規構築時は 01_initdb.sql で作成されるため実行不要です
+-- カテゴリーはアプリの外で変更されるため、これがないと GET /categories のETagが変わりません
+
+CREATE TRIGGER trg_category_insert_version AFTER INSERT ON Category FOR EACH ROW
+    UPDATE Table_Versions SET version = version + 1 WHERE name = 'Category';
+CREATE TRIGGER trg_category_update_version AFTER UPDATE ON Category FOR EACH ROW
+    UPDATE Table_Versions SET version = version + 1 WHERE name = 'Category';
+CREATE TRIGGER trg_category_delete_version AFTER DELETE ON Category FOR EACH ROW
+    UPDATE Table_Versions SET version = version + 1 WHERE name = 'Category';
+
+-- トリガーの追加前に行われた変更を反映させるため、一度進めておく
+UPDATE Table_Versions SET version = version + 1 WHERE name = 'Category';
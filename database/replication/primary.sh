@@ -0,0 +1,4 @@
+#!/bin/bash
+# 主DBの初期化時に実行し、アプリケーションのユーザーにレプリカの遅延 (SHOW REPLICA STATUS) を確認する権限を与える
+# (この権限はレプリケーションでレプリカにも反映される)
+docker_process_sql <<<"GRANT REPLICATION CLIENT ON *.* TO '${MYSQL_USER}'@'%';"
@@ -0,0 +1,12 @@
+#!/bin/bash
+# レプリカの初期化時に実行し、主DB (db) からGTIDによるレプリケーションを開始する
+# データベース・ユーザー・テーブルはすべて主DBから複製されるため、レプリカでは作成しない
+docker_process_sql <<-EOSQL
+    CHANGE REPLICATION SOURCE TO
+        SOURCE_HOST='db',
+        SOURCE_USER='root',
+        SOURCE_PASSWORD='${MYSQL_ROOT_PASSWORD}',
+        SOURCE_AUTO_POSITION=1,
+        GET_SOURCE_PUBLIC_KEY=1;
+    START REPLICA;
+EOSQL
@@ -14,3 +14,38 @@ export const batchUpdateInventory = async (payload: UpdateInventoryPayload[]): P
     throw new Error(`Failed to update inventory: ${errorData.detail}`);
   }
 };
+
+// 在庫の変更イベント (quantity は削除の場合 null)
+export interface InventoryChange {
+  inventoryId: number;
+  partsId: number;
+  quantity: number | null;
+  op: 'create' | 'update' | 'delete';
+}
+
+export interface InventoryChangeHandlers {
+  onChange: (change: InventoryChange) => void;
+  // 取りこぼした変更を再送できない場合に呼ばれる (一覧を取得し直す)
+  onReset: () => void;
+}
+
+// 在庫の変更をServer-Sent Eventsで購読し、購読を終了する関数を返す
+// lastEventId (一覧と一緒に受け取った変更のID) を指定すると、それより後の変更から受け取る
+// 再接続時はブラウザがLast-Event-IDを送り、切断中の変更も受け取れる
+export const subscribeInventoryChanges = (
+  handlers: InventoryChangeHandlers,
+  lastEventId?: number | null,
+): (() => void) => {
+  if (typeof EventSource === 'undefined') {
+    return () => {};
+  }
+  const url = lastEventId == null
+    ? '/api/inventory/changes/stream'
+    : `/api/inventory/changes/stream?last_event_id=${lastEventId}`;
+  const source = new EventSource(url);
+  source.addEventListener('inventory', (event) => {
+    handlers.onChange(JSON.parse((event as MessageEvent).data));
+  });
+  source.addEventListener('reset', () => handlers.onReset());
+  return () => source.close();
+};
@@ -5,6 +5,8 @@ export interface Part {
   category: string;
   quantity: number;
   imageUrl: string;
+  // 一覧表示用の縮小画像 (WebP)
+  thumbnailUrl?: string;
 }
 
 export interface NewPart {
@@ -27,16 +29,26 @@ export interface SearchCriteria {
   categoryId?: number;
 }
 
-export const fetchParts = async (criteria?: SearchCriteria): Promise<Part[]> => {
+export interface PartsResult {
+  parts: Part[];
+  // 一覧に反映済みの在庫の変更の最新のID (変更の購読をこのIDの後から始める)
+  changeId: number | null;
+}
+
+export const fetchParts = async (criteria?: SearchCriteria): Promise<PartsResult> => {
   const url = new URL('/api/parts', window.location.origin);
   if (criteria?.name) {
     url.searchParams.append('name', criteria.name);
+    // 部品名の全文インデックスを使った検索を指定する
+    url.searchParams.append('search', 'fulltext');
   }
   if (criteria?.categoryId) {
     url.searchParams.append('category_id', criteria.categoryId.toString());
   }
   const response = await fetch(url.toString());
-  return handleApiResponse(response);
+  const parts: Part[] = await handleApiResponse(response);
+  const changeId = response.headers.get('X-Change-Id');
+  return { parts, changeId: changeId === null ? null : Number(changeId) };
 };
 
 export const uploadPartImage = async (partId: number, file: File): Promise<void> => {
@@ -49,6 +49,26 @@ describe('PartCardList', () => {
     expect(screen.getByPlaceholderText(/部品名/i)).toBeInTheDocument();
   });
 
+  it('サムネイルがある部品はサムネイルを、無い部品は画像を表示する', () => {
+    const parts: Part[] = [
+      { ...mockParts[0], thumbnailUrl: 'thumb1' },
+      mockParts[1],
+    ];
+    const { container } = render(
+      <PartCardList
+        parts={parts}
+        initialParts={mockInitialParts}
+        onQuantityChange={vi.fn()}
+        onDeleteClick={vi.fn()}
+        onImageClick={vi.fn()}
+        onSaveNewPart={vi.fn()}
+      />
+    );
+
+    const sources = Array.from(container.querySelectorAll('img')).map(img => img.getAttribute('src'));
+    expect(sources).toEqual(['thumb1', 'url2']);
+  });
+
   it('部品データが空の場合、「表示するパーツがありません。」というメッセージを表示する', () => {
     render(
       <PartCardList
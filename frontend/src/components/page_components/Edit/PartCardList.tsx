@@ -62,7 +62,7 @@ const PartCardList: React.FC<PartCardListProps> = ({ parts, initialParts, onQuan
               category={part.category}
               quantity={part.quantity}
               initialQuantity={initialPart ? initialPart.quantity : 0}
-              imageUrl={part.imageUrl}
+              imageUrl={part.thumbnailUrl || part.imageUrl}
               onQuantityChange={(newQuantity) => onQuantityChange(part.id, newQuantity)}
               handleDeleteClick={() => onDeleteClick(part)}
               onImageClick={() => onImageClick(part.id)}
@@ -3,8 +3,10 @@ import { describe, it, expect, vi, beforeEach } from 'vitest';
 import { usePartsQuery } from './usePartsQuery';
 import * as partsApi from '@/api/partsApi';
 import { Part } from '@/api/partsApi';
+import * as inventoryApi from '@/api/inventoryApi';
 
 vi.mock('@/api/partsApi');
+vi.mock('@/api/inventoryApi');
 
 const mockParts: Part[] = [
   { id: 1, title: 'Part 1', quantity: 10, imageUrl: 'url1', inventoryId: 101, category: 'Category A' },
@@ -16,7 +18,7 @@ describe('usePartsQuery', () => {
   });
 
   it('正常に部品データを取得する', async () => {
-    vi.mocked(partsApi.fetchParts).mockResolvedValue(mockParts);
+    vi.mocked(partsApi.fetchParts).mockResolvedValue({ parts: mockParts, changeId: null });
     const { result } = renderHook(() => usePartsQuery());
 
     expect(result.current.isLoading).toBe(true);
@@ -43,14 +45,14 @@ describe('usePartsQuery', () => {
   });
 
   it('reload関数が呼ばれた際にデータを再取得する', async () => {
-    vi.mocked(partsApi.fetchParts).mockResolvedValueOnce(mockParts);
+    vi.mocked(partsApi.fetchParts).mockResolvedValueOnce({ parts: mockParts, changeId: null });
     const { result } = renderHook(() => usePartsQuery());
 
     await waitFor(() => expect(result.current.isLoading).toBe(false));
     expect(result.current.parts).toEqual(mockParts);
 
     const newMockParts = [...mockParts, { id: 2, title: 'Part 2', quantity: 5, imageUrl: 'url2', inventoryId: 102, category: 'Category B' }];
-    vi.mocked(partsApi.fetchParts).mockResolvedValueOnce(newMockParts);
+    vi.mocked(partsApi.fetchParts).mockResolvedValueOnce({ parts: newMockParts, changeId: null });
 
     result.current.reload();
 
@@ -63,12 +65,12 @@ describe('usePartsQuery', () => {
 
   describe('search関数', () => {
     it('指定された部品名でAPIを呼び出し、部品リストを更新する', async () => {
-      vi.mocked(partsApi.fetchParts).mockResolvedValueOnce([]); // 初期ロード
+      vi.mocked(partsApi.fetchParts).mockResolvedValueOnce({ parts: [], changeId: null }); // 初期ロード
       const searchResultParts: Part[] = [
         { id: 2, title: 'Search Result Part', quantity: 5, imageUrl: 'url2', inventoryId: 102, category: 'Category B' },
       ];
       // searchのAPIコールをモック
-      vi.mocked(partsApi.fetchParts).mockResolvedValueOnce(searchResultParts);
+      vi.mocked(partsApi.fetchParts).mockResolvedValueOnce({ parts: searchResultParts, changeId: null });
 
       const { result } = renderHook(() => usePartsQuery());
 
@@ -98,11 +100,11 @@ describe('usePartsQuery', () => {
     });
 
     it('指定されたカテゴリIDでAPIを呼び出し、部品リストを更新する', async () => {
-      vi.mocked(partsApi.fetchParts).mockResolvedValueOnce([]); // 初期ロード
+      vi.mocked(partsApi.fetchParts).mockResolvedValueOnce({ parts: [], changeId: null }); // 初期ロード
       const searchResultParts: Part[] = [
         { id: 3, title: 'Category Search Result', quantity: 15, imageUrl: 'url3', inventoryId: 103, category: 'Category C' },
       ];
-      vi.mocked(partsApi.fetchParts).mockResolvedValueOnce(searchResultParts);
+      vi.mocked(partsApi.fetchParts).mockResolvedValueOnce({ parts: searchResultParts, changeId: null });
 
       const { result } = renderHook(() => usePartsQuery());
       await waitFor(() => expect(result.current.isLoading).toBe(false));
@@ -123,7 +125,7 @@ describe('usePartsQuery', () => {
     });
 
     it('検索APIの呼び出しに失敗した場合にエラーを設定する', async () => {
-      vi.mocked(partsApi.fetchParts).mockResolvedValueOnce([]); // 初期ロード
+      vi.mocked(partsApi.fetchParts).mockResolvedValueOnce({ parts: [], changeId: null }); // 初期ロード
       const errorMessage = 'Search failed';
       vi.mocked(partsApi.fetchParts).mockRejectedValueOnce(new Error(errorMessage));
 
@@ -147,4 +149,45 @@ describe('usePartsQuery', () => {
       });
     });
   });
+
+  it('在庫の変更イベントを一覧に反映する', async () => {
+    vi.mocked(partsApi.fetchParts).mockResolvedValue({ parts: mockParts, changeId: 7 });
+    const { result } = renderHook(() => usePartsQuery());
+    await waitFor(() => expect(result.current.isLoading).toBe(false));
+
+    // 一覧と一緒に受け取った変更のIDの後から購読する
+    await waitFor(() => expect(inventoryApi.subscribeInventoryChanges).toHaveBeenCalledTimes(1));
+    const [handlers, lastEventId] = vi.mocked(inventoryApi.subscribeInventoryChanges).mock.calls[0];
+    expect(lastEventId).toBe(7);
+    act(() => {
+      handlers.onChange({ inventoryId: 101, partsId: 1, quantity: 3, op: 'update' });
+    });
+    expect(result.current.parts[0].quantity).toBe(3);
+
+    act(() => {
+      handlers.onChange({ inventoryId: 101, partsId: 1, quantity: null, op: 'delete' });
+    });
+    expect(result.current.parts).toEqual([]);
+    expect(partsApi.fetchParts).toHaveBeenCalledTimes(1);
+  });
+
+  it('一覧を取得し直すと、新しい一覧の変更のIDから購読し直す', async () => {
+    const unsubscribe = vi.fn();
+    vi.mocked(inventoryApi.subscribeInventoryChanges).mockReturnValue(unsubscribe);
+    vi.mocked(partsApi.fetchParts).mockResolvedValueOnce({ parts: mockParts, changeId: 7 });
+    const { result } = renderHook(() => usePartsQuery());
+    await waitFor(() => expect(inventoryApi.subscribeInventoryChanges).toHaveBeenCalledTimes(1));
+
+    // 再送できない変更があった (reset) 場合など、一覧を取得し直す
+    vi.mocked(partsApi.fetchParts).mockResolvedValueOnce({ parts: mockParts, changeId: 12 });
+    const [handlers] = vi.mocked(inventoryApi.subscribeInventoryChanges).mock.calls[0];
+    act(() => {
+      handlers.onReset();
+    });
+
+    await waitFor(() => expect(inventoryApi.subscribeInventoryChanges).toHaveBeenCalledTimes(2));
+    expect(vi.mocked(inventoryApi.subscribeInventoryChanges).mock.calls[1][1]).toBe(12);
+    expect(unsubscribe).toHaveBeenCalledTimes(1);
+    expect(result.current.parts).toEqual(mockParts);
+  });
 });
@@ -1,18 +1,25 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import * as partsApi from '@/api/partsApi';
 import { Part, SearchCriteria } from '@/api/partsApi';
+import { subscribeInventoryChanges } from '@/api/inventoryApi';
 
 export const usePartsQuery = () => {
   const [parts, setParts] = useState<Part[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  // 変更イベントから再取得する際に、現在の検索条件を使うため保持しておく
+  const criteriaRef = useRef<SearchCriteria | undefined>(undefined);
+  // 変更の購読を始める位置 (一覧を取得するたびに新しいオブジェクトにして、その一覧の時点から購読し直す)
+  const [feedStart, setFeedStart] = useState<{ changeId: number | null } | null>(null);
 
   const loadParts = useCallback(async (criteria?: SearchCriteria) => {
+    criteriaRef.current = criteria;
     setIsLoading(true);
     setError(null);
     try {
-      const data = await partsApi.fetchParts(criteria);
+      const { parts: data, changeId } = await partsApi.fetchParts(criteria);
       setParts(data);
+      setFeedStart({ changeId });
     } catch (err) {
       setError(err instanceof Error ? err.message : 'An unknown error occurred while fetching parts.');
     } finally {
@@ -24,6 +31,29 @@ export const usePartsQuery = () => {
     loadParts();
   }, [loadParts]);
 
+  // 他の利用者による在庫の変更を受け取り、一覧を再取得せずに反映する
+  // 一覧の取得と購読の開始の間の変更を取りこぼさないよう、一覧と一緒に受け取った変更のIDの後から購読する
+  useEffect(() => {
+    if (feedStart === null) {
+      return;
+    }
+    return subscribeInventoryChanges({
+      onChange: (change) => {
+        if (change.op === 'create') {
+          // 新しい部品は名前などが必要なため、一覧を取得し直す
+          loadParts(criteriaRef.current);
+          return;
+        }
+        setParts(prev => change.op === 'delete'
+          ? prev.filter(part => part.inventoryId !== change.inventoryId)
+          : prev.map(part => part.inventoryId === change.inventoryId && change.quantity !== null
+            ? { ...part, quantity: change.quantity }
+            : part));
+      },
+      onReset: () => loadParts(criteriaRef.current),
+    }, feedStart.changeId);
+  }, [loadParts, feedStart]);
+
   return {
     parts,
     isLoading,
@@ -53,6 +53,7 @@ describe('usePartsState with Change Log', () => {
 
     await waitFor(() => {
       expect(result.current.parts.find(p => p.id === 1)?.imageUrl).toBe('new-url');
+      expect(result.current.parts.find(p => p.id === 1)?.thumbnailUrl).toBe('new-url');
     });
     expect(result.current.pendingImageFiles.get(1)).toBe(mockFile);
     expect(result.current.hasChanges).toBe(true);
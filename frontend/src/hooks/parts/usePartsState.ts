@@ -2,7 +2,7 @@ import { useState, useEffect, useMemo, useCallback } from 'react';
 import { Part } from '@/api/partsApi';
 
 // 変更差分のみを保持するための型
-type PartChanges = Partial<Pick<Part, 'quantity' | 'imageUrl'>>;
+type PartChanges = Partial<Pick<Part, 'quantity' | 'imageUrl' | 'thumbnailUrl'>>;
 
 export const usePartsState = (initialParts: Part[]) => {
   const [parts, setParts] = useState<Part[]>([]);
@@ -45,7 +45,8 @@ export const usePartsState = (initialParts: Part[]) => {
     setChangesMap(prev => {
       const newChanges = new Map(prev);
       const currentChanges = newChanges.get(partId) || {};
-      newChanges.set(partId, { ...currentChanges, imageUrl: newImageUrl });
+      // 一覧はサムネイルを表示するため、選択した画像のプレビューをサムネイルとしても使う
+      newChanges.set(partId, { ...currentChanges, imageUrl: newImageUrl, thumbnailUrl: newImageUrl });
       return newChanges;
     });
     setPendingImageFiles(prev => new Map(prev).set(partId, file));
@@ -63,7 +63,7 @@ const Search: React.FC = () => {
                                 key={index}
                                 title={part.title}
                                 category={part.category}
-                                // imageUrl={part.imageUrl}
+                                imageUrl={part.thumbnailUrl || part.imageUrl}
                                 quantity={part.quantity}
                             />
                         ))}